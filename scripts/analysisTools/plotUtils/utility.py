@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import copy
-import math
 import os
 import os.path
 import re
@@ -10,6 +9,7 @@ import sys
 from array import array
 from functools import partial
 
+import numpy as np
 import ROOT
 
 # sys.path.append(os.getcwd() + "/plotUtils/")
@@ -253,6 +253,130 @@ def addStringToEnd(name, matchToAdd, notAddIfEndswithMatch=False):
 
 #########################################################################
 
+# numpy views of the ROOT histogram buffers, to avoid bin-by-bin loops with GetBinContent/SetBinContent
+# the views include under/overflow and are indexed as [ix, iy, iz] with the same bin numbers used by ROOT
+_thTypeToNumpy = {
+    "C": np.int8,
+    "S": np.int16,
+    "I": np.int32,
+    "L": np.int64,
+    "F": np.float32,
+    "D": np.float64,
+}
+
+
+def _thShape(h):
+    # the ROOT global bin is ix + (nx+2)*(iy + (ny+2)*iz), i.e. C order with the x axis running fastest
+    shape = [h.GetNbinsX() + 2]
+    if h.GetDimension() > 1:
+        shape.append(h.GetNbinsY() + 2)
+    if h.GetDimension() > 2:
+        shape.append(h.GetNbinsZ() + 2)
+    return shape
+
+
+def _bufferView(ptr, n, dtype, shape):
+    ptr.reshape((n,))
+    return np.frombuffer(ptr, dtype=dtype, count=n).reshape(shape[::-1]).T
+
+
+def _hasContentBuffer(h):
+    # the bin contents are a contiguous array of the type given by the last letter of the class name,
+    # not for profiles, whose array holds the sums of the weighted values
+    return (
+        h.ClassName()[-1] in _thTypeToNumpy
+        and not h.InheritsFrom("TProfile")
+        and not h.InheritsFrom("TProfile2D")
+        and not h.InheritsFrom("TProfile3D")
+    )
+
+
+def _binValues(h, getter):
+    # element-wise values of all bins, in the same layout as the views
+    vals = np.array([getter(i) for i in range(h.GetNcells())], dtype=np.float64)
+    return vals.reshape(_thShape(h)[::-1]).T
+
+
+def getTHcontentView(h):
+    # zero-copy view of the bin contents, writing into it modifies the histogram
+    if not _hasContentBuffer(h):
+        raise TypeError(
+            f"getTHcontentView(): no bin content array for class {h.ClassName()}, use getTHcontents or setTHbins"
+        )
+    typeCode = h.ClassName()[-1]
+    return _bufferView(
+        h.GetArray(), h.GetNcells(), _thTypeToNumpy[typeCode], _thShape(h)
+    )
+
+
+def getTHsumw2View(h, create=True):
+    # zero-copy view of the sum of squared weights, the structure is created if not there yet (as SetBinError does)
+    if h.GetSumw2N() == 0:
+        if not create:
+            return None
+        h.Sumw2()
+    return _bufferView(h.GetSumw2().GetArray(), h.GetNcells(), np.float64, _thShape(h))
+
+
+def getTHcontents(h):
+    # copy of the bin contents as float
+    if not _hasContentBuffer(h):
+        return _binValues(h, h.GetBinContent)
+    return getTHcontentView(h).astype(np.float64)
+
+
+def getTHerrors(h):
+    # bin errors as returned by GetBinError
+    if not _hasContentBuffer(h):
+        return _binValues(h, h.GetBinError)
+    sumw2 = getTHsumw2View(h, create=False)
+    if sumw2 is None:
+        return np.sqrt(np.abs(getTHcontents(h)))
+    return np.sqrt(sumw2)
+
+
+def setTHbins(h, index, content, error=None):
+    # set content (and error) of the bins selected by index (e.g. a tuple of slices), like SetBinContent/SetBinError
+    if not _hasContentBuffer(h):
+        globalBins = np.arange(h.GetNcells()).reshape(_thShape(h)[::-1]).T[index]
+        content = np.broadcast_to(content, globalBins.shape)
+        if error is not None:
+            error = np.broadcast_to(error, globalBins.shape)
+        for i, ibin in np.ndenumerate(globalBins):
+            h.SetBinContent(int(ibin), float(content[i]))
+            if error is not None:
+                h.SetBinError(int(ibin), float(error[i]))
+        return
+    if error is not None:
+        sumw2 = getTHsumw2View(h)
+    getTHcontentView(h)[index] = content
+    if error is not None:
+        sumw2[index] = np.square(error)
+    h.ResetStats()
+
+
+def _innerSlices(h):
+    # slices selecting all bins but under/overflow
+    slices = [slice(1, h.GetNbinsX() + 1)]
+    if h.GetDimension() > 1:
+        slices.append(slice(1, h.GetNbinsY() + 1))
+    if h.GetDimension() > 2:
+        slices.append(slice(1, h.GetNbinsZ() + 1))
+    return tuple(slices)
+
+
+def _findBins(axisTarget, axisSource, nbinsSource, clamp=False):
+    # bin numbers of axisTarget containing the centers of the bins of axisSource
+    bins = np.array(
+        [
+            axisTarget.FindFixBin(axisSource.GetBinCenter(i))
+            for i in range(1, nbinsSource + 1)
+        ]
+    )
+    if clamp:
+        bins = np.clip(bins, 1, axisTarget.GetNbins())
+    return bins
+
 
 def getZaxisReasonableExtremesTH2(h, nSigma=3, minZtoUse=None, maxZtoUse=None):
 
@@ -292,10 +416,6 @@ def getMinMaxHisto(
     ybinHigh=None,
 ):  # only for TH2
 
-    # Warning, fix this function, GetBinContent with TH2 is not that simple, there are the underflow and overflow in each row and column
-    # must check whether bin is underflow or overflow
-    # therefore, the global bin is obtained as the number of bins +2, multiplied for each axis
-
     # excludeEmpty = True exclude bins with content 0.0. Useful when a histogram is filled with values in, for example, [1,2] but hassome empty bins
     # excludeMin/Max are used to select a range in which to look for maximum and minimum, useful to reject outliers, crazy or empty bins and so on
     # for histograms with non-negative values, excludeEmpty=True is equal to excludeMin==0.0
@@ -310,60 +430,49 @@ def getMinMaxHisto(
     # for example, one can pass excludeMin=h.GetMean()-2*h.GetStdDev() and excludeMax=h.GetMean()+2*h.GetStdDev() so to
     # select a range of 2 sigma around the mean
 
+    # ybinLow/High (only for TH2) select a range of y bins, in terms of the global bin number as used by ROOT
+
     dim = h.GetDimension()
-    nbins = 0
-    if dim == 1:
-        nbins = h.GetNbinsX() + 2
-    elif dim == 2:
-        nbins = (h.GetNbinsX() + 2) * (h.GetNbinsY() + 2)
-    elif dim == 3:
-        nbins = (h.GetNbinsX() + 2) * (h.GetNbinsY() + 2) * (h.GetNbinsZ() + 2)
-    else:
+    if dim not in [1, 2, 3]:
         logger.error("In getMaxHisto(): dim = %d is not supported. Exit" % dim)
         quit()
 
-    nBinMin = 0
-    nBinMax = nbins + 1
+    shape = _thShape(h)
+    # flatten in the order of the ROOT global bin number
+    values = getTHcontents(h).flatten(order="F")
+    errors = getTHerrors(h).flatten(order="F")
+    nbins = len(values)
+
+    ibins = np.arange(nbins)
+    mask = ibins >= 1
     if dim == 2:
         nXbins = h.GetNbinsX() + 2
-        nBinMin = 0 if ybinLow == None else (nXbins * ybinLow)
-        nBinMax = (nbins + 1) if ybinHigh == None else (1 + nXbins * (ybinHigh + 1))
-
-    maxval = -sys.float_info.max
-    minval = sys.float_info.max
-    firstValidBin = -1
-    for ibin in range(1, nbins + 1):
-        if ibin <= nBinMin or ibin >= nBinMax:
-            continue
-        if excludeUnderflow and h.IsBinUnderflow(ibin):
-            continue
-        if excludeOverflow and h.IsBinOverflow(ibin):
-            continue
-        tmpmax = h.GetBinContent(ibin)
-        tmpmin = h.GetBinContent(ibin)
-        if excludeEmpty and tmpmin == 0.0:
-            continue
-        if excludeMin != None and tmpmin <= excludeMin:
-            continue
-        if excludeMax != None and tmpmax >= excludeMax:
-            continue
-        if firstValidBin < 0:
-            # logger.debug("ibin %d:   tmpmin,tmpmax = %.2f, %.2f" % (ibin,tmpmin,tmpmax))
-            firstValidBin = ibin
-        if sumError:
-            tmpmin -= h.GetBinError(ibin)
-            tmpmax += h.GetBinError(ibin)
-        if firstValidBin > 0 and ibin == firstValidBin:
-            # the first time we pick a non empty bin, we set min and max to the histogram content in that bin
-            minval = tmpmin
-            maxval = tmpmax
-            # logger.debug("#### ibin %d:   min,max = %.2f, %.2f" % (ibin,minval,maxval))
-        else:
-            minval = min(minval, tmpmin)
-            maxval = max(maxval, tmpmax)
-        # logger.debug("ibin %d:   min,max = %.2f, %.2f" % (ibin,minval,maxval))
-
-    return minval, maxval
+        if ybinLow != None:
+            mask &= ibins > nXbins * ybinLow
+        if ybinHigh != None:
+            mask &= ibins < 1 + nXbins * (ybinHigh + 1)
+
+    binIdxs = np.unravel_index(ibins, shape, order="F")
+    if excludeUnderflow:
+        mask &= ~np.any([idx <= 0 for idx in binIdxs], axis=0)
+    if excludeOverflow:
+        mask &= ~np.any([idx >= n - 1 for idx, n in zip(binIdxs, shape)], axis=0)
+    if excludeEmpty:
+        mask &= values != 0.0
+    if excludeMin != None:
+        mask &= values > excludeMin
+    if excludeMax != None:
+        mask &= values < excludeMax
+
+    if not np.any(mask):
+        return sys.float_info.max, -sys.float_info.max
+
+    values = values[mask]
+    if sumError:
+        errors = errors[mask]
+        return float(np.min(values - errors)), float(np.max(values + errors))
+    else:
+        return float(np.min(values)), float(np.max(values))
 
 
 #########################################################################
@@ -412,44 +521,16 @@ def getMinimumTH(h, excludeMin=None):
     # underflow are not considered
 
     dim = h.GetDimension()
-    retmin = sys.float_info.max
-
-    if dim == 1:
-        for ix in range(1, h.GetNbinsX() + 1):
-            if retmin > h.GetBinContent(ix):
-                if excludeMin != None:
-                    if h.GetBinContent(ix) > excludeMin:
-                        retmin = h.GetBinContent(ix)
-                else:
-                    retmin = h.GetBinContent(ix)
-
-    elif dim == 2:
-        for ix in range(1, h.GetNbinsX() + 1):
-            for iy in range(1, h.GetNbinsY() + 1):
-                if retmin > h.GetBinContent(ix, iy):
-                    if excludeMin != None:
-                        if h.GetBinContent(ix, iy) > excludeMin:
-                            retmin = h.GetBinContent(ix, iy)
-                    else:
-                        retmin = h.GetBinContent(ix, iy)
-
-    elif dim == 3:
-        for ix in range(1, h.GetNbinsX() + 1):
-            for iy in range(1, h.GetNbinsY() + 1):
-                for iz in range(1, h.GetNbinsZ() + 1):
-                    if retmin > h.GetBinContent(ix, iy, iz):
-                        if excludeMin != None:
-                            if h.GetBinContent(ix, iy, iz) > excludeMin:
-                                retmin = h.GetBinContent(ix, iy, iz)
-                        else:
-                            retmin = h.GetBinContent(ix, iy, iz)
-
-    else:
+    if dim not in [1, 2, 3]:
         raise RuntimeError(
             "Error in getMinimumTH(): unsupported histogram's dimension (%d)" % dim
         )
 
-    return retmin
+    values = getTHcontents(h)[_innerSlices(h)]
+    if excludeMin != None:
+        values = values[values > excludeMin]
+
+    return min(sys.float_info.max, float(np.min(values, initial=np.inf)))
 
 
 #########################################################################
@@ -460,44 +541,16 @@ def getMaximumTH(h, excludeMax=None):
     # overflow are not considered
 
     dim = h.GetDimension()
-    retmax = sys.float_info.min
-
-    if dim == 1:
-        for ix in range(1, h.GetNbinsX() + 1):
-            if retmax < h.GetBinContent(ix):
-                if excludeMax != None:
-                    if h.GetBinContent(ix) < excludeMax:
-                        retmax = h.GetBinContent(ix)
-                else:
-                    retmax = h.GetBinContent(ix)
-
-    elif dim == 2:
-        for ix in range(1, h.GetNbinsX() + 1):
-            for iy in range(1, h.GetNbinsY() + 1):
-                if retmax < h.GetBinContent(ix, iy):
-                    if excludeMax != None:
-                        if h.GetBinContent(ix, iy) < excludeMax:
-                            retmax = h.GetBinContent(ix, iy)
-                    else:
-                        retmax = h.GetBinContent(ix, iy)
-
-    elif dim == 3:
-        for ix in range(1, h.GetNbinsX() + 1):
-            for iy in range(1, h.GetNbinsY() + 1):
-                for iz in range(1, h.GetNbinsZ() + 1):
-                    if retmax < h.GetBinContent(ix, iy, iz):
-                        if excludeMax != None:
-                            if h.GetBinContent(ix, iy, iz) < excludeMax:
-                                retmax = h.GetBinContent(ix, iy, iz)
-                        else:
-                            retmax = h.GetBinContent(ix, iy, iz)
-
-    else:
+    if dim not in [1, 2, 3]:
         raise RuntimeError(
             "Error in getMaximumTH(): unsupported histogram's dimension (%d)" % dim
         )
 
-    return retmax
+    values = getTHcontents(h)[_innerSlices(h)]
+    if excludeMax != None:
+        values = values[values < excludeMax]
+
+    return max(sys.float_info.min, float(np.max(values, initial=-np.inf)))
 
 
 #########################################################################
@@ -524,29 +577,32 @@ def fillTH2fromTH2part(
     if ybinHigh == None:
         ybinHigh = h2out.GetNbinsY()
 
-    for ix in range(xbinLow, 1 + xbinHigh):
-        for iy in range(ybinLow, 1 + ybinHigh):
-            if fillWithValuePlusError:
-                content = h2in.GetBinContent(
-                    ix + xoffset, iy + yoffset
-                ) + scaleError * h2in.GetBinError(ix + xoffset, iy + yoffset)
-                error = abs(scaleError) * h2in.GetBinError(ix + xoffset, iy + yoffset)
-            elif fillWithError:
-                content = scaleError * h2in.GetBinError(ix + xoffset, iy + yoffset)
-                error = 0.0
-                if useRelativeError:
-                    if h2in.GetBinContent(ix + xoffset, iy + yoffset) != 0.0:
-                        content = content / h2in.GetBinContent(
-                            ix + xoffset, iy + yoffset
-                        )
-                    else:
-                        content = ratioValForZeroAtDen
-            else:
-                content = h2in.GetBinContent(ix + xoffset, iy + yoffset)
-                error = abs(scaleError) * h2in.GetBinError(ix + xoffset, iy + yoffset)
+    binsOut = (slice(xbinLow, 1 + xbinHigh), slice(ybinLow, 1 + ybinHigh))
+    binsIn = (
+        slice(xbinLow + xoffset, 1 + xbinHigh + xoffset),
+        slice(ybinLow + yoffset, 1 + ybinHigh + yoffset),
+    )
+    valIn = getTHcontents(h2in)[binsIn]
+    errIn = getTHerrors(h2in)[binsIn]
+
+    if fillWithValuePlusError:
+        content = valIn + scaleError * errIn
+        error = abs(scaleError) * errIn
+    elif fillWithError:
+        content = scaleError * errIn
+        error = np.zeros_like(content)
+        if useRelativeError:
+            nonzero = valIn != 0.0
+            content = np.where(
+                nonzero,
+                content / np.where(nonzero, valIn, 1.0),
+                ratioValForZeroAtDen,
+            )
+    else:
+        content = valIn
+        error = abs(scaleError) * errIn
 
-            h2out.SetBinContent(ix, iy, content)
-            h2out.SetBinError(ix, iy, error)
+    setTHbins(h2out, binsOut, content, error)
 
 
 #########################################################################
@@ -573,13 +629,17 @@ def fillTH3fromTH3part(
     if zbinHigh == None:
         zbinHigh = h3out.GetNbinsZ()
 
-    for ix in range(xbinLow, 1 + xbinHigh):
-        for iy in range(ybinLow, 1 + ybinHigh):
-            for iz in range(zbinLow, 1 + zbinHigh):
-                content = h3in.GetBinContent(ix + xoffset, iy + yoffset, iz + zoffset)
-                error = h3in.GetBinError(ix + xoffset, iy + yoffset, iz + zoffset)
-                h3out.SetBinContent(ix, iy, iz, content)
-                h3out.SetBinError(ix, iy, iz, error)
+    binsOut = (
+        slice(xbinLow, 1 + xbinHigh),
+        slice(ybinLow, 1 + ybinHigh),
+        slice(zbinLow, 1 + zbinHigh),
+    )
+    binsIn = (
+        slice(xbinLow + xoffset, 1 + xbinHigh + xoffset),
+        slice(ybinLow + yoffset, 1 + ybinHigh + yoffset),
+        slice(zbinLow + zoffset, 1 + zbinHigh + zoffset),
+    )
+    setTHbins(h3out, binsOut, getTHcontents(h3in)[binsIn], getTHerrors(h3in)[binsIn])
 
 
 #########################################################################
@@ -587,13 +647,14 @@ def fillTH3fromTH3part(
 
 # can't this use TH3.Projection?
 def fillTH2fromTH3zrange(h2, h3, zbinLow=1, zbinHigh=1):
-    for ix in range(1, 1 + h2.GetNbinsX()):
-        for iy in range(1, 1 + h2.GetNbinsY()):
-            error = ROOT.Double(0)
-            h2.SetBinContent(
-                ix, iy, h3.IntegralAndError(ix, ix, iy, iy, zbinLow, zbinHigh, error)
-            )
-            h2.SetBinError(ix, iy, error)
+    bins = (
+        slice(1, 1 + h2.GetNbinsX()),
+        slice(1, 1 + h2.GetNbinsY()),
+        slice(zbinLow, 1 + zbinHigh),
+    )
+    content = getTHcontents(h3)[bins].sum(axis=-1)
+    error = np.sqrt(np.square(getTHerrors(h3)[bins]).sum(axis=-1))
+    setTHbins(h2, bins[:2], content, error)
 
 
 #########################################################################
@@ -601,11 +662,9 @@ def fillTH2fromTH3zrange(h2, h3, zbinLow=1, zbinHigh=1):
 
 def fillTH2fromTH3zbin(h2, h3, zbin=1):
     # fillTH2fromTH3zrange(h2, h3, zbinLow=zbin, zbinHigh=zbin)
-
-    for ix in range(1, 1 + h2.GetNbinsX()):
-        for iy in range(1, 1 + h2.GetNbinsY()):
-            h2.SetBinContent(ix, iy, h3.GetBinContent(ix, iy, zbin))
-            h2.SetBinError(ix, iy, h3.GetBinError(ix, iy, zbin))
+    bins = _innerSlices(h2)
+    binsIn = (*bins, zbin)
+    setTHbins(h2, bins, getTHcontents(h3)[binsIn], getTHerrors(h3)[binsIn])
 
 
 #########################################################################
@@ -642,15 +701,13 @@ def getTH2fromTH3(hist3D, name, binStart, binEnd=None):
 
 
 def fillTH3binFromTH2(h3, h2, zbin, scaleFactor=None):
-    for ix in range(1, 1 + h2.GetNbinsX()):
-        for iy in range(1, 1 + h2.GetNbinsY()):
-            val = h2.GetBinContent(ix, iy)
-            error = h2.GetBinError(ix, iy)
-            if scaleFactor != None:
-                val *= scaleFactor
-                error *= scaleFactor
-            h3.SetBinContent(ix, iy, zbin, val)
-            h3.SetBinError(ix, iy, zbin, error)
+    bins = _innerSlices(h2)
+    val = getTHcontents(h2)[bins]
+    error = getTHerrors(h2)[bins]
+    if scaleFactor != None:
+        val *= scaleFactor
+        error *= scaleFactor
+    setTHbins(h3, (*bins, zbin), val, error)
 
 
 def fillTHNplus1fromTHn(thnp1, thn, nbinLow=-1, nbinHigh=-1):
@@ -695,35 +752,30 @@ def multiplyByHistoWith1ptBin(h, h1bin):
     # multiply 2D histograms when one has only 1 pt bin
     # neglect uncertainty on histogram with 1 bin
     # it is assumed that the number of eta bins is the same
-    for ix in range(1, 1 + h.GetNbinsX()):
-        for iy in range(1, 1 + h.GetNbinsY()):
-            h.SetBinContent(
-                ix, iy, h.GetBinContent(ix, iy) * h1bin.GetBinContent(ix, 1)
-            )
-            h.SetBinError(ix, iy, h.GetBinError(ix, iy) * h1bin.GetBinContent(ix, 1))
+    bins = _innerSlices(h)
+    factor = getTHcontents(h1bin)[bins[0], 1][:, np.newaxis]
+    setTHbins(h, bins, getTHcontents(h)[bins] * factor, getTHerrors(h)[bins] * factor)
 
 
 def multiplyByHistoWithLessPtBins(h, hless, neglectUncSecond=False):
     # multiply 2D histograms when one has less pt bins
     # neglect uncertainty on histogram with less bins
     # it is assumed that the number of eta bins is the same
-    for ix in range(1, 1 + h.GetNbinsX()):
-        for iy in range(1, 1 + h.GetNbinsY()):
-            ybin = hless.GetYaxis().FindFixBin(h.GetYaxis().GetBinCenter(iy))
-            hContent = h.GetBinContent(ix, iy)
-            hlessContent = hless.GetBinContent(ix, ybin)
-            hUnc = h.GetBinError(ix, iy)
-            hlessUnc = hless.GetBinError(ix, ybin)
-            if neglectUncSecond:
-                unc = hUnc * hlessContent
-            else:
-                # uncertainty on product assuming uncorrelated pieces
-                unc = math.sqrt(
-                    hContent * hContent * hlessUnc * hlessUnc
-                    + hlessContent * hlessContent * hUnc * hUnc
-                )
-            h.SetBinContent(ix, iy, hContent * hlessContent)
-            h.SetBinError(ix, iy, unc)
+    bins = _innerSlices(h)
+    ybins = _findBins(hless.GetYaxis(), h.GetYaxis(), h.GetNbinsY())
+    hContent = getTHcontents(h)[bins]
+    hUnc = getTHerrors(h)[bins]
+    hlessContent = getTHcontents(hless)[bins[0]][:, ybins]
+    hlessUnc = getTHerrors(hless)[bins[0]][:, ybins]
+    if neglectUncSecond:
+        unc = hUnc * hlessContent
+    else:
+        # uncertainty on product assuming uncorrelated pieces
+        unc = np.sqrt(
+            hContent * hContent * hlessUnc * hlessUnc
+            + hlessContent * hlessContent * hUnc * hUnc
+        )
+    setTHbins(h, bins, hContent * hlessContent, unc)
 
 
 # TODO: make this C++ function in wremnants/include/histHelpers.h
@@ -731,26 +783,18 @@ def scaleTH2byOtherTH2(h, hother, scaleUncertainty=True, divide=False):
     # multiply 2D histograms when one has less bins
     # it is used to apply a correction stored in a TH2
     # one can decide not to scale also the uncertainty (scaleUncertainty=False)
-    maxXbinOther = hother.GetNbinsX()
-    maxYbinOther = hother.GetNbinsY()
-    for ix in range(1, 1 + h.GetNbinsX()):
-        xbin = hother.GetXaxis().FindFixBin(h.GetXaxis().GetBinCenter(ix))
-        xbin = sorted((1, xbin, maxXbinOther))[
-            1
-        ]  # creative way to clamp, faster than max(1, min(val, maxVal)) syntax
-        for iy in range(1, 1 + h.GetNbinsY()):
-            ybin = hother.GetYaxis().FindFixBin(h.GetYaxis().GetBinCenter(iy))
-            ybin = sorted((1, ybin, maxYbinOther))[1]
-            hContent = h.GetBinContent(ix, iy)
-            hUnc = h.GetBinError(ix, iy)
-            hotherContent = hother.GetBinContent(xbin, ybin)
-            # hotherContent = 2.0 ## for debug
-            # print(f"ix-iy-xbin-ybin-corr = {ix} - {iy} - {xbin} - {ybin} - {hotherContent}")
-            if divide:
-                hotherContent = 1.0 / hotherContent
-            h.SetBinContent(ix, iy, hContent * hotherContent)
-            if scaleUncertainty:
-                h.SetBinError(ix, iy, hUnc * hotherContent)
+    bins = _innerSlices(h)
+    xbins = _findBins(hother.GetXaxis(), h.GetXaxis(), h.GetNbinsX(), clamp=True)
+    ybins = _findBins(hother.GetYaxis(), h.GetYaxis(), h.GetNbinsY(), clamp=True)
+    hotherContent = getTHcontents(hother)[np.ix_(xbins, ybins)]
+    if divide:
+        hotherContent = 1.0 / hotherContent
+    setTHbins(
+        h,
+        bins,
+        getTHcontents(h)[bins] * hotherContent,
+        getTHerrors(h)[bins] * hotherContent if scaleUncertainty else None,
+    )
 
 
 def getTH2morePtBins(h2, newname, nPt):
@@ -767,12 +811,15 @@ def getTH2morePtBins(h2, newname, nPt):
         h2.GetYaxis().GetBinLowEdge(1),
         h2.GetYaxis().GetBinLowEdge(1 + h2.GetNbinsY()),
     )
-    for ix in range(1, 1 + h2new.GetNbinsX()):
-        for iy in range(1, 1 + h2new.GetNbinsY()):
-            ieta = h2.GetXaxis().FindFixBin(h2new.GetXaxis().GetBinCenter(ix))
-            ipt = h2.GetYaxis().FindFixBin(h2new.GetYaxis().GetBinCenter(iy))
-            h2new.SetBinContent(ix, iy, h2.GetBinContent(ieta, ipt))
-            h2new.SetBinError(ix, iy, h2.GetBinError(ieta, ipt))
+    ietas = _findBins(h2.GetXaxis(), h2new.GetXaxis(), h2new.GetNbinsX())
+    ipts = _findBins(h2.GetYaxis(), h2new.GetYaxis(), h2new.GetNbinsY())
+    binsIn = np.ix_(ietas, ipts)
+    setTHbins(
+        h2new,
+        _innerSlices(h2new),
+        getTHcontents(h2)[binsIn],
+        getTHerrors(h2)[binsIn],
+    )
     return h2new
 
 
@@ -4365,17 +4412,20 @@ def roll1Dto2D(h1d, histo, invertXY=False):
     # need to know whether the unrolled histograms have consecutive pt shapes (usually y axis of 2D plots), in which case invertXY must be True, or eta shapes (usually x axis of 2D plots)
     # we used to have eta shapes in unrolled TH1D passed to combinetf, but now we feed combinetf directly with 2D histograms, and it internally unrolls them in the other axis
     nBinsXaxis2D = histo.GetNbinsY() if invertXY else histo.GetNbinsX()
-    for i in range(1, h1d.GetNbinsX() + 1):
-        # histogram bin is numbered starting from 1, so add 1
-        xbin = (i - 1) % nBinsXaxis2D + 1
-        ybin = (i - 1) / nBinsXaxis2D + 1
-        xbin = int(xbin)
-        ybin = int(ybin)
-        if invertXY:
-            # our 2D plots will always have eta on x axis, so we must also swap xbin and ybin defined above
-            xbin, ybin = ybin, xbin
-        histo.SetBinContent(xbin, ybin, h1d.GetBinContent(i))
-        histo.SetBinError(xbin, ybin, h1d.GetBinError(i))
+    # histogram bin is numbered starting from 1, so add 1
+    ibins = np.arange(h1d.GetNbinsX())
+    xbins = ibins % nBinsXaxis2D + 1
+    ybins = ibins // nBinsXaxis2D + 1
+    if invertXY:
+        # our 2D plots will always have eta on x axis, so we must also swap xbin and ybin defined above
+        xbins, ybins = ybins, xbins
+    bins1D = slice(1, h1d.GetNbinsX() + 1)
+    setTHbins(
+        histo,
+        (xbins, ybins),
+        getTHcontents(h1d)[bins1D],
+        getTHerrors(h1d)[bins1D],
+    )
 
     return histo
 
@@ -4396,28 +4446,23 @@ def unroll2Dto1D(
     newh.Sumw2()
     if "TH2" not in h.ClassName():
         raise RuntimeError("Calling rebin2Dto1D on something that is not TH2")
-    if invertUnroll:
-        for i in range(h.GetNbinsX()):
-            for j in range(h.GetNbinsY()):
-                ibin = 1 + j + i * h.GetNbinsY()
-                newh.SetBinContent(ibin, h.GetBinContent(i + 1, j + 1))
-                newh.SetBinError(ibin, h.GetBinError(i + 1, j + 1))
-    else:
-        for i in range(h.GetNbinsX()):
-            for j in range(h.GetNbinsY()):
-                ibin = 1 + i + j * h.GetNbinsX()
-                newh.SetBinContent(ibin, h.GetBinContent(i + 1, j + 1))
-                newh.SetBinError(ibin, h.GetBinError(i + 1, j + 1))
+    # unrolled bin is 1 + i + j * nX, or 1 + j + i * nY with invertUnroll
+    order = "C" if invertUnroll else "F"
+    bins = _innerSlices(h)
+    content = getTHcontents(h)[bins].flatten(order=order)
+    error = getTHerrors(h)[bins].flatten(order=order)
 
     if cropNegativeBins:
-        for ibin in range(1, nbins + 1):
-            if newh.GetBinContent(ibin) < 0:
-                if not silent:
-                    logger.warning(
-                        "unroll2Dto1D(): cropping to zero bin %d in %s (was %f)"
-                        % (ibin, newh.GetName(), newh.GetBinContent(ibin))
-                    )
-                newh.SetBinContent(ibin, 0)
+        negative = np.flatnonzero(content < 0)
+        if not silent:
+            for ibin in negative:
+                logger.warning(
+                    "unroll2Dto1D(): cropping to zero bin %d in %s (was %f)"
+                    % (ibin + 1, newh.GetName(), content[ibin])
+                )
+        content[negative] = 0
+
+    setTHbins(newh, slice(1, nbins + 1), content, error)
     return newh
 
 
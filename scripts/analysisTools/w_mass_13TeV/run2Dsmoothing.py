@@ -24,6 +24,7 @@ import wums.fitutils
 import wums.ioutils
 import wums.output_tools
 from utilities import common
+from wremnants.batched_fitting import fit_hists_batched
 from wums import boostHistHelpers as hh
 from wums import logging
 
@@ -96,7 +97,8 @@ def polN_2d(
     degreeY=3,
 ):
 
-    parms2d = tf.reshape(parms, [degreeY + 1, degreeX + 1])
+    # trailing dimensions are kept for batched fits
+    parms2d = tf.reshape(parms, [degreeY + 1, degreeX + 1, *parms.shape[1:]])
 
     xscaled = (xvals[0] - xLowVal) / xFitRange
     yscaled = (xvals[1] - yLowVal) / yFitRange
@@ -453,6 +455,17 @@ def runSmoothing(
         etaEdges[-1],
     )
 
+    fitresBatched = {}
+    if args.batchedFit:
+        # fit all eta bins simultaneously, the results are then used in the loop below
+        boost_hists = []
+        for ieta in etaBinsToRun:
+            hsf.GetYaxis().SetRange(ieta, ieta)
+            hsf.GetZaxis().SetRange(iptFitLow, iptFitHigh)
+            boost_hists.append(narf.root_to_hist(hsf.Project3D("zxe")))
+        results = fit_hists_batched(boost_hists, polN_2d_scaled, np.array(arr))
+        fitresBatched = dict(zip(etaBinsToRun, results))
+
     for ieta in etaBinsToRun:
         # for ieta in range(1, 2):
         hsf.GetYaxis().SetRange(ieta, ieta)
@@ -483,7 +496,10 @@ def runSmoothing(
 
         boost_hist = narf.root_to_hist(h)
         params = np.array(arr)
-        res_polN_2d = wums.fitutils.fit_hist(boost_hist, polN_2d_scaled, params)
+        if ieta in fitresBatched:
+            res_polN_2d = fitresBatched[ieta]
+        else:
+            res_polN_2d = wums.fitutils.fit_hist(boost_hist, polN_2d_scaled, params)
         status = res_polN_2d["status"]
         covstatus = res_polN_2d["covstatus"]
         postfit_params = res_polN_2d["x"]
@@ -820,6 +836,11 @@ if __name__ == "__main__":
         default="iso04vtxAgn",
         help="Isolation type (and corresponding scale factors)",
     )
+    parser.add_argument(
+        "--batchedFit",
+        action="store_true",
+        help="Fit all eta bins simultaneously in a single batched minimization",
+    )
     args = parser.parse_args()
 
     sfFolder = (
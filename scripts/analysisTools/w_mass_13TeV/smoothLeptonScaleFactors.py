@@ -16,6 +16,7 @@
 # --> a summary of bad fits (if any) is printed on stdout for each step, but also in a txt file for easier check
 #     when running multiple steps in series. For the smoothing to make sense, status and covstatus MUST be 0 for all fits
 
+import concurrent.futures
 import copy
 import math
 import os
@@ -35,6 +36,7 @@ from scipy.interpolate import RegularGridInterpolator
 import narf
 import wums.fitutils
 from utilities import common
+from wremnants.batched_fitting import fit_hists_batched
 
 utilities = utilitiesCMG.util()
 
@@ -238,6 +240,92 @@ def getCoordinateNDC(x, canvas, vert=False):
         return (x - canvas.GetX1()) / (canvas.GetX2() - canvas.GetX1())
 
 
+def getBoostHistInFitRange(histo, fitRange=None):
+    # tensorflow fits use the bin centers and have no concept of fit range, so the
+    # boost histogram is sliced to the fit range (if any)
+    maxFitRange = histo.GetXaxis().GetBinLowEdge(1 + histo.GetNbinsX())
+    minFitRange = histo.GetXaxis().GetBinLowEdge(1)
+    boost_hist = narf.root_to_hist(histo)
+    if fitRange != None:
+        if fitRange[1] > 0:
+            maxFitRange = fitRange[1]
+        if fitRange[0] > 0:
+            minFitRange = fitRange[0]
+        s = hist.tag.Slicer()
+        boost_hist = boost_hist[
+            {0: s[complex(0, minFitRange) : complex(0, maxFitRange + 0.001)]}
+        ]
+    return boost_hist, minFitRange, maxFitRange
+
+
+def batchFitTurnOnTF(
+    histos,
+    mc,
+    step=None,
+    fitRange=None,
+    histosAlt=None,
+    efficiencyFitPolDegree=4,
+):
+    # run the fits of fitTurnOnTF for all eta bins (nominal and alternate) simultaneously,
+    # returns a dictionary with the fit results of each key, to be passed to fitTurnOnTF
+    keys = list(histos.keys())
+    boost_hists = {}
+    for key in keys:
+        boost_hists[key], minFitRange, maxFitRange = getBoostHistInFitRange(
+            histos[key], fitRange
+        )
+    boost_hists_alt = {}
+    if histosAlt:
+        for key in keys:
+            boost_hists_alt[key] = getBoostHistInFitRange(histosAlt[key], fitRange)[0]
+    xFitRange = maxFitRange - minFitRange
+
+    fits = []
+    if mc == "SF":
+        if step == "tracking" and histos[keys[0]].GetNbinsX() == 4:
+            global pol2_tf_scaled
+            if pol2_tf_scaled == None:
+                pol2_tf_scaled = partial(
+                    pol2_root, xLowVal=minFitRange, xFitRange=xFitRange
+                )
+            fits.append(("pol2", pol2_tf_scaled, np.array([1.0, 0.0, 0.0])))
+        else:
+            global pol3_tf_scaled
+            if pol3_tf_scaled == None:
+                pol3_tf_scaled = partial(
+                    pol3_root, xLowVal=minFitRange, xFitRange=xFitRange
+                )
+            fits.append(("pol3", pol3_tf_scaled, np.array([1.0, 0.0, 0.0, 0.0])))
+    else:
+        erf_func = antiErf_tf if step == "antiiso" else erf_tf
+        fits.append(("erf", erf_func, np.array([1.0, 35.0, 3.0])))
+        if efficiencyFitPolDegree >= 0:
+            global polN_tf_scaled
+            if polN_tf_scaled == None:
+                polN_tf_scaled = partial(
+                    polN_root_,
+                    xLowVal=minFitRange,
+                    xFitRange=xFitRange,
+                    degree=efficiencyFitPolDegree,
+                )
+            params = np.array([1.0] + [0.0 for i in range(efficiencyFitPolDegree)])
+            fits.append(("polN", polN_tf_scaled, params))
+
+    fitres = {key: {} for key in keys}
+    for name, func, params in fits:
+        # the erf is only fitted to the nominal histograms
+        useAlt = histosAlt and name != "erf"
+        hists = [boost_hists[key] for key in keys]
+        if useAlt:
+            hists += [boost_hists_alt[key] for key in keys]
+        results = fit_hists_batched(hists, func, params)
+        for ik, key in enumerate(keys):
+            fitres[key][name if name == "erf" else f"{name}_tf"] = results[ik]
+            if useAlt:
+                fitres[key][f"{name}_alt_tf"] = results[len(keys) + ik]
+    return fitres
+
+
 def fitTurnOnTF(
     histo,
     key,
@@ -257,6 +345,7 @@ def fitTurnOnTF(
     efficiencyFitPolDegree=4,
     addCurve=None,
     addCurveLegEntry="",
+    fitresBatched=None,
 ):
 
     doingSF = True if mc == "SF" else False
@@ -312,10 +401,8 @@ def fitTurnOnTF(
     minFitRange = histo.GetXaxis().GetBinLowEdge(1)
     originalMaxFitRange = maxFitRange
     originalMinFitRange = minFitRange
-    hasNarrowerFitRange = False
     nHistPointsForChi2 = histo.GetNbinsX()
     if fitRange != None:
-        hasNarrowerFitRange = True
         if fitRange[1] > 0:
             maxFitRange = fitRange[1]
         if fitRange[0] > 0:
@@ -360,18 +447,15 @@ def fitTurnOnTF(
     ###################
     # fits
     ####################
-    boost_hist = narf.root_to_hist(histo)
-    s = hist.tag.Slicer()
-    if hasNarrowerFitRange:
-        boost_hist = boost_hist[
-            {0: s[complex(0, minFitRange) : complex(0, maxFitRange + 0.001)]}
-        ]
+    boost_hist = getBoostHistInFitRange(histo, fitRange)[0]
     if histoAlt:
-        boost_hist_alt = narf.root_to_hist(histoAlt)
-        if hasNarrowerFitRange:
-            boost_hist_alt = boost_hist_alt[
-                {0: s[complex(0, minFitRange) : complex(0, maxFitRange + 0.001)]}
-            ]
+        boost_hist_alt = getBoostHistInFitRange(histoAlt, fitRange)[0]
+
+    def fitHist(name, bhist, func, params):
+        # take the result of the simultaneous fit of all eta bins if available
+        if fitresBatched is not None and name in fitresBatched:
+            return fitresBatched[name]
+        return wums.fitutils.fit_hist(bhist, func, params)
 
     ###############################################################
     fitFunction = None
@@ -397,7 +481,7 @@ def fitTurnOnTF(
                     pol2_root, xLowVal=minFitRange, xFitRange=xFitRange
                 )
             params = np.array([1.0, 0.0, 0.0])
-            res_tf1_pol2 = wums.fitutils.fit_hist(boost_hist, pol2_tf_scaled, params)
+            res_tf1_pol2 = fitHist("pol2_tf", boost_hist, pol2_tf_scaled, params)
             # for plotting purpose define the TF1 in the original range
             tf1_pol2 = ROOT.TF1(
                 "tf1_pol2", pol2_tf_scaled, minFitRange, maxFitRange, len(params)
@@ -417,8 +501,8 @@ def fitTurnOnTF(
             defaultFunc = "pol2_tf"
             if histoAlt:
                 params = np.array([1.0, 0.0, 0.0])
-                res_tf1_pol2_alt = wums.fitutils.fit_hist(
-                    boost_hist_alt, pol2_tf_scaled, params
+                res_tf1_pol2_alt = fitHist(
+                    "pol2_alt_tf", boost_hist_alt, pol2_tf_scaled, params
                 )
                 tf1_pol2_alt = ROOT.TF1(
                     "tf1_pol2_alt",
@@ -445,7 +529,7 @@ def fitTurnOnTF(
                     pol3_root, xLowVal=minFitRange, xFitRange=xFitRange
                 )
             params = np.array([1.0, 0.0, 0.0, 0.0])
-            res_tf1_pol3 = wums.fitutils.fit_hist(boost_hist, pol3_tf_scaled, params)
+            res_tf1_pol3 = fitHist("pol3_tf", boost_hist, pol3_tf_scaled, params)
             tf1_pol3 = ROOT.TF1(
                 "tf1_pol3", pol3_tf_scaled, minFitRange, maxFitRange, len(params)
             )
@@ -472,8 +556,8 @@ def fitTurnOnTF(
             defaultFunc = "pol3_tf"
             if histoAlt:
                 params = np.array([1.0, 0.0, 0.0, 0.0])
-                res_tf1_pol3_alt = wums.fitutils.fit_hist(
-                    boost_hist_alt, pol3_tf_scaled, params
+                res_tf1_pol3_alt = fitHist(
+                    "pol3_alt_tf", boost_hist_alt, pol3_tf_scaled, params
                 )
                 tf1_pol3_alt = ROOT.TF1(
                     "tf1_pol3_alt",
@@ -506,8 +590,8 @@ def fitTurnOnTF(
                 minFitRange,
                 maxFitRange,
             )
-            res_tf1_erf = wums.fitutils.fit_hist(
-                boost_hist, antiErf_tf, np.array([1.0, 35.0, 3.0])
+            res_tf1_erf = fitHist(
+                "erf", boost_hist, antiErf_tf, np.array([1.0, 35.0, 3.0])
             )
         else:
             tf1_erf = ROOT.TF1(
@@ -516,9 +600,7 @@ def fitTurnOnTF(
                 minFitRange,
                 maxFitRange,
             )
-            res_tf1_erf = wums.fitutils.fit_hist(
-                boost_hist, erf_tf, np.array([1.0, 35.0, 3.0])
-            )
+            res_tf1_erf = fitHist("erf", boost_hist, erf_tf, np.array([1.0, 35.0, 3.0]))
         tf1_erf.SetParameters(np.array(res_tf1_erf["x"], dtype=np.float64))
         tf1_erf.SetLineWidth(2)
         tf1_erf.SetLineStyle(ROOT.kDashed)
@@ -540,7 +622,7 @@ def fitTurnOnTF(
                     degree=efficiencyFitPolDegree,
                 )
             params = np.array([1.0] + [0.0 for i in range(efficiencyFitPolDegree)])
-            res_tf1_polN = wums.fitutils.fit_hist(boost_hist, polN_tf_scaled, params)
+            res_tf1_polN = fitHist("polN_tf", boost_hist, polN_tf_scaled, params)
             tf1_polN = ROOT.TF1(
                 f"tf1_pol{efficiencyFitPolDegree}",
                 polN_tf_scaled,
@@ -579,8 +661,8 @@ def fitTurnOnTF(
                 res_tf1_polN_alt = None
             else:
                 params = np.array([1.0] + [0.0 for i in range(efficiencyFitPolDegree)])
-                res_tf1_polN_alt = wums.fitutils.fit_hist(
-                    boost_hist_alt, polN_tf_scaled, params
+                res_tf1_polN_alt = fitHist(
+                    "polN_alt_tf", boost_hist_alt, polN_tf_scaled, params
                 )
                 tf1_polN_alt = ROOT.TF1(
                     "tf1_polN_alt",
@@ -1296,6 +1378,7 @@ def runFiles(args):
     print(f"---> steps = {steps}")
     print("Running these commands")
     print()
+    cmds = []
     for step in steps:
         charge = "both"
         if "plus" in step:
@@ -1313,12 +1396,31 @@ def runFiles(args):
 
         cmd = f"python scripts/analysisTools/w_mass_13TeV/smoothLeptonScaleFactors.py {inputFile} {args.outdir[0]} -c {charge} -s {step}"
         cmd += f" --input-hist-names '{args.inputHistNames}' --input-hist-names-alt '{args.inputHistNamesAlt}'"
+        if args.batchedFit:
+            cmd += " --batched-fit"
         ## now we no longer smooth efficiencies, but keep commented in case we need it again
         # if step in ["iso", "isonotrig", "antiiso", "antiisonotrig"]:
         #     cmd += f" --no-skip-eff --fit-pol-degree-efficiency {args.fitPolDegreeEfficiency}"
-        print()
-        safeSystem(cmd, args.dryRun)
-        print()
+        cmds.append(cmd)
+
+    if args.jobs > 1:
+        # the steps are independent, run them in parallel and check the status at the end
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(
+                executor.map(
+                    lambda cmd: safeSystem(cmd, args.dryRun, quitOnFail=False), cmds
+                )
+            )
+        failed = [cmd for cmd, res in zip(cmds, results) if res]
+        if len(failed):
+            for cmd in failed:
+                logger.error(f"Command failed: {cmd}")
+            quit()
+    else:
+        for cmd in cmds:
+            print()
+            safeSystem(cmd, args.dryRun)
+            print()
 
     if args.doMerge:
         mergeFiles(args)
@@ -1454,6 +1556,19 @@ if __name__ == "__main__":
         default="iso04vtxAgn",
         help="Isolation type (and corresponding scale factors)",
     )
+    parser.add_argument(
+        "--batched-fit",
+        dest="batchedFit",
+        action="store_true",
+        help="Fit all eta bins (and the alternate histograms) simultaneously in a single batched minimization",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of steps run in parallel with --run-all",
+    )
 
     args = parser.parse_args()
     logger = logging.setup_logger(os.path.basename(__file__), args.verbose, True)
@@ -1746,6 +1861,15 @@ if __name__ == "__main__":
         ###########################
         # first MC
         ###########################
+        fitresMC = {}
+        if args.batchedFit:
+            fitresMC = batchFitTurnOnTF(
+                hmcpt,
+                "MC",
+                step=args.step,
+                fitRange=args.ptFitRange,
+                efficiencyFitPolDegree=args.fitPolDegreeEfficiency,
+            )
         for key in hmcpt:
             bestFitFunc = fitTurnOnTF(
                 hmcpt[key],
@@ -1762,6 +1886,7 @@ if __name__ == "__main__":
                 widthPtSmooth=args.widthPt,
                 hist_nomiAndAlt_etapt=hist_effMC_nomiAndAlt_etapt,
                 efficiencyFitPolDegree=args.fitPolDegreeEfficiency,
+                fitresBatched=fitresMC.get(key, None),
             )
             for ipt in range(1, hmcSmoothCheck_origBinPt.GetNbinsY() + 1):
                 ptval = hmcSmoothCheck_origBinPt.GetYaxis().GetBinCenter(ipt)
@@ -1780,6 +1905,16 @@ if __name__ == "__main__":
         ###########################
         hdatapt = make1Dhist("hdatapt", hdata, ptbins, label)
         hdataptAlt = make1Dhist("hdataptAlt", hdataAlt, ptbins, label)
+        fitresData = {}
+        if args.batchedFit:
+            fitresData = batchFitTurnOnTF(
+                hdatapt,
+                "Data",
+                step=args.step,
+                fitRange=args.ptFitRange,
+                histosAlt=hdataptAlt,
+                efficiencyFitPolDegree=args.fitPolDegreeEfficiency,
+            )
         for key in hdatapt:
 
             bestFitFunc = fitTurnOnTF(
@@ -1798,6 +1933,7 @@ if __name__ == "__main__":
                 hist_nomiAndAlt_etapt=hist_effData_nomiAndAlt_etapt,
                 histoAlt=hdataptAlt[key],
                 efficiencyFitPolDegree=args.fitPolDegreeEfficiency,
+                fitresBatched=fitresData.get(key, None),
             )
             for ipt in range(1, hdataSmoothCheck_origBinPt.GetNbinsY() + 1):
                 ptval = hdataSmoothCheck_origBinPt.GetYaxis().GetBinCenter(ipt)
@@ -1822,6 +1958,15 @@ if __name__ == "__main__":
     # ###########################
     # # now direct SF smoothing
     # ###########################
+    fitresSF = {}
+    if args.batchedFit:
+        fitresSF = batchFitTurnOnTF(
+            hsfpt,
+            "SF",
+            step=args.step,
+            fitRange=args.ptFitRange,
+            histosAlt=hsfptAlt,
+        )
     for key in hsfpt:
         smoothSFfromEffiTMP = None
         if not args.skipEff:
@@ -1846,6 +1991,7 @@ if __name__ == "__main__":
             histoAlt=hsfptAlt[key],
             addCurve=smoothSFfromEffiTMP,
             addCurveLegEntry=f"SF from pol{args.fitPolDegreeEfficiency} effi",
+            fitresBatched=fitresSF.get(key, None),
         )
         for ipt in range(1, hsfSmoothCheck_origBinPt.GetNbinsY() + 1):
             ptval = hsfSmoothCheck_origBinPt.GetYaxis().GetBinCenter(ipt)
@@ -686,6 +686,8 @@ def build_graph(df, dataset):
 
 
 resultdict = narf.build_and_run(datasets, build_graph)
+if not args.noRecoil:
+    recoilHelper.add_sketches_to_results(resultdict)
 
 if not args.noScaleToData:
     scale_to_data(resultdict)
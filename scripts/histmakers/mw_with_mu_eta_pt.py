@@ -27,6 +27,7 @@ from wremnants import (
     muon_selections,
     muon_validation,
     pileup,
+    skim_tools,
     syst_tools,
     theory_corrections,
     theory_tools,
@@ -37,11 +38,15 @@ from wremnants import (
 from wremnants.datasets.dataset_tools import getDatasets
 from wremnants.helicity_utils_polvar import makehelicityWeightHelper_polvar
 from wremnants.histmaker_tools import (
+    CombinedTensorFill,
+    HelperRegistry,
     aggregate_groups,
+    define_global_bin_index,
     define_norm_weight_nRecoVtx,
     get_run_lumi_edges,
     make_muon_phi_axis,
     scale_to_data,
+    unflatten_global_bin_hists,
     write_analysis_output,
 )
 
@@ -150,6 +155,29 @@ parser.add_argument(
     action="store_true",
     help="When not applying muon scale corrections (--muonCorrData none / --muonCorrMC none), require at list that the CVH corrected variables are valid",
 )
+parser.add_argument(
+    "--skim",
+    action="store_true",
+    help="Read the events passing the preselection (trigger, muon and electron selections, MET filters) from local skims of the input files, the missing skims are made first. The skims are reused by later runs with the same preselection options",
+)
+parser.add_argument(
+    "--skimDir",
+    type=str,
+    default=None,
+    help=f"Directory of the skims (default {skim_tools.skim_dir}, set by the environment variable WREMNANTS_SKIM_DIR)",
+)
+parser.add_argument(
+    "--skimBranches",
+    type=str,
+    nargs="*",
+    default=[],
+    help="Regular expressions of branches to keep in the skims in addition to the default ones",
+)
+parser.add_argument(
+    "--globalBinIndex",
+    action="store_true",
+    help="Compute the global bin index of the nominal axes once per event and fill the systematic histograms on these axes by index",
+)
 
 args = parser.parse_args()
 
@@ -451,61 +479,80 @@ axis_recoWpt = hist.axis.Regular(
     40, 0.0, 80.0, name="recoWpt", underflow=False, overflow=True
 )
 
-# define helpers
-muon_prefiring_helper, muon_prefiring_helper_stat, muon_prefiring_helper_syst = (
-    muon_prefiring.make_muon_prefiring_helpers(era=era)
+# define helpers, they are only built when first used in build_graph
+helpers = HelperRegistry()
+helpers.register(
+    [
+        "muon_prefiring_helper",
+        "muon_prefiring_helper_stat",
+        "muon_prefiring_helper_syst",
+    ],
+    muon_prefiring.make_muon_prefiring_helpers,
+    era=era,
 )
 
-qcdScaleByHelicity_helper = theory_corrections.make_qcd_uncertainty_helper_by_helicity()
+helpers.register(
+    "qcdScaleByHelicity_helper",
+    theory_corrections.make_qcd_uncertainty_helper_by_helicity,
+)
 
+muon_efficiency_helper_names = [
+    "muon_efficiency_helper",
+    "muon_efficiency_helper_syst",
+    "muon_efficiency_helper_stat",
+]
+muon_efficiency_veto_helper_names = [
+    "muon_efficiency_veto_helper",
+    "muon_efficiency_veto_helper_syst",
+    "muon_efficiency_veto_helper_stat",
+]
 if args.noScaleFactors:
     logger.info("Running with no scale factors")
 elif args.binnedScaleFactors:
     logger.info("Using binned scale factors and uncertainties")
     # add usePseudoSmoothing=True for tests with Asimov
-    muon_efficiency_helper, muon_efficiency_helper_syst, muon_efficiency_helper_stat = (
-        muon_efficiencies_binned.make_muon_efficiency_helpers_binned(
-            filename=data_dir + "/muonSF/allSmooth_GtoH3D.root",
-            era=era,
-            max_pt=axis_pt.edges[-1],
-            usePseudoSmoothing=True,
-        )
+    helpers.register(
+        muon_efficiency_helper_names,
+        muon_efficiencies_binned.make_muon_efficiency_helpers_binned,
+        filename=data_dir + "/muonSF/allSmooth_GtoH3D.root",
+        era=era,
+        max_pt=axis_pt.edges[-1],
+        usePseudoSmoothing=True,
     )
 else:
     logger.info("Using smoothed scale factors and uncertainties")
-    muon_efficiency_helper, muon_efficiency_helper_syst, muon_efficiency_helper_stat = (
-        muon_efficiencies_smooth.make_muon_efficiency_helpers_smooth(
-            filename=args.sfFile,
-            era=era,
-            what_analysis=thisAnalysis,
-            max_pt=axis_pt.edges[-1],
-            isoEfficiencySmoothing=args.isoEfficiencySmoothing,
-            smooth3D=args.smooth3dsf,
-            isoDefinition=args.isolationDefinition,
-        )
+    helpers.register(
+        muon_efficiency_helper_names,
+        muon_efficiencies_smooth.make_muon_efficiency_helpers_smooth,
+        filename=args.sfFile,
+        era=era,
+        what_analysis=thisAnalysis,
+        max_pt=axis_pt.edges[-1],
+        isoEfficiencySmoothing=args.isoEfficiencySmoothing,
+        smooth3D=args.smooth3dsf,
+        isoDefinition=args.isolationDefinition,
     )
     if not args.noVetoSF:
         if args.useRefinedVeto:
-            (
-                muon_efficiency_veto_helper,
-                muon_efficiency_veto_helper_syst,
-                muon_efficiency_veto_helper_stat,
-            ) = muon_efficiencies_newVeto.make_muon_efficiency_helpers_newVeto(
-                antiveto=True, era=era
+            helpers.register(
+                muon_efficiency_veto_helper_names,
+                muon_efficiencies_newVeto.make_muon_efficiency_helpers_newVeto,
+                antiveto=True,
+                era=era,
             )
         else:
-            (
-                muon_efficiency_veto_helper,
-                muon_efficiency_veto_helper_syst,
-                muon_efficiency_veto_helper_stat,
-            ) = muon_efficiencies_veto.make_muon_efficiency_helpers_veto(
-                useGlobalOrTrackerVeto=useGlobalOrTrackerVeto, era=era
+            helpers.register(
+                muon_efficiency_veto_helper_names,
+                muon_efficiencies_veto.make_muon_efficiency_helpers_veto,
+                useGlobalOrTrackerVeto=useGlobalOrTrackerVeto,
+                era=era,
             )
 
 logger.info(f"SF file: {args.sfFile}")
 
-muon_efficiency_helper_syst_altBkg = {}
-if not args.noScaleFactors:
+
+def make_muon_efficiency_helpers_altBkg():
+    muon_efficiency_helper_syst_altBkg = {}
     for es in common.muonEfficiency_altBkgSyst_effSteps:
         altSFfile = args.sfFile.replace(".root", "_altBkg.root")
         logger.info(f"Additional SF file for alternate syst with {es}: {altSFfile}")
@@ -518,130 +565,248 @@ if not args.noScaleFactors:
                 effStep=es,
             )
         )
+    return muon_efficiency_helper_syst_altBkg
+
+
+if not args.noScaleFactors:
+    helpers.register(
+        "muon_efficiency_helper_syst_altBkg", make_muon_efficiency_helpers_altBkg
+    )
 
-pileup_helper = pileup.make_pileup_helper(era=era)
-vertex_helper = vertex.make_vertex_helper(era=era)
+helpers.register("pileup_helper", pileup.make_pileup_helper, era=era)
+helpers.register("vertex_helper", vertex.make_vertex_helper, era=era)
 
 calib_filepaths = common.calib_filepaths
 closure_filepaths = common.closure_filepaths
 
-diff_weights_helper = (
-    ROOT.wrem.SplinesDifferentialWeightsHelper(calib_filepaths["tflite_file"])
-    if (args.muonScaleVariation == "smearingWeightsSplines" or args.validationHists)
-    else None
+helpers.register(
+    "diff_weights_helper",
+    lambda: (
+        ROOT.wrem.SplinesDifferentialWeightsHelper(calib_filepaths["tflite_file"])
+        if (args.muonScaleVariation == "smearingWeightsSplines" or args.validationHists)
+        else None
+    ),
 )
 
-(
-    mc_jpsi_crctn_helper,
-    data_jpsi_crctn_helper,
-    jpsi_crctn_MC_unc_helper,
-    jpsi_crctn_data_unc_helper,
-) = muon_calibration.make_jpsi_crctn_helpers(
-    args, calib_filepaths, make_uncertainty_helper=True
+helpers.register(
+    [
+        "mc_jpsi_crctn_helper",
+        "data_jpsi_crctn_helper",
+        "jpsi_crctn_MC_unc_helper",
+        "jpsi_crctn_data_unc_helper",
+    ],
+    muon_calibration.make_jpsi_crctn_helpers,
+    args,
+    calib_filepaths,
+    make_uncertainty_helper=True,
 )
 
-z_non_closure_parametrized_helper, z_non_closure_binned_helper = (
-    muon_calibration.make_Z_non_closure_helpers(
-        args, calib_filepaths, closure_filepaths
-    )
+helpers.register(
+    ["z_non_closure_parametrized_helper", "z_non_closure_binned_helper"],
+    muon_calibration.make_Z_non_closure_helpers,
+    args,
+    calib_filepaths,
+    closure_filepaths,
 )
 
-mc_calibration_helper, data_calibration_helper, calibration_uncertainty_helper = (
-    muon_calibration.make_muon_calibration_helpers(args, era=era)
+helpers.register(
+    [
+        "mc_calibration_helper",
+        "data_calibration_helper",
+        "calibration_uncertainty_helper",
+    ],
+    muon_calibration.make_muon_calibration_helpers,
+    args,
+    era=era,
 )
 
-closure_unc_helper = muon_calibration.make_closure_uncertainty_helper(
-    common.closure_filepaths["parametrized"]
+helpers.register(
+    "closure_unc_helper",
+    muon_calibration.make_closure_uncertainty_helper,
+    common.closure_filepaths["parametrized"],
 )
-closure_unc_helper_A = muon_calibration.make_uniform_closure_uncertainty_helper(
-    0, common.correlated_variation_base_size["A"]
+helpers.register(
+    "closure_unc_helper_A",
+    muon_calibration.make_uniform_closure_uncertainty_helper,
+    0,
+    common.correlated_variation_base_size["A"],
 )
-closure_unc_helper_M = muon_calibration.make_uniform_closure_uncertainty_helper(
-    2, common.correlated_variation_base_size["M"]
+helpers.register(
+    "closure_unc_helper_M",
+    muon_calibration.make_uniform_closure_uncertainty_helper,
+    2,
+    common.correlated_variation_base_size["M"],
 )
 
-smearing_helper, smearing_uncertainty_helper = (
-    (None, None) if args.noSmearing else muon_calibration.make_muon_smearing_helpers()
+helpers.register(
+    ["smearing_helper", "smearing_uncertainty_helper"],
+    lambda: (
+        (None, None)
+        if args.noSmearing
+        else muon_calibration.make_muon_smearing_helpers()
+    ),
 )
 
-bias_helper = (
-    muon_calibration.make_muon_bias_helpers(args) if args.biasCalibration else None
+helpers.register(
+    "bias_helper",
+    lambda: (
+        muon_calibration.make_muon_bias_helpers(args) if args.biasCalibration else None
+    ),
 )
 
-(
-    pixel_multiplicity_helper,
-    pixel_multiplicity_uncertainty_helper,
-    pixel_multiplicity_uncertainty_helper_stat,
-) = muon_calibration.make_pixel_multiplicity_helpers(
-    reverse_variations=args.reweightPixelMultiplicity
+helpers.register(
+    [
+        "pixel_multiplicity_helper",
+        "pixel_multiplicity_uncertainty_helper",
+        "pixel_multiplicity_uncertainty_helper_stat",
+    ],
+    muon_calibration.make_pixel_multiplicity_helpers,
+    reverse_variations=args.reweightPixelMultiplicity,
 )
 
 
 theory_corrs = [*args.theoryCorr, *args.ewTheoryCorr]
 procsWithTheoryCorr = [d.name for d in datasets if d.name in common.vprocs]
-if len(procsWithTheoryCorr):
-    corr_helpers = theory_corrections.load_corr_helpers(
-        procsWithTheoryCorr, theory_corrs
-    )
-else:
-    corr_helpers = {}
+helpers.register(
+    "corr_helpers",
+    lambda: (
+        theory_corrections.load_corr_helpers(procsWithTheoryCorr, theory_corrs)
+        if len(procsWithTheoryCorr)
+        else {}
+    ),
+)
 
 # For polynominal variations
 if args.theoryAgnosticPolVar:
-    theoryAgnostic_helpers_minus = makehelicityWeightHelper_polvar(
-        genVcharge=-1,
-        fileTag=args.theoryAgnosticFileTag,
-        filePath=args.theoryAgnosticFilePath,
-    )
-    theoryAgnostic_helpers_plus = makehelicityWeightHelper_polvar(
-        genVcharge=1,
-        fileTag=args.theoryAgnosticFileTag,
-        filePath=args.theoryAgnosticFilePath,
-    )
+    for name, genVcharge in [
+        ("theoryAgnostic_helpers_minus", -1),
+        ("theoryAgnostic_helpers_plus", 1),
+    ]:
+        helpers.register(
+            name,
+            makehelicityWeightHelper_polvar,
+            genVcharge=genVcharge,
+            fileTag=args.theoryAgnosticFileTag,
+            filePath=args.theoryAgnosticFilePath,
+        )
 
 # Helper for muR and muF as polynomial variations
-muRmuFPolVar_helpers_minus = makehelicityWeightHelper_polvar(
-    genVcharge=-1,
-    fileTag=args.muRmuFPolVarFileTag,
-    filePath=args.muRmuFPolVarFilePath,
-    noUL=True,
-)
-muRmuFPolVar_helpers_plus = makehelicityWeightHelper_polvar(
-    genVcharge=1,
-    fileTag=args.muRmuFPolVarFileTag,
-    filePath=args.muRmuFPolVarFilePath,
-    noUL=True,
-)
-muRmuFPolVar_helpers_Z = makehelicityWeightHelper_polvar(
-    genVcharge=0,
-    fileTag=args.muRmuFPolVarFileTag,
-    filePath=args.muRmuFPolVarFilePath,
-    noUL=True,
-)
+for name, genVcharge in [
+    ("muRmuFPolVar_helpers_minus", -1),
+    ("muRmuFPolVar_helpers_plus", 1),
+    ("muRmuFPolVar_helpers_Z", 0),
+]:
+    helpers.register(
+        name,
+        makehelicityWeightHelper_polvar,
+        genVcharge=genVcharge,
+        fileTag=args.muRmuFPolVarFileTag,
+        filePath=args.muRmuFPolVarFilePath,
+        noUL=True,
+    )
+
 
 # recoil initialization
-if not args.noRecoil:
+def make_recoil_helper():
     from wremnants import recoil_tools
 
-    recoilHelper = recoil_tools.Recoil("highPU", args, flavor="mu")
+    return recoil_tools.Recoil("highPU", args, flavor="mu")
+
+
+if not args.noRecoil:
+    helpers.register("recoilHelper", make_recoil_helper)
 
 seed_data = 2 * args.randomSeedForToys
 seed_mc = 2 * args.randomSeedForToys + 1
 
 if args.nToysMC > 0:
-    toy_helper_data = ROOT.wrem.ToyHelper(
-        args.nToysMC, seed_data, 1, ROOT.ROOT.GetThreadPoolSize()
+    helpers.register(
+        "toy_helper_data",
+        lambda: ROOT.wrem.ToyHelper(args.nToysMC, seed_data, 1),
     )
-    toy_helper_mc = ROOT.wrem.ToyHelper(
-        args.nToysMC,
-        seed_mc,
-        args.varianceScalingForToys,
-        ROOT.ROOT.GetThreadPoolSize(),
+    helpers.register(
+        "toy_helper_mc",
+        lambda: ROOT.wrem.ToyHelper(args.nToysMC, seed_mc, args.varianceScalingForToys),
     )
 
 smearing_weights_procs = []
 
 
+def preselection(df, dataset):
+    # trigger, muon and electron selections and MET filters, these reject most events and are also used to make the skims
+    cvh_helper = (
+        helpers.data_calibration_helper
+        if dataset.is_data
+        else helpers.mc_calibration_helper
+    )
+    jpsi_helper = (
+        helpers.data_jpsi_crctn_helper
+        if dataset.is_data
+        else helpers.mc_jpsi_crctn_helper
+    )
+
+    if not args.makeMCefficiency and not args.noTrigger:
+        # remove trigger, it will be part of the efficiency selection for passing trigger
+        df = df.Filter(muon_selections.hlt_string(era))
+
+    df = muon_calibration.define_corrected_muons(
+        df,
+        cvh_helper,
+        jpsi_helper,
+        args,
+        dataset,
+        helpers.smearing_helper,
+        helpers.bias_helper,
+    )
+
+    df = muon_selections.select_veto_muons(
+        df,
+        nMuons=1,
+        ptCut=args.vetoRecoPt,
+        etaCut=args.vetoRecoEta,
+        useGlobalOrTrackerVeto=useGlobalOrTrackerVeto,
+    )
+    df = muon_selections.select_good_muons(
+        df,
+        template_minpt,
+        template_maxpt,
+        dataset.group,
+        nMuons=1,
+        use_trackerMuons=args.trackerMuons,
+        use_isolation=False,
+        nonPromptFromSV=args.selectNonPromptFromSV,
+        nonPromptFromLighMesonDecay=args.selectNonPromptFromLightMesonDecay,
+        requirePixelHits=args.requirePixelHits,
+    )
+
+    # the corrected RECO muon kinematics, which is intended to be used as the nominal
+    df = muon_calibration.define_corrected_reco_muon_kinematics(df)
+
+    df = muon_selections.select_standalone_muons(
+        df, dataset, args.trackerMuons, "goodMuons"
+    )
+
+    df = muon_selections.veto_electrons(df)
+    df = muon_selections.apply_met_filters(df)
+
+    if args.makeMCefficiency:
+        df = df.Define(
+            "GoodTrigObjs",
+            f"wrem::goodMuonTriggerCandidate<wrem::Era::Era_{era}>(TrigObj_id,TrigObj_filterBits)",
+        )
+        hltString = muon_selections.hlt_string(era)
+        df = df.Define(
+            "passTrigger",
+            f"{hltString} && wrem::hasTriggerMatch(goodMuons_eta0,goodMuons_phi0,TrigObj_eta[GoodTrigObjs],TrigObj_phi[GoodTrigObjs])",
+        )
+    elif not args.noTrigger:
+        df = muon_selections.apply_triggermatching_muon(
+            df, dataset, "goodMuons", era=era
+        )
+
+    return df
+
+
 def build_graph(df, dataset):
     logger.info(f"build graph for dataset: {dataset.name}")
     results = []
@@ -662,10 +827,7 @@ def build_graph(df, dataset):
     if args.noAuxiliaryHistograms:
         auxiliary_histograms = False
 
-    apply_theory_corr = theory_corrs and dataset.name in corr_helpers
-
-    cvh_helper = data_calibration_helper if dataset.is_data else mc_calibration_helper
-    jpsi_helper = data_jpsi_crctn_helper if dataset.is_data else mc_jpsi_crctn_helper
+    apply_theory_corr = theory_corrs and dataset.name in helpers.corr_helpers
 
     if dataset.is_data:
         df = df.DefinePerSample("weight", "1.0")
@@ -676,9 +838,13 @@ def build_graph(df, dataset):
 
     if args.nToysMC > 0:
         if dataset.is_data:
-            df = df.Define("toyIdxs", toy_helper_data, ["rdfslot_"])
+            df = df.Define(
+                "toyIdxs", helpers.toy_helper_data, ["run", "luminosityBlock", "event"]
+            )
         else:
-            df = df.Define("toyIdxs", toy_helper_mc, ["rdfslot_"])
+            df = df.Define(
+                "toyIdxs", helpers.toy_helper_mc, ["run", "luminosityBlock", "event"]
+            )
 
     df = df.Define("isEvenEvent", "event % 2 == 0")
 
@@ -796,8 +962,8 @@ def build_graph(df, dataset):
                     df_xnorm,
                     args,
                     dataset.name,
-                    corr_helpers,
-                    qcdScaleByHelicity_helper,
+                    helpers.corr_helpers,
+                    helpers.qcdScaleByHelicity_helper,
                     [a for a in unfolding_axes[level] if a.name != "acceptance"],
                     [c for c in unfolding_cols[level] if c != f"{level}_acceptance"],
                     base_name=level,
@@ -850,58 +1016,7 @@ def build_graph(df, dataset):
     if args.xnormOnly:
         return results, weightsum
 
-    if not args.makeMCefficiency and not args.noTrigger:
-        # remove trigger, it will be part of the efficiency selection for passing trigger
-        df = df.Filter(muon_selections.hlt_string(era))
-
-    df = muon_calibration.define_corrected_muons(
-        df, cvh_helper, jpsi_helper, args, dataset, smearing_helper, bias_helper
-    )
-
-    df = muon_selections.select_veto_muons(
-        df,
-        nMuons=1,
-        ptCut=args.vetoRecoPt,
-        etaCut=args.vetoRecoEta,
-        useGlobalOrTrackerVeto=useGlobalOrTrackerVeto,
-    )
-    df = muon_selections.select_good_muons(
-        df,
-        template_minpt,
-        template_maxpt,
-        dataset.group,
-        nMuons=1,
-        use_trackerMuons=args.trackerMuons,
-        use_isolation=False,
-        nonPromptFromSV=args.selectNonPromptFromSV,
-        nonPromptFromLighMesonDecay=args.selectNonPromptFromLightMesonDecay,
-        requirePixelHits=args.requirePixelHits,
-    )
-
-    # the corrected RECO muon kinematics, which is intended to be used as the nominal
-    df = muon_calibration.define_corrected_reco_muon_kinematics(df)
-
-    df = muon_selections.select_standalone_muons(
-        df, dataset, args.trackerMuons, "goodMuons"
-    )
-
-    df = muon_selections.veto_electrons(df)
-    df = muon_selections.apply_met_filters(df)
-
-    if args.makeMCefficiency:
-        df = df.Define(
-            "GoodTrigObjs",
-            f"wrem::goodMuonTriggerCandidate<wrem::Era::Era_{era}>(TrigObj_id,TrigObj_filterBits)",
-        )
-        hltString = muon_selections.hlt_string(era)
-        df = df.Define(
-            "passTrigger",
-            f"{hltString} && wrem::hasTriggerMatch(goodMuons_eta0,goodMuons_phi0,TrigObj_eta[GoodTrigObjs],TrigObj_phi[GoodTrigObjs])",
-        )
-    elif not args.noTrigger:
-        df = muon_selections.apply_triggermatching_muon(
-            df, dataset, "goodMuons", era=era
-        )
+    df = preselection(df, dataset)
 
     if isWorZ:
         df = muon_validation.define_cvh_reco_muon_kinematics(df)
@@ -1029,8 +1144,10 @@ def build_graph(df, dataset):
     if dataset.is_data:
         df = df.DefinePerSample("nominal_weight", "1.0")
     else:
-        df = df.Define("weight_pu", pileup_helper, ["Pileup_nTrueInt"])
-        df = df.Define("weight_vtx", vertex_helper, ["GenVtx_z", "Pileup_nTrueInt"])
+        df = df.Define("weight_pu", helpers.pileup_helper, ["Pileup_nTrueInt"])
+        df = df.Define(
+            "weight_vtx", helpers.vertex_helper, ["GenVtx_z", "Pileup_nTrueInt"]
+        )
         if era == "2016PostVFP":
             if args.addRunAxis and not args.randomizeDataByRun:
                 # define helpers for prefiring in each sub era
@@ -1075,7 +1192,7 @@ def build_graph(df, dataset):
             else:
                 df = df.Define(
                     "weight_newMuonPrefiringSF",
-                    muon_prefiring_helper,
+                    helpers.muon_prefiring_helper,
                     [
                         "Muon_correctedEta",
                         "Muon_correctedPt",
@@ -1142,7 +1259,7 @@ def build_graph(df, dataset):
         if not isQCDMC and not args.noScaleFactors:
             df = df.Define(
                 "weight_fullMuonSF_withTrackingReco",
-                muon_efficiency_helper,
+                helpers.muon_efficiency_helper,
                 columnsForSF,
             )
             weight_expr += "*weight_fullMuonSF_withTrackingReco"
@@ -1159,7 +1276,7 @@ def build_graph(df, dataset):
                 if not args.noVetoSF:
                     df = df.Define(
                         "weight_vetoSF_nominal",
-                        muon_efficiency_veto_helper,
+                        helpers.muon_efficiency_veto_helper,
                         [
                             "vetoMuons_tnpPt0",
                             "vetoMuons_tnpEta0",
@@ -1194,7 +1311,7 @@ def build_graph(df, dataset):
         if args.reweightPixelMultiplicity:
             df = df.Define(
                 "weight_pixel_multiplicity",
-                pixel_multiplicity_helper,
+                helpers.pixel_multiplicity_helper,
                 pixel_multiplicity_cols,
             )
             weight_expr += "*weight_pixel_multiplicity"
@@ -1202,7 +1319,7 @@ def build_graph(df, dataset):
         logger.debug(f"Exp weight defined: {weight_expr}")
         df = df.Define("exp_weight", weight_expr)
         df = theory_tools.define_theory_weights_and_corrs(
-            df, dataset.name, corr_helpers, args
+            df, dataset.name, helpers.corr_helpers, args
         )
 
         if (
@@ -1227,7 +1344,7 @@ def build_graph(df, dataset):
             "goodMuons_phi0",
             "goodMuons_charge0",
         ]
-        df = recoilHelper.recoil_W(
+        df = helpers.recoilHelper.recoil_W(
             df,
             results,
             dataset,
@@ -1563,6 +1680,10 @@ def build_graph(df, dataset):
 
     df = df.Define("passMT", f"transverseMass >= {mtw_min}")
 
+    if args.globalBinIndex:
+        # systematic histograms on the nominal axes are filled by the global bin index computed here
+        df = define_global_bin_index(df, "nominal", axes, cols)
+
     if auxiliary_histograms:
 
         # control plots, lepton, met, to plot them later (need eta-pt to make fakes)
@@ -1663,14 +1784,14 @@ def build_graph(df, dataset):
                 ]
                 # assume to have same coeffs for plus and minus (no reason for it not to be the case)
                 for genVcharge in ["minus", "plus"]:
-                    for coeffKey in theoryAgnostic_helpers_minus.keys():
+                    for coeffKey in helpers.theoryAgnostic_helpers_minus.keys():
                         logger.debug(
                             f"Creating theory agnostic histograms with polynomial variations for {coeffKey} and {genVcharge} gen W charge"
                         )
                         helperQ = (
-                            theoryAgnostic_helpers_minus[coeffKey]
+                            helpers.theoryAgnostic_helpers_minus[coeffKey]
                             if genVcharge == "minus"
-                            else theoryAgnostic_helpers_plus[coeffKey]
+                            else helpers.theoryAgnostic_helpers_plus[coeffKey]
                         )
                         df = df.Define(
                             f"theoryAgnostic_{coeffKey}_{genVcharge}_tensor",
@@ -1720,15 +1841,15 @@ def build_graph(df, dataset):
         ]
         # assume to have same coeffs for plus and minus (no reason for it not to be the case)
         if dataset.name == "WplusmunuPostVFP" or dataset.name == "WplustaunuPostVFP":
-            helpers_class = muRmuFPolVar_helpers_plus
+            helpers_class = helpers.muRmuFPolVar_helpers_plus
             process_name = "W"
         elif (
             dataset.name == "WminusmunuPostVFP" or dataset.name == "WminustaunuPostVFP"
         ):
-            helpers_class = muRmuFPolVar_helpers_minus
+            helpers_class = helpers.muRmuFPolVar_helpers_minus
             process_name = "W"
         elif dataset.name == "ZmumuPostVFP" or dataset.name == "ZtautauPostVFP":
-            helpers_class = muRmuFPolVar_helpers_Z
+            helpers_class = helpers.muRmuFPolVar_helpers_Z
             process_name = "Z"
         for coeffKey in helpers_class.keys():
             logger.debug(
@@ -1846,7 +1967,7 @@ def build_graph(df, dataset):
             results.append(yieldsVertexZstudy)
 
         if not args.noRecoil and args.recoilUnc:
-            df = recoilHelper.add_recoil_unc_W(
+            df = helpers.recoilHelper.add_recoil_unc_W(
                 df, results, dataset, cols, axes, "nominal", storage_type=storage_type
             )
         if apply_theory_corr:
@@ -1855,7 +1976,7 @@ def build_graph(df, dataset):
                 df,
                 axes,
                 cols,
-                corr_helpers[dataset.name],
+                helpers.corr_helpers[dataset.name],
                 theory_corrs,
                 base_name="nominal",
                 modify_central_weight=not args.theoryCorrAltOnly,
@@ -1876,8 +1997,8 @@ def build_graph(df, dataset):
                 df = syst_tools.add_muon_efficiency_unc_hists(
                     results,
                     df,
-                    muon_efficiency_helper_stat,
-                    muon_efficiency_helper_syst,
+                    helpers.muon_efficiency_helper_stat,
+                    helpers.muon_efficiency_helper_syst,
                     axes,
                     cols,
                     what_analysis=thisAnalysis,
@@ -1888,7 +2009,7 @@ def build_graph(df, dataset):
                     df = syst_tools.add_muon_efficiency_unc_hists_altBkg(
                         results,
                         df,
-                        muon_efficiency_helper_syst_altBkg[es],
+                        helpers.muon_efficiency_helper_syst_altBkg[es],
                         axes,
                         cols,
                         what_analysis=thisAnalysis,
@@ -1899,8 +2020,8 @@ def build_graph(df, dataset):
                     df = syst_tools.add_muon_efficiency_veto_unc_hists(
                         results,
                         df,
-                        muon_efficiency_veto_helper_stat,
-                        muon_efficiency_veto_helper_syst,
+                        helpers.muon_efficiency_veto_helper_stat,
+                        helpers.muon_efficiency_veto_helper_syst,
                         axes,
                         cols,
                         storage_type=storage_type,
@@ -1922,8 +2043,8 @@ def build_graph(df, dataset):
                     df,
                     axes,
                     cols,
-                    helper_stat=muon_prefiring_helper_stat,
-                    helper_syst=muon_prefiring_helper_syst,
+                    helper_stat=helpers.muon_prefiring_helper_stat,
+                    helper_syst=helpers.muon_prefiring_helper_syst,
                     storage_type=storage_type,
                 )
 
@@ -1937,8 +2058,8 @@ def build_graph(df, dataset):
                 df,
                 args,
                 dataset.name,
-                corr_helpers,
-                qcdScaleByHelicity_helper,
+                helpers.corr_helpers,
+                helpers.qcdScaleByHelicity_helper,
                 axes,
                 cols,
                 for_wmass=True,
@@ -1980,10 +2101,10 @@ def build_graph(df, dataset):
                     f"{reco_sel_GF}_genEta",
                     f"{reco_sel_GF}_genCharge",
                 ]
-                if diff_weights_helper:
+                if helpers.diff_weights_helper:
                     df = df.Define(
                         f"{reco_sel_GF}_response_weight",
-                        diff_weights_helper,
+                        helpers.diff_weights_helper,
                         [*input_kinematics],
                     )
                     input_kinematics.append(f"{reco_sel_GF}_response_weight")
@@ -1997,7 +2118,7 @@ def build_graph(df, dataset):
                     cols,
                     cols_gen_smeared,
                     calib_filepaths,
-                    jpsi_crctn_data_unc_helper,
+                    helpers.jpsi_crctn_data_unc_helper,
                     smearing_weights_procs,
                     reco_sel_GF,
                     dataset.name,
@@ -2012,8 +2133,8 @@ def build_graph(df, dataset):
                     results,
                     cols,
                     cols_gen_smeared,
-                    z_non_closure_parametrized_helper,
-                    z_non_closure_binned_helper,
+                    helpers.z_non_closure_parametrized_helper,
+                    helpers.z_non_closure_binned_helper,
                     reco_sel_GF,
                     storage_type=storage_type,
                 )
@@ -2023,7 +2144,7 @@ def build_graph(df, dataset):
                     axes,
                     results,
                     cols,
-                    smearing_uncertainty_helper,
+                    helpers.smearing_uncertainty_helper,
                     reco_sel_GF,
                     storage_type=storage_type,
                 )
@@ -2032,80 +2153,75 @@ def build_graph(df, dataset):
                         df, axes, results, cols, cols_gen_smeared
                     )
 
+                # pixel multiplicity and muon scale closure uncertainties share axes and columns,
+                # their tensors are filled together into one histogram and split after the event loop
+                muon_scale_fill = CombinedTensorFill(
+                    "muonScaleFamily", axes, cols, storage=hist.storage.Double()
+                )
+
                 # add pixel multiplicity uncertainties
                 df = df.Define(
                     "nominal_pixelMultiplicitySyst_tensor",
-                    pixel_multiplicity_uncertainty_helper,
+                    helpers.pixel_multiplicity_uncertainty_helper,
                     [*pixel_multiplicity_cols, "nominal_weight"],
                 )
-                hist_pixelMultiplicitySyst = df.HistoBoost(
+                muon_scale_fill.add(
                     "nominal_pixelMultiplicitySyst",
-                    axes,
-                    [*cols, "nominal_pixelMultiplicitySyst_tensor"],
-                    tensor_axes=pixel_multiplicity_uncertainty_helper.tensor_axes,
-                    storage=hist.storage.Double(),
+                    "nominal_pixelMultiplicitySyst_tensor",
+                    helpers.pixel_multiplicity_uncertainty_helper.tensor_axes,
                 )
-                results.append(hist_pixelMultiplicitySyst)
 
                 if args.pixelMultiplicityStat:
                     df = df.Define(
                         "nominal_pixelMultiplicityStat_tensor",
-                        pixel_multiplicity_uncertainty_helper_stat,
+                        helpers.pixel_multiplicity_uncertainty_helper_stat,
                         [*pixel_multiplicity_cols, "nominal_weight"],
                     )
-                    hist_pixelMultiplicityStat = df.HistoBoost(
+                    muon_scale_fill.add(
                         "nominal_pixelMultiplicityStat",
-                        axes,
-                        [*cols, "nominal_pixelMultiplicityStat_tensor"],
-                        tensor_axes=pixel_multiplicity_uncertainty_helper_stat.tensor_axes,
-                        storage=hist.storage.Double(),
+                        "nominal_pixelMultiplicityStat_tensor",
+                        helpers.pixel_multiplicity_uncertainty_helper_stat.tensor_axes,
                     )
-                    results.append(hist_pixelMultiplicityStat)
 
                 # extra uncertainties from non-closure stats
                 df = df.Define(
                     "muonScaleClosSyst_responseWeights_tensor_splines",
-                    closure_unc_helper,
+                    helpers.closure_unc_helper,
                     [*input_kinematics, "nominal_weight"],
                 )
-                nominal_muonScaleClosSyst_responseWeights = df.HistoBoost(
+                muon_scale_fill.add(
                     "nominal_muonScaleClosSyst_responseWeights",
-                    axes,
-                    [*cols, "muonScaleClosSyst_responseWeights_tensor_splines"],
-                    tensor_axes=closure_unc_helper.tensor_axes,
-                    storage=hist.storage.Double(),
+                    "muonScaleClosSyst_responseWeights_tensor_splines",
+                    helpers.closure_unc_helper.tensor_axes,
                 )
-                results.append(nominal_muonScaleClosSyst_responseWeights)
 
                 # extra uncertainties for A (fully correlated)
                 df = df.Define(
                     "muonScaleClosASyst_responseWeights_tensor_splines",
-                    closure_unc_helper_A,
+                    helpers.closure_unc_helper_A,
                     [*input_kinematics, "nominal_weight"],
                 )
-                nominal_muonScaleClosASyst_responseWeights = df.HistoBoost(
+                muon_scale_fill.add(
                     "nominal_muonScaleClosASyst_responseWeights",
-                    axes,
-                    [*cols, "muonScaleClosASyst_responseWeights_tensor_splines"],
-                    tensor_axes=closure_unc_helper_A.tensor_axes,
-                    storage=hist.storage.Double(),
+                    "muonScaleClosASyst_responseWeights_tensor_splines",
+                    helpers.closure_unc_helper_A.tensor_axes,
                 )
-                results.append(nominal_muonScaleClosASyst_responseWeights)
 
                 # extra uncertainties for M (fully correlated)
                 df = df.Define(
                     "muonScaleClosMSyst_responseWeights_tensor_splines",
-                    closure_unc_helper_M,
+                    helpers.closure_unc_helper_M,
                     [*input_kinematics, "nominal_weight"],
                 )
-                nominal_muonScaleClosMSyst_responseWeights = df.HistoBoost(
+                muon_scale_fill.add(
                     "nominal_muonScaleClosMSyst_responseWeights",
-                    axes,
-                    [*cols, "muonScaleClosMSyst_responseWeights_tensor_splines"],
-                    tensor_axes=closure_unc_helper_M.tensor_axes,
-                    storage=hist.storage.Double(),
+                    "muonScaleClosMSyst_responseWeights_tensor_splines",
+                    helpers.closure_unc_helper_M.tensor_axes,
                 )
-                results.append(nominal_muonScaleClosMSyst_responseWeights)
+
+                df = muon_scale_fill.book(df, results)
+                # the parts are the same for all datasets, keep one to split the outputs
+                combined_fills[muon_scale_fill.name] = muon_scale_fill
 
             ####################################################
 
@@ -2126,6 +2242,53 @@ def build_graph(df, dataset):
     return results, weightsum
 
 
+# histograms filled together by CombinedTensorFill, split after the event loop
+combined_fills = {}
+
+if args.skim and not args.xnormOnly:
+    # the options defining the preselection, the skims are made again if any of them changes
+    # ('smearing' is not an option of all parsers, but selects the bias calibration when set)
+    skim_options = {
+        k: getattr(args, k, None)
+        for k in [
+            "era",
+            "pt",
+            "muonCorrData",
+            "muonCorrMC",
+            "noSmearing",
+            "smearing",
+            "biasCalibration",
+            "vetoRecoPt",
+            "vetoRecoEta",
+            "useGlobalOrTrackerVeto",
+            "trackerMuons",
+            "selectNonPromptFromSV",
+            "selectNonPromptFromLightMesonDecay",
+            "requirePixelHits",
+            "makeMCefficiency",
+            "noTrigger",
+        ]
+    }
+    skims = skim_tools.SkimCache(
+        skim_options,
+        branches=[*skim_tools.default_branches, *args.skimBranches],
+        # the calibration, smearing and bias helpers of the preselection read their inputs from these directories
+        input_files=skim_tools.input_files(common.calib_dir, common.closure_dir),
+        directory=args.skimDir,
+    )
+    # histograms at generator level are filled with all events of the signal when unfolding
+    skim_datasets = [
+        d
+        for d in datasets
+        if not (
+            (args.unfolding or args.theoryAgnostic)
+            and d.name in ["WplusmunuPostVFP", "WminusmunuPostVFP"]
+        )
+    ]
+    skims.use_skims(skim_datasets, preselection)
+else:
+    skims = None
+
 if args.sequentialEventLoops:
     dataset_sets = [[dataset] for dataset in datasets]
 else:
@@ -2133,6 +2296,13 @@ else:
 
 for loop_datasets in dataset_sets:
     resultdict = narf.build_and_run(loop_datasets, build_graph)
+    if skims is not None:
+        skims.restore_weight_sums(resultdict)
+    unflatten_global_bin_hists(resultdict)
+    for combined_fill in combined_fills.values():
+        combined_fill.split_hists(resultdict)
+    if "recoilHelper" in helpers.built():
+        helpers.recoilHelper.add_sketches_to_results(resultdict)
     if not args.onlyMainHistograms and args.muonScaleVariation == "smearingWeightsGaus":
         logger.debug("Apply smearingWeights")
         muon_calibration.transport_smearing_weights_to_reco(
@@ -1,11 +1,13 @@
 import os
 
+import awkward as ak
 import hist
 import numpy as np
 
 import narf
 from utilities import common, differential, parsing
 from wremnants import (
+    columnar_tools,
     helicity_utils,
     syst_tools,
     theory_corrections,
@@ -90,6 +92,17 @@ parser.add_argument(
     action="store_true",
     help="Use 1 GeV binning for ptVgen (e.g., for theory corrections)",
 )
+parser.add_argument(
+    "--columnar",
+    action="store_true",
+    help="Fill the histograms with the columnar (uproot+numpy) backend instead of RDataFrame, processing files in parallel with --nThreads processes. The EW histograms (requires --skipEWHists), some options and the powheg datasets are not supported",
+)
+parser.add_argument(
+    "--columnarStepSize",
+    type=str,
+    default="200 MB",
+    help="Size of the chunks read at once by the columnar backend",
+)
 
 parser = parsing.set_parser_default(parser, "filterProcs", common.vprocs)
 args = parser.parse_args()
@@ -101,6 +114,30 @@ args = parser.parse_args()
 
 logger = logging.setup_logger(__file__, args.verbose, args.noColorLogger)
 
+if args.columnar:
+    unsupported = [
+        opt
+        for opt in [
+            "theoryCorrections",
+            "fiducial",
+            "singleLeptonHists",
+            "addHelicityAxis",
+            "addCharmAxis",
+            "helicity",
+            "propagatePDFstoHelicity",
+            "auxiliaryHistograms",
+        ]
+        if getattr(args, opt)
+    ]
+    if unsupported:
+        raise NotImplementedError(
+            f"Options {unsupported} are not supported with the columnar backend"
+        )
+    if not args.skipEWHists:
+        raise NotImplementedError(
+            "The EW histograms are not produced by the columnar backend, run it with --skipEWHists"
+        )
+
 datasets = getDatasets(
     maxFiles=args.maxFiles,
     filt=args.filterProcs,
@@ -113,6 +150,13 @@ datasets = getDatasets(
 
 logger.debug(f"Will process samples {[d.name for d in datasets]}")
 
+if args.columnar:
+    unsupported = [d.name for d in datasets if "powheg" in d.name]
+    if unsupported:
+        raise NotImplementedError(
+            f"Datasets {unsupported} without pre-FSR leptons are not supported with the columnar backend"
+        )
+
 axis_ygen = hist.axis.Regular(10, -5.0, 5.0, name="y")
 col_rapidity = "yVgen" if args.signedY else "absYVgen"
 
@@ -142,23 +186,8 @@ theory_corrs = [*args.theoryCorr, *args.ewTheoryCorr]
 corr_helpers = theory_corrections.load_corr_helpers(common.vprocs, theory_corrs)
 
 
-def build_graph(df, dataset):
-    logger.info("build graph")
-    logger.info(dataset.name)
-    results = []
-
-    if dataset.is_data:
-        raise RuntimeError("Running GEN analysis over data is not supported")
-
-    isW = dataset.name.startswith("W") and dataset.name[1] not in [
-        "W",
-        "Z",
-    ]  # in common.wprocs
-    isZ = dataset.name.startswith("Z") and dataset.name[1] not in [
-        "W",
-        "Z",
-    ]  # in common.zprocs
-
+def make_nominal_axes(dataset_name, isZ):
+    unfolding_selections = None
     if args.addCharmAxis:
         axis_massWgen = hist.axis.Variable(
             [4.0, 13000.0], name="massVgen", underflow=True, overflow=False
@@ -171,7 +200,7 @@ def build_graph(df, dataset):
     axis_massZgen = hist.axis.Regular(12, 60.0, 120.0, name="massVgen")
 
     theoryAgnostic_axes, _ = differential.get_theoryAgnostic_axes(
-        ptV_flow=True, absYV_flow=True, wlike="Z" in dataset.name
+        ptV_flow=True, absYV_flow=True, wlike="Z" in dataset_name
     )
     axis_ptV_thag = theoryAgnostic_axes[0]
     axis_yV_thag = theoryAgnostic_axes[1]
@@ -244,23 +273,6 @@ def build_graph(df, dataset):
 
     axis_rapidity = axis_ygen if args.signedY else axis_absYVgen
 
-    weight_expr = "std::copysign(1.0, genWeight)"
-
-    if "reweight_h2" in dataset.name:
-        weight_expr = f"{weight_expr}*H2BugFixWeight[0]"
-    elif "NNLOPS" in dataset.name:
-        weight_expr = f"{weight_expr}*LHEScaleWeightAltSet1[4]"
-
-    df = df.Define("weight", weight_expr)
-    df = df.DefinePerSample("unity", "1.")
-    # This sum should happen before any change of the weight
-    weightsum = df.SumAndCount("weight")
-    df = df.Define("isEvenEvent", "event % 2 == 0")
-
-    df = theory_tools.define_theory_weights_and_corrs(
-        df, dataset.name, corr_helpers, args
-    )
-
     if isZ:
         nominal_axes = [
             axis_massZgen,
@@ -283,6 +295,47 @@ def build_graph(df, dataset):
         "chargeVgen",
     ]
 
+    return nominal_axes, nominal_cols, unfolding_selections
+
+
+def build_graph(df, dataset):
+    logger.info("build graph")
+    logger.info(dataset.name)
+    results = []
+
+    if dataset.is_data:
+        raise RuntimeError("Running GEN analysis over data is not supported")
+
+    isW = dataset.name.startswith("W") and dataset.name[1] not in [
+        "W",
+        "Z",
+    ]  # in common.wprocs
+    isZ = dataset.name.startswith("Z") and dataset.name[1] not in [
+        "W",
+        "Z",
+    ]  # in common.zprocs
+
+    weight_expr = "std::copysign(1.0, genWeight)"
+
+    if "reweight_h2" in dataset.name:
+        weight_expr = f"{weight_expr}*H2BugFixWeight[0]"
+    elif "NNLOPS" in dataset.name:
+        weight_expr = f"{weight_expr}*LHEScaleWeightAltSet1[4]"
+
+    df = df.Define("weight", weight_expr)
+    df = df.DefinePerSample("unity", "1.")
+    # This sum should happen before any change of the weight
+    weightsum = df.SumAndCount("weight")
+    df = df.Define("isEvenEvent", "event % 2 == 0")
+
+    df = theory_tools.define_theory_weights_and_corrs(
+        df, dataset.name, corr_helpers, args
+    )
+
+    nominal_axes, nominal_cols, unfolding_selections = make_nominal_axes(
+        dataset.name, isZ
+    )
+
     if args.addCharmAxis:
         axis_charm = hist.axis.Regular(
             2, -0.5, 1.5, underflow=False, overflow=False, name="charm"
@@ -891,7 +944,324 @@ def build_graph(df, dataset):
     return results, weightsum
 
 
-resultdict = narf.build_and_run(datasets, build_graph)
+columnar_branches = [
+    "genWeight",
+    "H2BugFixWeight",
+    "LHEScaleWeightAltSet1",
+    "LHEScaleWeight",
+    "GenPart_status",
+    "GenPart_statusFlags",
+    "GenPart_pdgId",
+    "GenPart_genPartIdxMother",
+    "GenPart_pt",
+    "GenPart_eta",
+    "GenPart_phi",
+    "GenPart_mass",
+    "LHEPart_status",
+    "LHEPart_pdgId",
+    "LHEPart_pt",
+    "LHEPart_eta",
+    "LHEPart_phi",
+    "LHEPart_mass",
+    "LHEPdfWeight",
+    "LHEReweightingWeight",
+    "MEParamWeight",
+    "MEParamWeightAltSet1",
+    "MEParamWeightAltSet4",
+    *set(theory_tools.pdfMap[pdf]["branch"] for pdf in args.pdfs),
+    *set(
+        p.split("[")[0]
+        for pdf in args.pdfs
+        for p in theory_tools.pdfMap[pdf].get("alphas", [])
+    ),
+]
+
+
+def fill_columnar(arrays, dataset, hists):
+    # columnar equivalent of build_graph for the nominal and theory histograms
+    isZ = dataset.name.startswith("Z") and dataset.name[1] not in ["W", "Z"]
+    nominal_axes, nominal_cols, _ = make_nominal_axes(dataset.name, isZ)
+
+    def fill(name, axes, cols, weight, tensor_axes=[], storage=hist.storage.Double()):
+        if name not in hists:
+            hists[name] = hist.Hist(*axes, *tensor_axes, storage=storage, name=name)
+        columnar_tools.fill_hist(hists[name], [cols_map[c] for c in cols], weight)
+
+    weight = np.copysign(1.0, ak.to_numpy(arrays["genWeight"]))
+    if "reweight_h2" in dataset.name:
+        weight = weight * ak.to_numpy(arrays["H2BugFixWeight"][:, 0])
+    elif "NNLOPS" in dataset.name:
+        weight = weight * ak.to_numpy(arrays["LHEScaleWeightAltSet1"][:, 4])
+
+    cols_map = columnar_tools.prefsr_vars(arrays)
+    truncate = 10.0
+
+    central_pdf_weight = np.ones_like(weight)
+    pdf_infos = []
+    for pdf in args.pdfs:
+        try:
+            pdf_infos.append(theory_tools.pdf_info_map(dataset.name, pdf))
+        except ValueError:
+            break
+    if pdf_infos and pdf_infos[0]["branch"] in arrays.fields:
+        first_entry = pdf_infos[0].get("first_entry", 0)
+        central_pdf_weight = np.clip(
+            ak.to_numpy(arrays[pdf_infos[0]["branch"]][:, first_entry]),
+            -truncate,
+            truncate,
+        )
+    nominal_weight = weight * central_pdf_weight
+
+    fill(
+        "nominal_gen",
+        nominal_axes,
+        nominal_cols,
+        nominal_weight,
+        storage=hist.storage.Weight(),
+    )
+
+    if (
+        "horace" in dataset.name
+        or "winhac" in dataset.name
+        or "LHEScaleWeight" not in arrays.fields
+        or "LHEPdfWeight" not in arrays.fields
+        or not pdf_infos
+    ):
+        return weight
+
+    scale_axes, scale_cols = nominal_axes, nominal_cols
+    if "ptVgen" not in scale_cols:
+        scale_axes = [
+            *scale_axes,
+            hist.axis.Variable(common.ptV_binning, name="ptVgen", underflow=False),
+        ]
+        scale_cols = [*scale_cols, "ptVgen"]
+
+    scale_tensor = columnar_tools.scale_tensor(
+        columnar_tools.to_numpy_2d(arrays["LHEScaleWeight"], stop=9), truncate
+    )
+    fill(
+        "nominal_gen_qcdScale",
+        scale_axes,
+        scale_cols,
+        nominal_weight[:, np.newaxis, np.newaxis] * scale_tensor,
+        tensor_axes=theory_tools.scale_tensor_axes,
+    )
+
+    for i, pdfInfo in enumerate(pdf_infos):
+        pdfName = pdfInfo["name"]
+        if pdfInfo["branch"] not in arrays.fields:
+            break
+        entries = 1 if i != 0 and args.altPdfOnlyCentral else pdfInfo["entries"]
+        start = pdfInfo.get("first_entry", 0)
+        pdf_weights = columnar_tools.to_numpy_2d(
+            arrays[pdfInfo["branch"]], start, start + entries
+        )
+        if pdfInfo.get("renorm", False):
+            pdf_weights = (
+                np.clip(pdf_weights / pdf_weights[:, :1], -truncate, truncate)
+                * nominal_weight[:, np.newaxis]
+            )
+        else:
+            pdf_weights = (nominal_weight / central_pdf_weight)[
+                :, np.newaxis
+            ] * np.clip(pdf_weights, -truncate, truncate)
+        if pdfName == "pdfMSHT20":
+            pdf_weights[:, 15] = pdf_weights[:, 0] - (
+                pdf_weights[:, 15] - pdf_weights[:, 0]
+            )
+
+        names = getattr(
+            theory_tools,
+            f"pdfNames{'Sym' if pdfInfo['combine'] == 'symHessian' else 'Asym'}Hessian",
+        )(pdfInfo["entries"], pdfName)
+        fill(
+            f"nominal_gen_{pdfName}",
+            nominal_axes,
+            nominal_cols,
+            pdf_weights,
+            tensor_axes=[hist.axis.StrCategory(names, name="pdfVar")],
+        )
+
+        if "alphas" in pdfInfo:
+            as_weights = np.stack(
+                [
+                    ak.to_numpy(arrays[p.split("[")[0]][:, int(p.split("[")[1][:-1])])
+                    for p in pdfInfo["alphas"]
+                ],
+                axis=-1,
+            )
+            as_weights = np.clip(
+                (nominal_weight / central_pdf_weight)[:, np.newaxis] * as_weights,
+                -truncate,
+                truncate,
+            )
+            asr = pdfInfo["alphasRange"]
+            fill(
+                f"nominal_gen_{pdfName}alphaS{asr}",
+                nominal_axes,
+                nominal_cols,
+                as_weights,
+                tensor_axes=[
+                    hist.axis.StrCategory(
+                        ["as0118"]
+                        + (
+                            ["as0117", "as0119"]
+                            if asr == "001"
+                            else ["as0116", "as0120"]
+                        ),
+                        name="alphasVar",
+                    )
+                ],
+            )
+
+    if "MEParamWeight" in arrays.fields:
+        # mass, width and sin2theta weights as in syst_tools.define_mass_width_sin2theta_weights
+        m0, gamma0, massvals, widthvals, sin2thetavals = (
+            syst_tools.mass_width_sin2theta_values(dataset.name)
+        )
+        nmass, nwidth = len(massvals), len(widthvals)
+
+        def param_weights(branch, start, stop):
+            if branch in arrays.fields:
+                return columnar_tools.to_numpy_2d(arrays[branch], 0, stop - start)
+            return columnar_tools.to_numpy_2d(
+                arrays["LHEReweightingWeight"], start, stop
+            )
+
+        mass_weights = param_weights("MEParamWeight", 0, nmass).astype(np.float64)
+        width_weights = param_weights(
+            "MEParamWeightAltSet1", nmass, nmass + nwidth
+        ).astype(np.float64)
+        proc = dataset.name[0]
+        mass_axis = hist.axis.StrCategory(
+            syst_tools.massWeightNames(proc=dataset.name), name="massShift"
+        )
+        fill(
+            f"nominal_gen_massWeight{proc}",
+            nominal_axes,
+            nominal_cols,
+            nominal_weight[:, np.newaxis] * mass_weights,
+            tensor_axes=[mass_axis],
+        )
+        fill(
+            f"nominal_gen_massWeight_widthdecor{proc}",
+            nominal_axes,
+            nominal_cols,
+            nominal_weight[:, np.newaxis]
+            * columnar_tools.mass_weight_width_decor(
+                mass_weights, width_weights, m0, gamma0, massvals, widthvals
+            ),
+            tensor_axes=[mass_axis],
+        )
+        fill(
+            f"nominal_gen_widthWeight{proc}",
+            nominal_axes,
+            nominal_cols,
+            nominal_weight[:, np.newaxis] * width_weights,
+            tensor_axes=[
+                hist.axis.StrCategory(
+                    syst_tools.widthWeightNames(proc=dataset.name), name="width"
+                )
+            ],
+        )
+        if dataset.name in common.zprocs_all:
+            start = nmass + nwidth
+            sin2theta_weights = param_weights(
+                "MEParamWeightAltSet4", start, start + len(sin2thetavals)
+            ).astype(np.float64)
+            fill(
+                f"nominal_gen_sin2thetaWeight{proc}",
+                nominal_axes,
+                nominal_cols,
+                nominal_weight[:, np.newaxis] * sin2theta_weights,
+                tensor_axes=[
+                    hist.axis.StrCategory(
+                        syst_tools.sin2thetaWeightNames(proc=dataset.name),
+                        name="sin2theta",
+                    )
+                ],
+            )
+
+    moments = columnar_tools.cs_angular_moments(cols_map["csSineCosThetaPhigen"])
+    fill(
+        "nominal_gen_helicity_xsecs_scale",
+        nominal_axes,
+        nominal_cols,
+        nominal_weight[:, np.newaxis, np.newaxis, np.newaxis]
+        * moments[:, :, np.newaxis, np.newaxis]
+        * scale_tensor[:, np.newaxis, :, :],
+        tensor_axes=[helicity_utils.axis_helicity, *theory_tools.scale_tensor_axes],
+        storage=hist.storage.Weight(),
+    )
+    if nominal_cols == ["massVgen", "absYVgen", "ptVgen", "chargeVgen"]:
+        cols_map.update(columnar_tools.lhe_vars(arrays))
+        for var, statusMin, statusMax in [
+            ("hardProcess", 21, 29),
+            ("postShower", 21, 59),
+            ("postBeamRemnants", 21, 69),
+        ]:
+            cols_map.update(
+                columnar_tools.intermediate_gen_vars(
+                    arrays, var, statusMin, statusMax, cols_map
+                )
+            )
+        for var in ["lhe", "hardProcess", "postShower", "postBeamRemnants"]:
+            moments_var = columnar_tools.cs_angular_moments(
+                cols_map[f"csSineCosThetaPhi{var}"]
+            )
+            fill(
+                f"nominal_gen_helicity_xsecs_scale_{var}",
+                nominal_axes,
+                [f"massV{var}", f"absYV{var}", f"ptV{var}", f"chargeV{var}"],
+                nominal_weight[:, np.newaxis, np.newaxis, np.newaxis]
+                * moments_var[:, :, np.newaxis, np.newaxis]
+                * scale_tensor[:, np.newaxis, :, :],
+                tensor_axes=[
+                    helicity_utils.axis_helicity,
+                    *theory_tools.scale_tensor_axes,
+                ],
+                storage=hist.storage.Weight(),
+            )
+
+        fill(
+            "nominal_gen_helicity",
+            nominal_axes[1:],
+            nominal_cols[1:],
+            nominal_weight[:, np.newaxis] * moments,
+            tensor_axes=[helicity_utils.axis_helicity],
+            storage=hist.storage.Weight(),
+        )
+
+        theoryAgnostic_axes, _ = differential.get_theoryAgnostic_axes(
+            ptV_flow=True, absYV_flow=True, wlike="Z" in dataset.name
+        )
+        fill(
+            "nominal_gen_yieldsTheoryAgnostic",
+            [*nominal_axes[1:], *theoryAgnostic_axes[:2]],
+            [*nominal_cols[1:], "ptVgen", "absYVgen"],
+            columnar_tools.helicity_helicity_tensor(
+                nominal_weight[:, np.newaxis] * moments
+            ),
+            tensor_axes=[
+                helicity_utils.axis_helicity,
+                helicity_utils.axis_helicity_multidim,
+            ],
+        )
+
+    return weight
+
+
+if args.columnar:
+    resultdict = columnar_tools.build_and_run(
+        datasets,
+        columnar_branches,
+        fill_columnar,
+        nproc=args.nThreads,
+        step_size=args.columnarStepSize,
+    )
+else:
+    resultdict = narf.build_and_run(datasets, build_graph)
 write_analysis_output(
     resultdict, f"{os.path.basename(__file__).replace('py', 'hdf5')}", args
 )
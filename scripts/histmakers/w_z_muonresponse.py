@@ -80,9 +80,7 @@ if args.testHelpers:
         f"{common.data_dir}/calibration/muon_response.tflite"
     )
 
-    smearing_helper_simple = ROOT.wrem.SmearingHelperSimple(
-        sigmarel, ROOT.ROOT.GetThreadPoolSize()
-    )
+    smearing_helper_simple = ROOT.wrem.SmearingHelperSimple(sigmarel)
     smearing_helper_simple_weights = ROOT.wrem.SmearingHelperSimpleWeight(sigmarel)
     smearing_helper_simple_transform = ROOT.wrem.SmearingHelperSimpleTransform(sigmarel)
     scale_helper_simple_weights = ROOT.wrem.ScaleHelperSimpleWeight(scalerel)
@@ -392,10 +390,13 @@ def build_graph(df, dataset):
                 ],
             )
 
-            df = df.DefineSlot(
+            df = df.Define(
                 "selMuons_smearedPt",
                 smearing_helper_simple,
                 [
+                    "run",
+                    "luminosityBlock",
+                    "event",
                     "selMuons_correctedPt",
                     "selMuons_correctedEta",
                     "selMuons_correctedCharge",
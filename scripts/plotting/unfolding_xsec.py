@@ -9,7 +9,7 @@ import numpy as np
 import pandas as pd
 
 from utilities import parsing
-from utilities.io_tools import conversion_tools, output_tools
+from utilities.io_tools import conversion_tools, output_tools, yield_tools
 from utilities.styles import styles
 from wremnants import plot_tools
 from wremnants.datasets.datagroups import Datagroups
@@ -255,7 +255,8 @@ def make_yields_df(
     else:
 
         def sum_and_unc(h, scale=100 if percentage else 1):
-            return (sum(h.values()) * scale, np.sqrt(sum(h.variances()) * scale))
+            value, variance = yield_tools.hist_yield(h)
+            return (value * scale, np.sqrt(variance * scale))
 
     if per_bin:
         entries = [(i, v[0], v[1]) for i, v in enumerate(zip(*sum_and_unc(hists[0])))]
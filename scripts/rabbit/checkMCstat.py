@@ -15,6 +15,7 @@ args = sys.argv[:]
 sys.argv = ["-b"]
 import ROOT
 
+from utilities import job_tools
 from wums import logging
 
 logger = logging.child_logger(__name__)
@@ -97,6 +98,18 @@ if __name__ == "__main__":
         action="store_true",
         help="Do not execute commands, just print them",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of cores used to run the fits for the different event counts in parallel",
+    )
+    parser.add_argument(
+        "--noCache",
+        action="store_true",
+        help="Rerun all steps, by default steps whose command and input files did not change since the last successful run are skipped",
+    )
 
     args = parser.parse_args()
 
@@ -141,6 +154,12 @@ if __name__ == "__main__":
         "pseudodataHist": "{h}_{d}".format(h=histName, d=dataName),
     }
 
+    graph = job_tools.JobGraph(
+        ncores=args.jobs,
+        cache_dir=None if args.noCache else outdir + "/jobs/cache/",
+        log_dir=outdir + "/jobs/logs/",
+    )
+
     eventsForTest = [math.pow(100, i) for i in range(1, 6)]
     for i, nEvts in enumerate(eventsForTest):
         hdata = ROOT.TH1D(
@@ -187,17 +206,30 @@ if __name__ == "__main__":
                 i=cardName
             )
         )
-        safeSystem(txt2hdf5Cmd, dryRun=args.dryRun)
-
         hdf5 = cardName.replace(".txt", ".hdf5")
-        combineCmd = "combinetf.py -t -1 --binByBinStat {hdf5} --doImpacts --saveHists --computeHistErrors --doh5Output --postfix bbb1 --outputDir {fd}".format(
-            hdf5=hdf5, fd=fdir
-        )
-        print("\n### Fit with BBB")
-        safeSystem(combineCmd, dryRun=args.dryRun)
-        combineCmd = "combinetf.py -t -1 {hdf5} --doImpacts --saveHists --computeHistErrors --doh5Output --postfix bbb0 --outputDir {fd}".format(
-            hdf5=hdf5, fd=fdir
+        jobText2hdf5 = graph.add(
+            f"text2hdf5_{int(nEvts)}",
+            txt2hdf5Cmd,
+            inputs=[cardName, fname],
+            outputs=[hdf5],
+            dry_run=args.dryRun,
         )
-        print("\n### Fit without BBB")
-        safeSystem(combineCmd, dryRun=args.dryRun)
-        print("\n\n")
+
+        # fit with and without BBB
+        for bbb in [1, 0]:
+            combineCmd = "combinetf.py -t -1 {opt}{hdf5} --doImpacts --saveHists --computeHistErrors --doh5Output --postfix bbb{b} --outputDir {fd}".format(
+                opt="--binByBinStat " if bbb else "", hdf5=hdf5, b=bbb, fd=fdir
+            )
+            graph.add(
+                f"fit_bbb{bbb}_{int(nEvts)}",
+                combineCmd,
+                deps=[jobText2hdf5],
+                inputs=[hdf5],
+                # the fit is rerun if its result was removed
+                outputs=[f"{fdir}/fitresults_123456789_bbb{bbb}.hdf5"],
+                dry_run=args.dryRun,
+            )
+
+    if not graph.run():
+        logger.error("Some fits failed, see the logs in {d}".format(d=graph.log_dir))
+        sys.exit(1)
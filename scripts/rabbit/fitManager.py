@@ -9,9 +9,16 @@
 # single charge (can select a single charge as -c plus, otherwise both are done in sequence)
 #
 # python WRemnants/scripts/combine/fitManager.py -i /scratch/mciprian/CombineStudies/Wmass/abseta1p0/qcdScale_byPt/  -c "plus,minus" --fit-single-charge [--skip-fit-data]
+#
+# single charge fits and combination together, running independent steps in parallel on 32 cores with 4 threads per fit
+#
+# python WRemnants/scripts/combine/fitManager.py -i /scratch/mciprian/CombineStudies/Wmass/abseta1p0/qcdScale_byPt/  --fit-single-charge --comb -j 32 --threads-per-fit 4
+#
+# steps with unchanged commands and inputs are not rerun (use --no-cache to force it), logs are written into <input>/<card-folder>/jobs/logs/
 
 import argparse
 import os
+import re
 
 ## safe batch mode
 import sys
@@ -24,6 +31,9 @@ sys.argv = args
 ROOT.gROOT.SetBatch(True)
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 
+from utilities import job_tools
+from wums import logging
+
 
 def safeSystem(cmd, dryRun=False, quitOnFail=True):
     print(cmd)
@@ -43,18 +53,29 @@ def safeSystem(cmd, dryRun=False, quitOnFail=True):
         return 0
 
 
+def fitResultsFile(cmd, outdir, postfix):
+    # file written by combinetf.py, named after the seed of the fit (123456789 unless set with --seed)
+    seed = re.search(r"--seed\s+(\d+)", cmd)
+    seed = seed.group(1) if seed else "123456789"
+    return os.path.join(outdir, f"fitresults_{seed}_{postfix}.root")
+
+
 def createFolder(checkdir, dryRun=False):
     if not os.path.exists(checkdir):
         print("Creating folder", checkdir)
         safeSystem("mkdir -p " + checkdir, dryRun=dryRun)
 
 
-def prepareChargeFit(options, charges=["plus"]):
+def prepareChargeFit(options, graph, charges=["plus"], fitSingleCharge=None):
+    # add the jobs to make the card, the hdf5 input and the fits for the given charges to the job graph
+    if fitSingleCharge is None:
+        fitSingleCharge = options.fitSingleCharge
 
     cardSubfolderFullName = options.inputdir + options.cardFolder
     postfix = options.postfix
     cardkeyname = "card"
-    if options.fitSingleCharge:
+    jobkeyname = "_".join(charges)
+    if fitSingleCharge:
         # this cardkeyname is needed only when a single datacard for a given charge is different from those that would be used
         # for the combination (e.g. because to facilitate the combination some lines that require both charges are
         # added to the datacard for a specific charge)
@@ -97,7 +118,7 @@ def prepareChargeFit(options, charges=["plus"]):
 
     ### prepare the combineCards and txt2hdf5 commands
     if sum([os.path.exists(card) for card in datacards]) == len(datacards):
-        if options.fitSingleCharge:
+        if fitSingleCharge:
             print("I am going to run fit for single charge {ch}".format(ch=charges[0]))
         else:
             print("I found the cards for W+ and W-. Combining them now...")
@@ -115,15 +136,14 @@ def prepareChargeFit(options, charges=["plus"]):
             combinedCard=combinedCard,
         )
         ## run the commands: need cmsenv in the combinetf release
-        print
-        print
-        if args.skip_card:
-            safeSystem(ccCmd, dryRun=True)
-            print("Unmodified combined card in ", combinedCard)
-        else:
-            safeSystem(ccCmd, dryRun=options.dryRun)
-            print("New combined card in ", combinedCard)
-        print
+        jobCard = graph.add(
+            f"card_{jobkeyname}",
+            ccCmd,
+            inputs=datacards,
+            outputs=[combinedCard],
+            dry_run=args.skip_card or options.dryRun,
+        )
+        print("Combined card in ", combinedCard)
 
         if options.doOnlyCard:
             return
@@ -155,19 +175,21 @@ def prepareChargeFit(options, charges=["plus"]):
                 + str(options.clipSystVariationsSignal)
             )
 
-        print
-        if options.skip_text2hdf5:
-            print(txt2hdf5Cmd)
-        else:
-            print("Running text2hdf5.py, it might take time ...")
-            safeSystem(txt2hdf5Cmd, dryRun=options.dryRun)
-
         metafilename = combinedCard.replace(".txt", ".hdf5")
         if args.theoryAgnostic:
             metafilename = metafilename.replace(".hdf5", "_sparse.hdf5")
         if len(postfix):
             metafilename = metafilename.replace(".hdf5", "_%s.hdf5" % postfix)
 
+        jobText2hdf5 = graph.add(
+            f"text2hdf5_{jobkeyname}",
+            txt2hdf5Cmd,
+            deps=[jobCard],
+            inputs=[combinedCard],
+            outputs=[metafilename],
+            dry_run=options.skip_text2hdf5 or options.dryRun,
+        )
+
         bbboptions = " --binByBinStat "
         globImpTag = ""
         if not options.noCorrelateXsecStat:
@@ -205,39 +227,35 @@ def prepareChargeFit(options, charges=["plus"]):
             if options.noBBB
             else "1_cxs0" if options.noCorrelateXsecStat else "1_cxs1"
         )
-        combineCmd_data = (
-            combineCmd_data
-            + " --postfix Data{pf}_bbb{b}{git} --outputDir {od} ".format(
-                pf=fitPostfix, od=fitdir_data, b=bbbtext, git=globImpTag
+        # the fits are independent of each other and run in parallel
+        for fitname, cmd, fitdir, tag, skip in [
+            ("data", combineCmd_data, fitdir_data, "Data", options.skipFitData),
+            (
+                "asimov",
+                combineCmd,
+                fitdir_Asimov,
+                "Asimov",
+                options.skipFitAsimov,
+            ),
+            ("toys", combineCmd_toys, fitdir_toys, "Toys", not options.toys),
+        ]:
+            fitPostfixFull = "{t}{pf}_bbb{b}{git}".format(
+                t=tag, pf=fitPostfix, b=bbbtext, git=globImpTag
             )
-        )
-        combineCmd_Asimov = (
-            combineCmd
-            + " --postfix Asimov{pf}_bbb{b}{git} --outputDir {od} ".format(
-                pf=fitPostfix, od=fitdir_Asimov, b=bbbtext, git=globImpTag
+            cmd += " --postfix {p} --outputDir {od} ".format(
+                p=fitPostfixFull, od=fitdir
             )
-        )
-        combineCmd_toys = (
-            combineCmd_toys
-            + " --postfix Toys{pf}_bbb{b}{git} --outputDir {od} ".format(
-                pf=fitPostfix, od=fitdir_toys, b=bbbtext, git=globImpTag
+            graph.add(
+                f"fit_{fitname}_{jobkeyname}",
+                cmd,
+                deps=[jobText2hdf5],
+                inputs=[metafilename],
+                # the fit is rerun if its result was removed
+                outputs=[fitResultsFile(cmd, fitdir, fitPostfixFull)],
+                threads=options.threadsPerFit,
+                retries=options.retries,
+                dry_run=options.skip_combinetf or skip or options.dryRun,
             )
-        )
-        if not options.skip_combinetf and not options.skipFitData:
-            safeSystem(combineCmd_data, dryRun=options.dryRun)
-        else:
-            print(combineCmd_data)
-        print
-        if not options.skip_combinetf and not options.skipFitAsimov:
-            safeSystem(combineCmd_Asimov, dryRun=options.dryRun)
-        else:
-            print(combineCmd_Asimov)
-        print
-        if not options.skip_combinetf and options.toys:
-            safeSystem(combineCmd_toys, dryRun=options.dryRun)
-        else:
-            print(combineCmd_toys)
-        print
 
     else:
         print("Warning, I couldn't find the following cards. Check names and paths")
@@ -246,8 +264,8 @@ def prepareChargeFit(options, charges=["plus"]):
                 print(card)
 
 
-def combineCharges(options):
-    prepareChargeFit(options, charges=["plus", "minus"])
+def combineCharges(options, graph):
+    prepareChargeFit(options, graph, charges=["plus", "minus"], fitSingleCharge=False)
 
 
 if __name__ == "__main__":
@@ -420,8 +438,50 @@ if __name__ == "__main__":
     parser.add_argument(
         "--globalImpacts", action="store_true", help="Use global impacts for combinetf"
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        default=1,
+        type=int,
+        help="Number of cores used to run independent steps (cards and fits for different charges, data/Asimov/toys fits) in parallel",
+    )
+    parser.add_argument(
+        "--threads-per-fit",
+        dest="threadsPerFit",
+        default=1,
+        type=int,
+        help="Number of cores used by each fit, out of the ones given with --jobs",
+    )
+    parser.add_argument(
+        "--retries",
+        dest="retries",
+        default=0,
+        type=int,
+        help="Number of times a failed fit is retried",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="noCache",
+        default=False,
+        action="store_true",
+        help="Rerun all steps, by default steps whose command and input files did not change since the last successful run are skipped",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        type=int,
+        default=3,
+        choices=[0, 1, 2, 3, 4],
+        help="Set verbosity level with logging, the larger the more verbose",
+    )
+    parser.add_argument(
+        "--noColorLogger", action="store_true", help="Do not use logging with colors"
+    )
     args = parser.parse_args()
 
+    logger = logging.setup_logger(__file__, args.verbose, args.noColorLogger)
+
     if not args.dryRun:
         try:
             cmssw = os.environ["CMSSW_BASE"]
@@ -466,14 +526,22 @@ if __name__ == "__main__":
         fcmd.write("%s\n\n" % " ".join(sys.argv))
         fcmd.close()
 
+    jobFolder = args.inputdir + (args.cardFolder if args.cardFolder else "")
+    graph = job_tools.JobGraph(
+        ncores=args.jobs,
+        cache_dir=None if args.noCache else jobFolder + "jobs/cache/",
+        log_dir=jobFolder + "jobs/logs/",
+    )
+
     fitCharges = ["plus", "minus"] if args.charge == "both" else [args.charge]
     if args.isDilepton:
         # fitCharges = ["inclusive"]
-        prepareChargeFit(args, charges=["inclusive"])
+        prepareChargeFit(args, graph, charges=["inclusive"])
+        success = graph.run()
         print("-" * 30)
         print("Done with dilepton 'inclusive'")
         print("-" * 30)
-        quit()
+        sys.exit(0 if success else 1)
 
     if not args.combineCharges and not args.fitSingleCharge:
         print(
@@ -481,26 +549,27 @@ if __name__ == "__main__":
         )
 
     if args.combineCharges:
-        if args.fitSingleCharge:
-            print(
-                "Error: options --fit-single-charge and --comb are incompatible. Abort"
-            )
-            quit()
         if len(fitCharges) != 2:
             print(
                 "Error: --comb requires two charges, use -C 'plus,minus' and try again"
             )
             quit()
 
+    # the single charge fits and the combination are independent and can run together
     if args.fitSingleCharge:
         for charge in fitCharges:
-            prepareChargeFit(args, charges=[charge])
-            print("-" * 30)
-            print("Done with charge {ch}".format(ch=charge))
-            print("-" * 30)
+            prepareChargeFit(args, graph, charges=[charge], fitSingleCharge=True)
 
     if args.combineCharges and len(fitCharges) == 2:
-        combineCharges(args)
-        print("-" * 30)
+        combineCharges(args, graph)
+
+    success = graph.run()
+    print("-" * 30)
+    if args.fitSingleCharge:
+        print("Done with charge(s) {ch}".format(ch=", ".join(fitCharges)))
+    if args.combineCharges:
         print("Done with charge combination")
-        print("-" * 30)
+    if not success:
+        print("Some steps failed, see the logs in {d}".format(d=graph.log_dir))
+    print("-" * 30)
+    sys.exit(0 if success else 1)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import argparse
+import gc
 import math
 
 import hist
@@ -9,6 +10,7 @@ import rabbit.debugdata
 import rabbit.io_tools
 from rabbit import tensorwriter
 from utilities import common, parsing
+from utilities.io_tools import rabbit_staging
 from wremnants import (
     combine_helpers,
     combine_theory_helper,
@@ -143,6 +145,15 @@ def make_parser(parser=None):
         action="store_true",
         help="Write out datacard in sparse mode",
     )
+    parser.add_argument(
+        "--stageSystematics",
+        type=str,
+        nargs="?",
+        const="",
+        default=None,
+        help="""Stream the systematic variations to a temporary HDF5 file (in the given directory, the default temporary directory if none is given)
+        while the inputs are processed and add them to the output only at the end, to reduce the peak memory for setups with many nuisances""",
+    )
     parser.add_argument(
         "--excludeProcGroups",
         type=str,
@@ -418,6 +429,12 @@ def make_parser(parser=None):
         choices=Regressor.polynomials,
         help="Type of polynomial for the smoothing of the application region or full prediction, depending on the smoothing mode",
     )
+    parser.add_argument(
+        "--fakeChunkSize",
+        type=int,
+        default=None,
+        help="Evaluate the fake estimate of systematic variations in chunks of this many bins along the variation axis, to limit the memory usage",
+    )
     parser.add_argument(
         "--ABCDedgesByAxis",
         type=str,
@@ -718,6 +735,18 @@ def make_parser(parser=None):
         default=".*",
         help="Regular expression for processes taken from pseudodata file (all other processes are automatically got from the nominal file). Data is excluded automatically as usual",
     )
+    parser.add_argument(
+        "--pseudoDataToys",
+        type=int,
+        default=0,
+        help="Number of poisson toys written in addition to each pseudodata set (from --pseudoData and --pseudoDataFakes)",
+    )
+    parser.add_argument(
+        "--pseudoDataToysSeed",
+        type=int,
+        default=42,
+        help="Random seed for the pseudodata toys",
+    )
     parser.add_argument(
         "--pseudoDataFakes",
         type=str,
@@ -1073,6 +1102,7 @@ def setup(
             integrate_x="mt" not in fitvar,
             forceGlobalScaleFakes=args.forceGlobalScaleFakes,
             abcdExplicitAxisEdges=abcdExplicitAxisEdges,
+            chunk_size=args.fakeChunkSize,
         )
         datagroups.set_histselectors(
             datagroups.getNames(), inputBaseName, **histselector_kwargs
@@ -1211,7 +1241,12 @@ def setup(
     signal_samples_forMass = ["signal_samples_inctau"]
 
     datagroups.writer = writer
+    datagroups.pseudodataToys = args.pseudoDataToys
+    datagroups.pseudodataToysSeed = args.pseudoDataToysSeed
 
+    # the pseudodata sets from different fake estimations share the same input histograms,
+    # read and sum them only once and only redo the fake estimation for each set
+    pseudodataGroupsFakes = None
     for pseudodata in args.pseudoDataFakes:
         if pseudodata in ["closure", "truthMC"]:
             pseudodataGroups = Datagroups(
@@ -1231,12 +1266,15 @@ def setup(
                 **histselector_kwargs,
             )
         else:
-            pseudodataGroups = Datagroups(
-                args.pseudoDataFile if args.pseudoDataFile else inputFile,
-                excludeGroups=excludeGroup,
-                filterGroups=filterGroup,
-            )
-            pseudodataGroups.fakerate_axes = args.fakerateAxes
+            if pseudodataGroupsFakes is None:
+                pseudodataGroupsFakes = Datagroups(
+                    args.pseudoDataFile if args.pseudoDataFile else inputFile,
+                    excludeGroups=excludeGroup,
+                    filterGroups=filterGroup,
+                )
+                pseudodataGroupsFakes.fakerate_axes = args.fakerateAxes
+                pseudodataGroupsFakes.enableRawHistCache()
+            pseudodataGroups = pseudodataGroupsFakes
 
         datagroups.addPseudodataHistogramFakes(pseudodata, pseudodataGroups)
     if args.pseudoData:
@@ -2623,6 +2661,10 @@ if __name__ == "__main__":
         systematic_type=args.systematicType,
         add_bin_by_bin_stat_to_data_cov=args.addMCStatToCovariance,
     )
+    if args.stageSystematics is not None:
+        writer = rabbit_staging.StagedTensorWriter(
+            writer, staging_dir=args.stageSystematics or None
+        )
 
     if args.fitresult is not None:
         # set data from external fitresult file
@@ -2734,6 +2776,13 @@ if __name__ == "__main__":
         outfile = "Combination"
     logger.info(f"Writing output to {outfile}")
 
+    if args.stageSystematics is not None:
+        # release the inputs before the staged systematics are added to the writer
+        del datagroups
+        if isUnfolding:
+            del datagroups_xnorm
+        gc.collect()
+
     writer.write(outfolder=outfolder, outfilename=outfile, args=args)
 
     logging.summary()
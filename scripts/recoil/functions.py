@@ -11,8 +11,10 @@ ROOT.gStyle.SetOptStat(0)
 ROOT.gStyle.SetOptTitle(0)
 
 import hist
+import numpy as np
 
 import narf
+from wremnants import regression
 from wums import boostHistHelpers as hh
 
 
@@ -108,6 +110,53 @@ def drange(x, y, jump):
         x += jump
 
 
+def getBinnedMeans(bhist):
+    """
+    Mean and uncertainty on the mean of the distribution along the last axis, for all bins of the other axes at once,
+    computed from the bin centers as TH1::GetMean and TH1::GetMeanError (flow bins excluded).
+    Returns the means, their uncertainties and the sum of weights, empty bins have mean and uncertainty 0
+    """
+    x = bhist.axes[-1].centers
+    values = bhist.values()
+    variances = bhist.variances()
+    if variances is None:
+        variances = values
+    sumw = values.sum(axis=-1)
+    sumw2 = variances.sum(axis=-1)
+    nonzero = sumw != 0
+    safe_sumw = np.where(nonzero, sumw, 1)
+    mean = (values * x).sum(axis=-1) / safe_sumw
+    rms2 = np.maximum((values * x**2).sum(axis=-1) / safe_sumw - mean**2, 0)
+    # effective number of entries
+    neff = np.divide(sumw**2, sumw2, out=np.zeros_like(sumw), where=sumw2 > 0)
+    err = np.sqrt(np.divide(rms2, neff, out=np.zeros_like(rms2), where=neff > 0))
+    return np.where(nonzero, mean, 0), np.where(nonzero, err, 0), sumw
+
+
+def fitPolynomial(x, y, yerr, order, xMin=-np.inf, xMax=np.inf):
+    """
+    Weighted least squares fit of a polynomial p0 + p1*x + ... to the points in [xMin, xMax],
+    points without uncertainty (e.g. empty bins) are not used.
+    Returns the parameters and their covariance
+    """
+    x, y, yerr = np.asarray(x), np.asarray(y), np.asarray(yerr)
+    mask = (x >= xMin) & (x <= xMax) & (yerr > 0)
+    X, XTY = regression.get_parameter_matrices(
+        x[mask], y[mask], 1.0 / yerr[mask], order
+    )
+    return regression.solve_leastsquare(X, XTY)
+
+
+def makeTH1(name, edges, values, errors=None):
+    # ROOT histogram from numpy arrays, for plotting
+    h = ROOT.TH1D(name, "", len(edges) - 1, array.array("d", edges))
+    for i, v in enumerate(values):
+        h.SetBinContent(i + 1, v)
+        if errors is not None:
+            h.SetBinError(i + 1, errors[i])
+    return h
+
+
 def readBoostHist(
     groups,
     hName,
@@ -1,5 +1,7 @@
 import argparse
+import concurrent.futures
 
+import numpy as np
 import ROOT
 
 ROOT.gROOT.SetBatch(True)
@@ -12,7 +14,7 @@ import plotter
 from wremnants.datasets import datagroups
 
 
-def makePlot(hist_data, hist_mc, fOut, xLabel, npv, outDir_):
+def makePlot(hist_data, hist_mc, fOut, xLabel, npv, outDir_, lumiHeader):
 
     hist_data.Scale(1.0 / hist_data.Integral())
     hist_mc.Scale(1.0 / hist_mc.Integral())
@@ -33,7 +35,7 @@ def makePlot(hist_data, hist_mc, fOut, xLabel, npv, outDir_):
         "ymax": 1e0,
         "xtitle": xLabel,
         "ytitle": "Events",
-        "topRight": lumi_header,
+        "topRight": lumiHeader,
         "topLeft": "#bf{CMS} #scale[0.7]{#it{Preliminary}}",
     }
 
@@ -170,6 +172,37 @@ def makePlot_fit(hist_data, hist_mc, fOut, xLabel, npv, outDir_):
     )
 
 
+def plotBin(edges, data, mc, fOut, xLabel, npv, outDir_, lumiHeader):
+    # build the histograms of one npv bin from the (values, variances) arrays and plot them, runs in a worker process
+    hist_data = functions.makeTH1(f"data_{fOut}", edges, data[0], np.sqrt(data[1]))
+    hist_mc = functions.makeTH1(f"mc_{fOut}", edges, mc[0], np.sqrt(mc[1]))
+    makePlot(hist_data, hist_mc, fOut, xLabel, npv, outDir_, lumiHeader)
+
+
+def makeGraph(x, y, yerr, color, marker):
+    g = ROOT.TGraphErrors(
+        len(x),
+        np.asarray(x, dtype=float),
+        np.asarray(y, dtype=float),
+        np.zeros(len(x)),
+        np.asarray(yerr, dtype=float),
+    )
+    g.SetLineColor(color)
+    g.SetMarkerStyle(marker)
+    g.SetMarkerSize(1)
+    g.SetMarkerColor(color)
+    return g
+
+
+def makeFitFunction(name, params):
+    fit = ROOT.TF1(name, "pol%d" % (len(params) - 1), 0, npv_max)
+    for iP, p in enumerate(params):
+        fit.SetParameter(iP, p)
+    fit.GetXaxis().SetRangeUser(0, npv_max)
+    fit.SetLineWidth(2)
+    return fit
+
+
 def met_xy_reweighting(
     direction="x",
     corrType="uncorr",
@@ -185,76 +218,79 @@ def met_xy_reweighting(
     outDir_ = "%s/%s" % (outDir, corrType)
     functions.prepareDir(outDir_, False)
 
+    # npv bins 1 ... npv_max-1
     h_data = functions.readBoostHist(
-        groups, f"met_{corrType}_{direction}_npv", [data], abcd=False
-    )
+        groups, f"met_{corrType}_{direction}_npv", [data], abcd=False, boost=True
+    )[: npv_max - 1]
     h_mc = functions.readBoostHist(
-        groups, f"met_{corrType}_{direction}_npv", procs, abcd=False
-    )
-
-    g_data = ROOT.TGraphErrors()
-    g_data.SetLineColor(ROOT.kBlack)
-    g_data.SetMarkerStyle(20)
-    g_data.SetMarkerSize(1)
-    g_data.SetMarkerColor(ROOT.kBlack)
-
-    g_mc = ROOT.TGraphErrors()
-    g_mc.SetLineColor(ROOT.kRed)
-    g_mc.SetMarkerStyle(21)
-    g_mc.SetMarkerSize(1)
-    g_mc.SetMarkerColor(ROOT.kRed)
+        groups, f"met_{corrType}_{direction}_npv", procs, abcd=False, boost=True
+    )[: npv_max - 1]
+
+    # means of all npv bins at once
+    npv = h_data.axes[0].centers
+    mean_data, mean_data_err, _ = functions.getBinnedMeans(h_data)
+    mean_mc, mean_mc_err, _ = functions.getBinnedMeans(h_mc)
+
+    if args.plotBins:
+        edges = h_data.axes[1].edges
+        data_vals = np.stack([h_data.values(), h_data.variances()], axis=1)
+        mc_vals = np.stack([h_mc.values(), h_mc.variances()], axis=1)
+        plots = [
+            (
+                edges,
+                data_vals[i],
+                mc_vals[i],
+                "npv_%d_%d_MET%s" % (n, n, direction),
+                "MET %s (GeV)" % direction,
+                n,
+                outDir_,
+                lumi_header,
+            )
+            for i, n in enumerate(npv.astype(int))
+        ]
+        if args.jobs > 1:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=args.jobs
+            ) as executor:
+                for f in [executor.submit(plotBin, *p) for p in plots]:
+                    f.result()
+        else:
+            for p in plots:
+                plotBin(*p)
 
     outDict = {"data": {"nom": []}, "mc": {"nom": []}}
-    for iBin in range(1, npv_max):
-
-        hist_data = h_data.ProjectionY("data_bin%d" % iBin, iBin, iBin)
-        hist_mc = h_mc.ProjectionY("mc_bin%d" % iBin, iBin, iBin)
-
-        mean_data, mean_data_err = hist_data.GetMean(), hist_data.GetMeanError()
-        mean_mc, mean_mc_err = hist_mc.GetMean(), hist_mc.GetMeanError()
-        print(iBin, mean_mc, mean_mc_err)
-
-        makePlot(
-            hist_data,
-            hist_mc,
-            "npv_%d_%d_MET%s" % (iBin, iBin, direction),
-            "MET %s (GeV)" % direction,
-            iBin,
-            outDir_,
-        )
-        # mean_data, mean_data_err, mean_mc, mean_mc_err = makePlot_fit(hist_data, hist_mc, "npv_%d_%d_MET%s" % (iBin, iBin, direction), "MET %s (GeV)" % direction, iBin, outDir_)
-
-        g_data.SetPoint(iBin - 1, iBin, mean_data)
-        g_data.SetPointError(iBin - 1, 0, mean_data_err)
-        g_mc.SetPoint(iBin - 1, iBin, mean_mc)
-        g_mc.SetPointError(iBin - 1, 0, mean_mc_err)
-
     if polyOrderData > 0:
-        fit_data = ROOT.TF1(
-            "fit_data_%s" % direction, "pol%d" % polyOrderData, 0, npv_max
+        params, cov = functions.fitPolynomial(
+            npv, mean_data, mean_data_err, polyOrderData, npv_fit_min, npv_fit_max
         )
-        result = g_data.Fit(fit_data.GetName(), "NSE", "", npv_fit_min, npv_fit_max)
-        fit_data.SetLineColor(ROOT.kBlack)
-        fit_data.GetXaxis().SetRangeUser(0, npv_max)
-        fit_data.SetLineWidth(2)
-        for iP in range(0, polyOrderData + 1):
-            outDict["data"]["nom"].append(fit_data.GetParameter(iP))
+        outDict["data"]["nom"] = params.tolist()
 
     if polyOrderMC > 0:
-        fit_mc = ROOT.TF1("fit_mc_%s" % direction, "pol%d" % polyOrderMC, 0, npv_max)
-        result = g_mc.Fit(fit_mc.GetName(), "NSE", "", npv_fit_min, npv_fit_max)
-        fit_mc.SetLineColor(ROOT.kRed)
-        fit_mc.SetLineStyle(ROOT.kDashed)
-        fit_mc.GetXaxis().SetRangeUser(0, npv_max)
-        fit_mc.SetLineWidth(2)
-        for iP in range(0, polyOrderMC + 1):
-            outDict["mc"]["nom"].append(fit_mc.GetParameter(iP))
+        params, cov = functions.fitPolynomial(
+            npv, mean_mc, mean_mc_err, polyOrderMC, npv_fit_min, npv_fit_max
+        )
+        outDict["mc"]["nom"] = params.tolist()
 
     outDict["data"]["xMin"] = npv_fit_min
     outDict["data"]["xMax"] = npv_fit_max
     outDict["mc"]["xMin"] = npv_fit_min
     outDict["mc"]["xMax"] = npv_fit_max
 
+    if args.noPlots:
+        return outDict
+
+    g_data = makeGraph(npv, mean_data, mean_data_err, ROOT.kBlack, 20)
+    g_mc = makeGraph(npv, mean_mc, mean_mc_err, ROOT.kRed, 21)
+
+    if polyOrderData > 0:
+        fit_data = makeFitFunction("fit_data_%s" % direction, outDict["data"]["nom"])
+        fit_data.SetLineColor(ROOT.kBlack)
+
+    if polyOrderMC > 0:
+        fit_mc = makeFitFunction("fit_mc_%s" % direction, outDict["mc"]["nom"])
+        fit_mc.SetLineColor(ROOT.kRed)
+        fit_mc.SetLineStyle(ROOT.kDashed)
+
     ## sigmas
     cfg = {
         "logy": False,
@@ -330,7 +366,26 @@ if __name__ == "__main__":
     parser.add_argument(
         "-s", "--save", action="store_true", help="Save to wremnants-data"
     )
+    parser.add_argument(
+        "--noPlots",
+        action="store_true",
+        help="Only derive the corrections, don't make any plots",
+    )
+    parser.add_argument(
+        "--plotBins",
+        action="store_true",
+        help="Plot the MET distributions of each npv bin",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes to make the plots of the npv bins",
+    )
     args = parser.parse_args()
+    if args.noPlots:
+        args.plotBins = False
 
     groups = datagroups.Datagroups(args.input)
     met, analysis, flavor, theory = functions.get_meta(groups)
@@ -1,5 +1,6 @@
 import argparse
 
+import numpy as np
 import ROOT
 
 ROOT.gROOT.SetBatch(True)
@@ -10,6 +11,11 @@ import functions
 
 from wremnants.datasets import datagroups
 
+
+def readVpt(groups, hName, procs):
+    return functions.readBoostHist(groups, hName, procs, boost=True)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--input", type=str, help="Input hdf5 file")
@@ -17,7 +23,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     groups = datagroups.Datagroups(args.input)
-    met, analysis, flavor = functions.get_meta(groups)
+    met, analysis, flavor, _ = functions.get_meta(groups)
     fOut = (
         f"wremnants-data/data/recoil/{analysis}_{met}/vptrw_{args.mode}_{flavor}.json"
     )
@@ -26,59 +32,37 @@ if __name__ == "__main__":
     if analysis == "lowPU":
 
         if args.mode == "mc_data":
-            h_source = functions.readBoostHist(
-                groups, "v_pt", ["Zmumu" if flavor == "mumu" else "Zee"]
-            )
-            h_target = functions.readBoostHist(groups, "v_pt", ["Data"])
-            h_bkgs = functions.readBoostHist(groups, "v_pt", ["Ztautau", "Other"])
-            h_target.Add(h_bkgs, -1)
-            vpt_bins = list(
-                functions.readBoostHist(
-                    groups, "v_pt", ["Zmumu" if flavor == "mumu" else "Zee"], boost=True
-                )
-                .axes[0]
-                .edges
-            )
+            h_source = readVpt(groups, "v_pt", ["Zmumu" if flavor == "mumu" else "Zee"])
+            h_target = readVpt(groups, "v_pt", ["Data"])
+            h_bkgs = readVpt(groups, "v_pt", ["Ztautau", "Other"])
 
     else:
         if args.mode == "mc_data":
-            h_source = functions.readBoostHist(groups, "v_pt", ["Zmumu"])
-            h_target = functions.readBoostHist(groups, "v_pt", ["Data"])
-            h_bkgs = functions.readBoostHist(groups, "v_pt", ["Ztautau", "Other"])
-            h_target.Add(h_bkgs, -1)
-            vpt_bins = list(
-                functions.readBoostHist(groups, "v_pt", ["Zmumu"], boost=True)
-                .axes[0]
-                .edges
-            )
+            h_source = readVpt(groups, "v_pt", ["Zmumu"])
+            h_target = readVpt(groups, "v_pt", ["Data"])
+            h_bkgs = readVpt(groups, "v_pt", ["Ztautau", "Other"])
 
         elif args.mode == "gen_data":
-            h_source = functions.readBoostHist(groups, "v_gen_pt", ["Zmumu"])
-            h_target = functions.readBoostHist(groups, "v_pt", ["Data"])
-            h_bkgs = functions.readBoostHist(groups, "v_pt", ["Ztautau", "Other"])
-            h_target.Add(h_bkgs, -1)
-            vpt_bins = list(
-                functions.readBoostHist(groups, "v_gen_pt", ["Zmumu"], boost=True)
-                .axes[0]
-                .edges
-            )
+            h_source = readVpt(groups, "v_gen_pt", ["Zmumu"])
+            h_target = readVpt(groups, "v_pt", ["Data"])
+            h_bkgs = readVpt(groups, "v_pt", ["Ztautau", "Other"])
+
+    vpt_bins = h_source.axes[0].edges
+    source = h_source.values()
+    target = h_target.values() - h_bkgs.values()
 
     # normalize histograms, to preserve total normalization
-    h_source.Scale(1.0 / h_source.Integral())
-    h_target.Scale(1.0 / h_target.Integral())
-
-    weights = []
-    for i in range(1, h_source.GetNbinsX() + 1):
-        w = (
-            h_target.GetBinContent(i) / h_source.GetBinContent(i)
-            if h_source.GetBinContent(i) > 0 and h_target.GetBinContent(i)
-            else 1
-        )
-        weights.append(w)
-        print(h_target.GetBinLowEdge(i), h_source.GetBinLowEdge(i + 1), w)
+    source = source / source.sum()
+    target = target / target.sum()
+
+    # ratio of all bins at once, 1 where either of the two is empty
+    valid = (source > 0) & (target != 0)
+    weights = np.divide(target, source, out=np.ones_like(source), where=valid)
+    for low, high, w in zip(vpt_bins[:-1], vpt_bins[1:], weights):
+        print(low, high, w)
 
     outDict = {}
-    outDict["vpt_bins"] = vpt_bins
-    outDict["weights"] = weights
+    outDict["vpt_bins"] = vpt_bins.tolist()
+    outDict["weights"] = weights.tolist()
     functions.writeJSON(fOut, outDict)
     print(fOut)
@@ -0,0 +1,77 @@
+# Table of the yields of histmaker outputs for many files, histograms and selections
+# run e.g. python scripts/tests/summarytable_yields.py mw_*.hdf5 --hists nominal --select "passIso=passIso:1" "failIso=passIso:0"
+# selections follow the syntax of utilities.io_tools.hist_service.parse_selection
+
+import os
+
+import pandas as pd
+
+from utilities import parsing
+from utilities.io_tools import hist_service, yield_tools
+from wums import logging, output_tools
+
+parser = parsing.plot_parser()
+parser.add_argument("inputs", nargs="+", type=str, help="Paths to histmaker outputs")
+parser.add_argument(
+    "--hists", nargs="+", type=str, default=["nominal"], help="Histogram names"
+)
+parser.add_argument(
+    "--procs",
+    nargs="+",
+    type=str,
+    default=None,
+    help="Processes, all processes of each file if not given",
+)
+parser.add_argument(
+    "--select",
+    nargs="+",
+    type=str,
+    default=[],
+    help="Selections as label=axis:bin;axis:low:high (the inclusive yield is always added)",
+)
+parser.add_argument(
+    "--noLumi",
+    action="store_true",
+    help="Normalise simulation to the cross section only, not to the luminosity of data",
+)
+parser.add_argument(
+    "--cacheDir",
+    type=str,
+    default=os.path.expanduser("~/.cache/wremnants/yields"),
+    help="Directory of the cached yields of each input file",
+)
+parser.add_argument(
+    "--noCache", action="store_true", help="Don't use or update cached yields"
+)
+args = parser.parse_args()
+
+logger = logging.setup_logger(__file__, args.verbose, args.noColorLogger)
+outdir = output_tools.make_plot_dir(args.outpath, args.outfolder)
+
+selections = {"inclusive": {}}
+for sel in args.select:
+    label, selection = sel.split("=", 1)
+    selections[label] = hist_service.parse_selection(selection)
+
+df = yield_tools.make_yields_table(
+    args.inputs,
+    args.hists,
+    procs=args.procs,
+    selections=selections,
+    calculate_lumi=not args.noLumi,
+    cache_dir=None if args.noCache else args.cacheDir,
+)
+
+outfile = f"{outdir}/yields{'_'+args.postfix if args.postfix else ''}.csv"
+df.to_csv(outfile, index=False)
+logger.info(f"Yields written to {outfile}")
+
+with pd.option_context("display.max_rows", None, "display.width", 200):
+    print(
+        df.pivot_table(
+            index=["file", "process"],
+            columns=["histogram", "selection"],
+            values="yield",
+            sort=False,
+        )
+    )
@@ -0,0 +1,90 @@
+# Measure the set-up time of the muon calibration helpers without and with the cache of the derived variation tensors
+# run e.g. python scripts/utilities/benchmark_calibration_helpers.py -n 5
+# the helpers are built once before the measurement, such that the one-off JIT compilation of the C++ templates is not included
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from utilities import common
+from wremnants import muon_calibration
+from wums import logging
+
+helpers = {
+    "muon_smearing": lambda: muon_calibration.make_muon_smearing_helpers(),
+    "jpsi_crctn_unc": lambda: muon_calibration.make_jpsi_crctn_unc_helper(
+        common.calib_filepaths["data_corrfile"]["massfit"]
+    ),
+    "closure_unc": lambda: muon_calibration.make_closure_uncertainty_helper(
+        common.closure_filepaths["parametrized"]
+    ),
+    "Z_non_closure_parametrized": lambda: muon_calibration.make_Z_non_closure_parametrized_helper(
+        common.closure_filepaths["parametrized"],
+        common.calib_filepaths["tflite_file"],
+        scale_var_method="smearingWeightsGaus",
+    ),
+}
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-n", "--repeat", type=int, default=5, help="Number of measurements per helper"
+)
+parser.add_argument(
+    "--helpers",
+    type=str,
+    nargs="+",
+    default=list(helpers.keys()),
+    choices=list(helpers.keys()),
+    help="Helpers to benchmark",
+)
+parser.add_argument(
+    "-v",
+    "--verbose",
+    type=int,
+    default=3,
+    choices=[0, 1, 2, 3, 4],
+    help="Set verbosity level with logging, the larger the more verbose",
+)
+parser.add_argument(
+    "--noColorLogger", action="store_true", help="Do not use logging with colors"
+)
+args = parser.parse_args()
+
+logger = logging.setup_logger(__file__, args.verbose, args.noColorLogger)
+
+
+def measure(make_helper, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        make_helper()
+        times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+# use an empty cache, to not depend on (or modify) the one of the user
+cache_dir = tempfile.mkdtemp(prefix="calibration_cache_")
+
+try:
+    for name in args.helpers:
+        make_helper = helpers[name]
+
+        muon_calibration.variation_cache_dir = None
+        make_helper()
+        before = measure(make_helper, args.repeat)
+
+        muon_calibration.variation_cache_dir = cache_dir
+        cold = measure(make_helper, 1)
+        after = measure(make_helper, args.repeat)
+
+        logger.info(
+            f"{name}: {1e3*np.mean(before):.1f} +/- {1e3*np.std(before):.1f} ms without cache, "
+            f"{1e3*cold[0]:.1f} ms filling the cache, "
+            f"{1e3*np.mean(after):.1f} +/- {1e3*np.std(after):.1f} ms from the cache "
+            f"(speed up {np.mean(before)/np.mean(after):.1f})"
+        )
+finally:
+    shutil.rmtree(cache_dir, ignore_errors=True)
@@ -0,0 +1,269 @@
+# Measure the throughput and memory of the main histmakers for a set of option presets and thread counts
+# run e.g. python scripts/utilities/benchmark_histmakers.py -i /scratch/$USER/synthetic_nano/ --jitInputPath /scratch/$USER/synthetic_nano_jit/ -j 1 8 32
+# the inputs are expected to follow the same directory structure as the production NanoAOD (as passed to --dataPath)
+# with --generate, synthetic inputs are first written to these paths with scripts/utilities/make_synthetic_nanoaod.py
+
+import argparse
+import concurrent.futures
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import tempfile
+import time
+
+from utilities import common
+from utilities.io_tools import input_tools
+from wums import logging
+
+histmakers = {
+    "mw_with_mu_eta_pt": ["WplusmunuPostVFP", "WminusmunuPostVFP"],
+    "mz_wlike_with_mu_eta_pt": ["ZmumuPostVFP"],
+    "mz_dilepton": ["ZmumuPostVFP"],
+}
+
+presets = {
+    "default": [],
+    "onlyMainHistograms": ["--onlyMainHistograms"],
+    "unfolding": ["--unfolding"],
+    "theoryAgnostic": ["--theoryAgnostic"],
+    "muonScaleMassWeights": ["--muonScaleVariation", "massWeights"],
+    "muonScaleSmearingWeightsGaus": ["--muonScaleVariation", "smearingWeightsGaus"],
+}
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-i",
+    "--inputPath",
+    type=str,
+    required=True,
+    help="Base path of the (synthetic) NanoAOD inputs, passed to the histmakers as --dataPath",
+)
+parser.add_argument(
+    "--jitInputPath",
+    type=str,
+    default=None,
+    help="Base path of inputs with very few events, used to measure the fixed start-up and JIT cost. If not given, the JIT and fill times are not separated",
+)
+parser.add_argument(
+    "--generate",
+    action="store_true",
+    help="Write synthetic inputs for the benchmarked datasets to --inputPath (and --jitInputPath) before running",
+)
+parser.add_argument(
+    "--nEvents",
+    type=int,
+    default=20000,
+    help="Number of events per file of the synthetic inputs (with --generate)",
+)
+parser.add_argument(
+    "--nJitEvents",
+    type=int,
+    default=10,
+    help="Number of events per file of the synthetic inputs for --jitInputPath (with --generate)",
+)
+parser.add_argument(
+    "--histmakers",
+    type=str,
+    nargs="+",
+    default=list(histmakers.keys()),
+    choices=list(histmakers.keys()),
+    help="Histmakers to benchmark",
+)
+parser.add_argument(
+    "--presets",
+    type=str,
+    nargs="+",
+    default=["default"],
+    choices=list(presets.keys()),
+    help="Option presets to benchmark",
+)
+parser.add_argument(
+    "-j",
+    "--nThreads",
+    type=int,
+    nargs="+",
+    default=[1, 8],
+    help="Thread counts to benchmark",
+)
+parser.add_argument(
+    "--maxFiles", type=int, default=-1, help="Max number of input files per dataset"
+)
+parser.add_argument(
+    "--extraOptions",
+    type=str,
+    nargs="*",
+    default=[],
+    help="Additional options passed to all histmakers",
+)
+parser.add_argument(
+    "--history",
+    type=str,
+    default="benchmark_histmakers.json",
+    help="JSON file where the results are appended",
+)
+parser.add_argument(
+    "--tag", type=str, default="", help="Label stored with the results of this run"
+)
+parser.add_argument(
+    "-v",
+    "--verbose",
+    type=int,
+    default=3,
+    choices=[0, 1, 2, 3, 4],
+    help="Set verbosity level with logging, the larger the more verbose",
+)
+parser.add_argument(
+    "--noColorLogger", action="store_true", help="Do not use logging with colors"
+)
+args = parser.parse_args()
+
+logger = logging.setup_logger(__file__, args.verbose, args.noColorLogger)
+
+
+def generate_inputs(outpath, nevents):
+    procs = sorted(set(p for h in args.histmakers for p in histmakers[h]))
+    cmd = [
+        "python",
+        f"{common.base_dir}/scripts/utilities/make_synthetic_nanoaod.py",
+        "-o",
+        outpath,
+        "-n",
+        str(nevents),
+        "--onlyFirstPath",
+        "--filterProcs",
+        *procs,
+    ]
+    logger.info(f"Running {' '.join(cmd)}")
+    subprocess.run(cmd, check=True)
+
+
+def event_count(outfolder):
+    count = 0.0
+    for outfile in glob.glob(f"{outfolder}/*.hdf5"):
+        for result in input_tools.get_index(outfile)["datasets"].values():
+            count += float(result.get("event_count", 0.0))
+    return count
+
+
+def timed_run(cmd):
+    # executed in a new worker process, so that the resource usage of its children is the one of this command only
+    time0 = time.monotonic()
+    returncode = subprocess.run(cmd, stdout=subprocess.DEVNULL).returncode
+    walltime = time.monotonic() - time0
+    rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return returncode, walltime, rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss
+
+
+def run_histmaker(histmaker, options, data_path, nthreads):
+    with tempfile.TemporaryDirectory() as outfolder:
+        cmd = [
+            "python",
+            f"{common.base_dir}/scripts/histmakers/{histmaker}.py",
+            "--dataPath",
+            data_path,
+            "--filterProcs",
+            *histmakers[histmaker],
+            "--maxFiles",
+            str(args.maxFiles),
+            "-j",
+            str(nthreads),
+            "-o",
+            outfolder,
+            "--forceDefaultName",
+            *options,
+            *args.extraOptions,
+        ]
+        logger.info(f"Running {' '.join(cmd)}")
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            returncode, walltime, cputime, maxrss = executor.submit(
+                timed_run, cmd
+            ).result()
+
+        if returncode != 0:
+            logger.error(f"Histmaker {histmaker} failed with return code {returncode}")
+            return None
+
+        return {
+            "wall_time": walltime,
+            "cpu_time": cputime,
+            # kilobytes on linux
+            "peak_rss_mb": maxrss / 1024.0,
+            "events": event_count(outfolder),
+        }
+
+
+if args.generate:
+    generate_inputs(args.inputPath, args.nEvents)
+    if args.jitInputPath:
+        generate_inputs(args.jitInputPath, args.nJitEvents)
+
+records = []
+for histmaker in args.histmakers:
+    for preset in args.presets:
+        for nthreads in args.nThreads:
+            options = presets[preset]
+            res = run_histmaker(histmaker, options, args.inputPath, nthreads)
+            if res is None:
+                continue
+
+            res_jit = None
+            if args.jitInputPath:
+                res_jit = run_histmaker(histmaker, options, args.jitInputPath, nthreads)
+
+            if res_jit is not None:
+                jit_time = res_jit["wall_time"]
+                fill_time = max(res["wall_time"] - jit_time, 1e-9)
+                throughput = (res["events"] - res_jit["events"]) / fill_time
+            else:
+                jit_time = None
+                fill_time = None
+                throughput = res["events"] / res["wall_time"]
+
+            record = {
+                "histmaker": histmaker,
+                "preset": preset,
+                "options": [*options, *args.extraOptions],
+                "nThreads": nthreads,
+                "events": res["events"],
+                "wall_time": res["wall_time"],
+                "cpu_time": res["cpu_time"],
+                "jit_time": jit_time,
+                "fill_time": fill_time,
+                "events_per_second": throughput,
+                "peak_rss_mb": res["peak_rss_mb"],
+            }
+            logger.info(
+                f"{histmaker} ({preset}, {nthreads} threads): {throughput:.0f} events/s, peak RSS {res['peak_rss_mb']:.0f} MB"
+            )
+            records.append(record)
+
+run_info = {
+    "time": datetime.datetime.now().isoformat(),
+    "tag": args.tag,
+    "host": os.uname().nodename,
+    "git_hash": subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=common.base_dir,
+        capture_output=True,
+        text=True,
+    ).stdout.strip(),
+    "input_path": args.inputPath,
+    "results": records,
+}
+
+history = []
+if os.path.isfile(args.history):
+    with open(args.history, "r") as f:
+        history = json.load(f)
+history.append(run_info)
+
+with open(args.history, "w") as f:
+    json.dump(history, f, indent=2)
+
+logger.info(f"Benchmark results appended to {args.history}")
@@ -0,0 +1,49 @@
+# Serve histmaker outputs to notebooks and plotting scripts, the files are opened once and the histograms are kept in memory
+# run e.g. python scripts/utilities/hist_server.py mw_with_mu_eta_pt.hdf5 --address localhost:8765
+# and query with utilities.io_tools.hist_service.HistClient("localhost:8765") or e.g. curl "localhost:8765/values?proc=WplusmunuPostVFP&hist=nominal&project=pt"
+
+import argparse
+
+from utilities.io_tools import hist_service
+from wums import logging
+
+parser = argparse.ArgumentParser()
+parser.add_argument("infiles", type=str, nargs="+", help="Input hdf5 files")
+parser.add_argument(
+    "-a",
+    "--address",
+    type=str,
+    default="localhost:8765",
+    help="Address to listen to, either host:port or the path of a unix socket",
+)
+parser.add_argument(
+    "--cacheSize",
+    type=int,
+    default=64,
+    help="Maximum number of decoded histograms kept in memory",
+)
+parser.add_argument(
+    "-v",
+    "--verbose",
+    type=int,
+    default=3,
+    choices=[0, 1, 2, 3, 4],
+    help="Set verbosity level with logging, the larger the more verbose",
+)
+parser.add_argument(
+    "--noColorLogger", action="store_true", help="Do not use logging with colors"
+)
+args = parser.parse_args()
+
+logger = logging.setup_logger(__file__, args.verbose, args.noColorLogger)
+
+store = hist_service.HistStore(args.infiles, cache_size=args.cacheSize)
+server = hist_service.make_server(store, args.address)
+logger.info(f"Serving {len(args.infiles)} files on {args.address}")
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    server.server_close()
+    store.close()
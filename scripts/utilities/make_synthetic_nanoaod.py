@@ -0,0 +1,858 @@
+# Produce small synthetic NanoAOD-like files to run the histmakers without access to the production samples
+# The files follow the directory structure of the datasets in wremnants/datasets so that they can be picked up with --dataPath
+# run e.g. python scripts/utilities/make_synthetic_nanoaod.py -o /scratch/$USER/synthetic/NanoAOD -n 20000 --nFiles 2
+# and then python scripts/histmakers/mz_dilepton.py --dataPath /scratch/$USER/synthetic/NanoAOD --filterProcs ZmumuPostVFP dataPostVFP
+# the events only have plausible distributions, the content is not meant for physics studies
+
+import argparse
+import json
+import os
+import re
+
+import awkward as ak
+import numpy as np
+import uproot
+
+from utilities import common
+from wremnants import columnar_tools, theory_tools
+from wremnants.datasets.datasetDict_gen import genDataDict
+from wremnants.datasets.datasetDict_v9 import dataDictV9extended
+from wums import logging
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-o",
+    "--outpath",
+    type=str,
+    required=True,
+    help="Base path of the output, to be passed to the histmakers as --dataPath",
+)
+parser.add_argument(
+    "--filterProcs",
+    type=str,
+    nargs="*",
+    default=[
+        "dataPostVFP",
+        "ZmumuPostVFP",
+        "ZtautauPostVFP",
+        "WplusmunuPostVFP",
+        "WminusmunuPostVFP",
+        "WplustaunuPostVFP",
+        "WminustaunuPostVFP",
+        "TTLeptonicPostVFP",
+    ],
+    help="Datasets to produce",
+)
+parser.add_argument(
+    "-n", "--nEvents", type=int, default=10000, help="Number of events per file"
+)
+parser.add_argument(
+    "--nFiles", type=int, default=1, help="Number of files per dataset path"
+)
+parser.add_argument(
+    "--nanoProdTag",
+    type=str,
+    default="TrackFitV722_NanoProdv6",
+    help="Production tag used to format the dataset paths",
+)
+parser.add_argument(
+    "--era", type=str, default="2016PostVFP", help="Era used to format the paths"
+)
+parser.add_argument(
+    "--onlyFirstPath",
+    action="store_true",
+    help="Only write the first path of each dataset (e.g. skip the extended samples)",
+)
+parser.add_argument("--seed", type=int, default=1, help="Seed of the random numbers")
+parser.add_argument(
+    "-v",
+    "--verbose",
+    type=int,
+    default=3,
+    choices=[0, 1, 2, 3, 4],
+    help="Set verbosity level with logging, the larger the more verbose",
+)
+parser.add_argument(
+    "--noColorLogger", action="store_true", help="Do not use logging with colors"
+)
+args = parser.parse_args()
+
+logger = logging.setup_logger(__file__, args.verbose, args.noColorLogger)
+
+muon_mass = 0.1056583745
+tau_mass = 1.77686
+
+# boson mass, width and the parameter grids of the MiNNLO reweighting (see syst_tools.define_mass_width_sin2theta_weights)
+bosons = {
+    "Z": {
+        "pdgId": 23,
+        "mass": 91.1876,
+        "width": 2.4941343245745466,
+        "massvals": np.append(91.1876 + 0.01 * np.arange(-10, 11), [91.1855, 91.1897]),
+        "widthvals": [2.49333, 2.49493, 2.4929, 2.4952, 2.4975],
+        "nsin2theta": 11,
+    },
+    "W": {
+        "pdgId": 24,
+        "mass": 80.379,
+        "width": 2.0911383956149385,
+        "massvals": 80.379 + 0.01 * np.arange(-10, 11),
+        "widthvals": [2.09053, 2.09173, 2.043, 2.085, 2.127],
+        "nsin2theta": 0,
+    },
+}
+
+# bits of GenPart_statusFlags
+isPrompt = 1 << 0
+isDirectPromptTauDecayProduct = 1 << 5
+isHardProcess = 1 << 7
+fromHardProcess = 1 << 8
+isFirstCopy = 1 << 12
+isLastCopy = 1 << 13
+
+
+def pdf_branch_sizes():
+    # number of entries needed in each of the LHEPdfWeight branches to evaluate all the pdf sets
+    sizes = {}
+    for info in theory_tools.pdfMap.values():
+        branch = info["branch"]
+        sizes[branch] = max(
+            sizes.get(branch, 0), info["entries"] + info.get("first_entry", 0)
+        )
+        for alpha in info.get("alphas", []):
+            match = re.match(r"(\w+)\[(\d+)\]", alpha)
+            if match:
+                sizes[match[1]] = max(sizes.get(match[1], 0), int(match[2]) + 1)
+    return sizes
+
+
+def process_type(name):
+    if name.startswith("data"):
+        return "data"
+    for key, proc in [
+        ("Zmumu", "Zmumu"),
+        ("DYJetsToMuMu", "Zmumu"),
+        ("Ztautau", "Ztautau"),
+        ("Wplusmunu", "Wplusmunu"),
+        ("Wminusmunu", "Wminusmunu"),
+        ("Wplustaunu", "Wplustaunu"),
+        ("Wminustaunu", "Wminustaunu"),
+    ]:
+        if name.startswith(key):
+            return proc
+    return "background"
+
+
+def from_cartesian(p4):
+    px, py, pz, energy = np.moveaxis(p4, -1, 0)
+    pt = np.hypot(px, py)
+    eta = np.arcsinh(pz / np.maximum(pt, 1e-9))
+    phi = np.arctan2(py, px)
+    mass = np.sqrt(np.maximum(energy**2 - px**2 - py**2 - pz**2, 0.0))
+    return pt, eta, phi, mass
+
+
+def breit_wigner(m, mass, width):
+    return 1.0 / ((m**2 - mass**2) ** 2 + mass**2 * width**2)
+
+
+def generate_boson(rng, n, boson):
+    # truncated relativistic Breit-Wigner via the inverse CDF of the non relativistic one
+    mass, width = boson["mass"], boson["width"]
+    lo, hi = np.arctan(2 * (np.array([50.0, 150.0]) - mass) / width)
+    mV = mass + 0.5 * width * np.tan(rng.uniform(lo, hi, n))
+    ptV = rng.gamma(1.6, 6.0, n)
+    yV = np.clip(rng.normal(0.0, 1.8, n), -5.0, 5.0)
+    phiV = rng.uniform(-np.pi, np.pi, n)
+
+    mT = np.hypot(mV, ptV)
+    p4V = np.stack(
+        [ptV * np.cos(phiV), ptV * np.sin(phiV), mT * np.sinh(yV), mT * np.cosh(yV)],
+        axis=-1,
+    )
+    return mV, p4V
+
+
+def decay(rng, mV, p4V, mass1, mass2):
+    # two body decay with a 1+cos^2(theta) distribution in the boson rest frame
+    n = len(mV)
+    u = rng.uniform(-1.0, 1.0, n)
+    # inverse of the CDF of 1+cos^2, solving c^3 + 3c - 4u = 0
+    root = np.sqrt(4 * u**2 + 1)
+    costheta = np.cbrt(2 * u + root) + np.cbrt(2 * u - root)
+    sintheta = np.sqrt(np.clip(1 - costheta**2, 0.0, 1.0))
+    phi = rng.uniform(-np.pi, np.pi, n)
+
+    pstar = np.sqrt(
+        np.maximum((mV**2 - (mass1 + mass2) ** 2) * (mV**2 - (mass1 - mass2) ** 2), 0.0)
+    ) / (2 * mV)
+    p3 = pstar[:, np.newaxis] * np.stack(
+        [sintheta * np.cos(phi), sintheta * np.sin(phi), costheta], axis=-1
+    )
+    p4_1 = np.concatenate([p3, np.hypot(pstar, mass1)[:, np.newaxis]], axis=-1)
+    p4_2 = np.concatenate([-p3, np.hypot(pstar, mass2)[:, np.newaxis]], axis=-1)
+
+    beta = p4V[:, :3] / p4V[:, 3:]
+    return columnar_tools.boost(p4_1, beta), columnar_tools.boost(p4_2, beta)
+
+
+def jagged(values, mask):
+    # values and mask are (nevents, nslots), the entries are kept in the order of the slots
+    counts = np.sum(mask, axis=-1)
+    return ak.unflatten(values[mask], counts)
+
+
+class Particles:
+    """
+    Collects particles of fixed slots per event, to be converted to a jagged collection
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.columns = {}
+        self.masks = []
+
+    def add(self, mask=None, **columns):
+        if mask is None:
+            mask = np.ones(self.n, dtype=bool)
+        self.masks.append(mask)
+        for key, val in columns.items():
+            self.columns.setdefault(key, []).append(np.broadcast_to(val, (self.n,)))
+        return len(self.masks) - 1
+
+    def slot_indices(self):
+        # index of each slot within the event, after removing the empty slots
+        mask = np.stack(self.masks, axis=-1)
+        return np.where(mask, np.cumsum(mask, axis=-1) - 1, -1)
+
+    def to_awkward(self, order=None):
+        mask = np.stack(self.masks, axis=-1)
+        if order is not None:
+            mask = np.take_along_axis(mask, order, axis=-1)
+        out = {}
+        for key, vals in self.columns.items():
+            vals = np.stack(vals, axis=-1)
+            if order is not None:
+                vals = np.take_along_axis(vals, order, axis=-1)
+            out[key] = jagged(vals, mask)
+        return ak.zip(out)
+
+
+def reco_muons(rng, n, gen_muons, is_data):
+    """
+    gen_muons is a list of (p4, charge, genPartIdx, genPartFlav, mask),
+    returns the Muon collection and the value arrays of the custom nested branches
+    """
+    muons = Particles(n)
+    pts = []
+
+    for p4, charge, gen_idx, flav, mask in gen_muons:
+        pt, eta, phi, _ = from_cartesian(p4)
+        # resolution of about 1% at central eta and 2% in the endcaps
+        sigma = 0.01 + 0.005 * np.abs(eta) ** 2
+        reco_pt = pt * (1.0 + sigma * rng.standard_normal(n))
+        reco_eta = eta + 1e-3 * rng.standard_normal(n)
+        reco_phi = phi + 1e-3 * rng.standard_normal(n)
+        accept = (
+            mask & (np.abs(eta) < 2.4) & (reco_pt > 3.0) & (rng.uniform(size=n) < 0.95)
+        )
+        muons.add(
+            accept,
+            pt=reco_pt.astype(np.float32),
+            eta=reco_eta.astype(np.float32),
+            phi=reco_phi.astype(np.float32),
+            charge=charge.astype(np.int32),
+            genPartIdx=(np.full(n, -1) if is_data else gen_idx).astype(np.int32),
+            genPartFlav=np.full(n, 0 if is_data else flav, dtype=np.uint8),
+            iso=rng.exponential(0.03, n).astype(np.float32),
+            dxy=(2e-3 * rng.standard_normal(n)).astype(np.float32),
+            dz=(5e-3 * rng.standard_normal(n)).astype(np.float32),
+            prompt=np.ones(n, dtype=bool),
+        )
+        pts.append(np.where(accept, reco_pt, -1.0))
+
+    # non-prompt muons from heavy flavour decays, mostly soft and non isolated
+    fake = rng.uniform(size=n) < 0.15
+    fake_pt = 3.0 + rng.exponential(8.0, n)
+    muons.add(
+        fake,
+        pt=fake_pt.astype(np.float32),
+        eta=rng.uniform(-2.4, 2.4, n).astype(np.float32),
+        phi=rng.uniform(-np.pi, np.pi, n).astype(np.float32),
+        charge=rng.choice([-1, 1], n).astype(np.int32),
+        genPartIdx=np.full(n, -1, dtype=np.int32),
+        genPartFlav=np.full(n, 0 if is_data else 5, dtype=np.uint8),
+        iso=rng.exponential(0.4, n).astype(np.float32),
+        dxy=(0.02 * rng.standard_normal(n)).astype(np.float32),
+        dz=(0.05 * rng.standard_normal(n)).astype(np.float32),
+        prompt=np.zeros(n, dtype=bool),
+    )
+    pts.append(np.where(fake, fake_pt, -1.0))
+
+    # NanoAOD collections are sorted in decreasing pt
+    order = np.argsort(-np.stack(pts, axis=-1), axis=-1, kind="stable")
+    coll = muons.to_awkward(order)
+
+    nmu = ak.num(coll)
+    flat_n = int(ak.sum(nmu))
+    flat = lambda x: ak.to_numpy(ak.flatten(x))
+    pt, eta, phi = flat(coll.pt), flat(coll.eta), flat(coll.phi)
+    prompt = flat(coll.prompt)
+    unflat = lambda x: ak.unflatten(x, nmu)
+    ones = np.ones(flat_n, dtype=bool)
+
+    out = {
+        "pt": coll.pt,
+        "eta": coll.eta,
+        "phi": coll.phi,
+        "mass": unflat(np.full(flat_n, muon_mass, dtype=np.float32)),
+        "charge": coll.charge,
+        "looseId": unflat(ones),
+        "mediumId": unflat(prompt | (rng.uniform(size=flat_n) < 0.7)),
+        "tightId": unflat(prompt & (rng.uniform(size=flat_n) < 0.97)),
+        "isGlobal": unflat(ones),
+        "isTracker": unflat(ones),
+        "isStandalone": unflat(ones),
+        "highPurity": unflat(ones),
+        "innerTrackOriginalAlgo": unflat(np.full(flat_n, 4, dtype=np.int32)),
+        "nTrackerLayers": unflat(rng.integers(8, 17, flat_n).astype(np.int32)),
+        "dxy": coll.dxy,
+        "dxybs": coll.dxy,
+        "dz": coll.dz,
+        "sip3d": unflat(rng.exponential(1.5, flat_n).astype(np.float32)),
+        "trkKink": unflat(rng.exponential(5.0, flat_n).astype(np.float32)),
+        "pfRelIso04_all": coll.iso,
+        "pfRelIso04_chg": unflat(0.7 * flat(coll.iso)),
+        "pfRelIso03_all": unflat(0.8 * flat(coll.iso)),
+        "vtxAgnPfRelIso04_all": coll.iso,
+        "vtxAgnPfRelIso04_chg": unflat(0.7 * flat(coll.iso)),
+        "jetIdx": unflat(np.full(flat_n, -1, dtype=np.int32)),
+        "svIdx": unflat(np.full(flat_n, -1, dtype=np.int32)),
+        "standalonePt": unflat(
+            (pt * (1.0 + 0.1 * rng.standard_normal(flat_n))).astype(np.float32)
+        ),
+        "standaloneEta": unflat(
+            (eta + 0.01 * rng.standard_normal(flat_n)).astype(np.float32)
+        ),
+        "standalonePhi": unflat(
+            (phi + 0.01 * rng.standard_normal(flat_n)).astype(np.float32)
+        ),
+        "standaloneNumberOfValidHits": unflat(
+            rng.integers(10, 40, flat_n).astype(np.int32)
+        ),
+    }
+    if not is_data:
+        out["genPartIdx"] = coll.genPartIdx
+        out["genPartFlav"] = coll.genPartFlav
+
+    # track refit variables of the custom NanoAOD
+    for fit in ["cvh", "cvhideal"]:
+        out[f"{fit}Pt"] = coll.pt
+        out[f"{fit}Eta"] = coll.eta
+        out[f"{fit}Phi"] = coll.phi
+        out[f"{fit}Charge"] = coll.charge
+        out[f"{fit}NValidPixelHits"] = unflat(
+            rng.integers(2, 5, flat_n).astype(np.int32)
+        )
+
+    # 3x3 covariance matrix of (q/p, lambda, phi) per muon
+    p = pt * np.cosh(eta)
+    diag = np.stack(
+        [(0.01 / p) ** 2, np.full(flat_n, 1e-7), np.full(flat_n, 1e-7)], axis=-1
+    )
+    cov = np.zeros((flat_n, 3, 3))
+    cov[:, [0, 1, 2], [0, 1, 2]] = diag
+
+    custom = {
+        "Muon_cvhMomCov_Vals": cov.reshape(-1).astype(np.float32),
+        # no alignment parameters are associated to the synthetic tracks
+        "Muon_cvhmergedGlobalIdxs_Vals": np.zeros(0, dtype=np.int32),
+        "Muon_cvhJacRef_Vals": np.zeros(0, dtype=np.float32),
+        "Muon_cvhidealJacRef_Vals": np.zeros(0, dtype=np.float32),
+    }
+    out["cvhMomCov_Counts"] = unflat(np.full(flat_n, 9, dtype=np.int32))
+    for key in ["cvhmergedGlobalIdxs", "cvhJacRef", "cvhidealJacRef"]:
+        out[f"{key}_Counts"] = unflat(np.zeros(flat_n, dtype=np.int32))
+    # the value branches hold the concatenated values of all muons in the event
+    counts_cov = 9 * ak.to_numpy(nmu)
+    for key in custom.keys():
+        counts = (
+            counts_cov if key == "Muon_cvhMomCov_Vals" else np.zeros(n, dtype=np.int64)
+        )
+        custom[key] = ak.unflatten(custom[key], counts)
+
+    return ak.zip(out), custom
+
+
+def trigger_objects(rng, muons):
+    # one HLT muon object matched to each isolated reco muon above threshold
+    pt, eta, phi = muons.pt, muons.eta, muons.phi
+    trig = (pt > 22.0) & (muons.pfRelIso04_all < 0.2) & (np.abs(eta) < 2.4)
+    nflat = int(ak.sum(ak.num(pt)))
+    trig_eff = ak.unflatten(rng.uniform(size=nflat) < 0.92, ak.num(pt))
+    trig = trig & trig_eff
+    ntrig = ak.num(pt[trig])
+    nflat = int(ak.sum(ntrig))
+    flat = lambda x: ak.to_numpy(ak.flatten(x[trig]))
+    unflat = lambda x: ak.unflatten(x, ntrig)
+
+    trigobj = ak.zip(
+        {
+            "id": unflat(np.full(nflat, 13, dtype=np.int32)),
+            "pt": unflat(
+                (flat(pt) * (1 + 0.01 * rng.standard_normal(nflat))).astype(np.float32)
+            ),
+            "eta": unflat(flat(eta)),
+            "phi": unflat(flat(phi)),
+            "l1pt": unflat((flat(pt) * 0.9).astype(np.float32)),
+            "l1pt_2": unflat(np.zeros(nflat, dtype=np.float32)),
+            "l2pt": unflat((flat(pt) * 0.95).astype(np.float32)),
+            # TrkIsoVVL, Iso, IsoTkMu, 1mu
+            "filterBits": unflat(np.full(nflat, 1 | 2 | 8, dtype=np.int32)),
+        }
+    )
+    passed = ak.to_numpy(ntrig > 0)
+    return trigobj, passed
+
+
+def certified_lumi_sections(lumijson):
+    # (run, luminosityBlock) pairs of the lumi JSON in the runs of the post VFP data
+    with open(lumijson) as f:
+        certified = json.load(f)
+    pairs = [
+        (int(run), ls)
+        for run, ranges in certified.items()
+        if common.run_edges[0] < int(run) <= common.run_edges[-1]
+        for first, last in ranges
+        for ls in range(first, last + 1)
+    ]
+    if len(pairs) == 0:
+        raise ValueError(f"No certified lumi sections in the data runs in {lumijson}")
+    return np.array(pairs, dtype=np.uint32)
+
+
+def generate(rng, proc, n, file_index, lumi_sections=None):
+    is_data = proc == "data"
+    events = {}
+
+    # composition of the synthetic data and of the generic backgrounds
+    if is_data:
+        kind = rng.choice(
+            ["Zmumu", "Wplusmunu", "Wminusmunu", "background"],
+            n,
+            p=[0.1, 0.45, 0.35, 0.1],
+        )
+    else:
+        kind = np.full(n, proc)
+
+    is_z = np.isin(kind, ["Zmumu", "Ztautau"])
+    is_tau = np.isin(kind, ["Ztautau", "Wplustaunu", "Wminustaunu"])
+    is_bkg = kind == "background"
+    wcharge = np.where(
+        np.isin(kind, ["Wplusmunu", "Wplustaunu"]),
+        1,
+        np.where(np.isin(kind, ["Wminusmunu", "Wminustaunu"]), -1, 0),
+    )
+    if np.any(is_bkg):
+        wcharge = np.where(is_bkg, rng.choice([-1, 1], n), wcharge)
+
+    # generate both a Z and a W candidate and pick the one of the event type
+    mZ, p4Z = generate_boson(rng, n, bosons["Z"])
+    mW, p4W = generate_boson(rng, n, bosons["W"])
+    mV = np.where(is_z, mZ, mW)
+    p4V = np.where(is_z[:, np.newaxis], p4Z, p4W)
+    if np.any(is_bkg):
+        # harder recoil for top quark and diboson like events
+        p4V[is_bkg, :2] *= 4.0
+        p4V[is_bkg, 3] = np.sqrt(
+            np.sum(p4V[is_bkg, :3] ** 2, axis=-1) + mV[is_bkg] ** 2
+        )
+
+    lep_mass = np.where(is_tau, tau_mass, muon_mass)
+    nu_mass = np.zeros(n)
+    p4_1, p4_2 = decay(rng, mV, p4V, lep_mass, np.where(is_z, lep_mass, nu_mass))
+
+    # for the W the first particle is the charged lepton, for the Z the negative one
+    charge1 = np.where(is_z, -1, wcharge)
+    lep_pdg = np.where(is_tau, 15, 13)
+    pdg1 = np.where(charge1 < 0, lep_pdg, -lep_pdg)
+    pdg2 = np.where(is_z, -pdg1, np.where(wcharge > 0, lep_pdg + 1, -(lep_pdg + 1)))
+    pdgV = np.where(is_z, 23, 24 * wcharge)
+
+    # muons from the tau decays, collinear with a fraction of the tau momentum
+    z1 = rng.uniform(0.2, 1.0, n)
+    z2 = rng.uniform(0.2, 1.0, n)
+    p4_mu1 = np.where(is_tau[:, np.newaxis], p4_1 * z1[:, np.newaxis], p4_1)
+    p4_mu2 = np.where(is_tau[:, np.newaxis], p4_2 * z2[:, np.newaxis], p4_2)
+
+    if not is_data:
+        genpart = Particles(n)
+        q1 = rng.choice([1, 2, 3, 4], n)
+        genpart.add(
+            pdgId=q1,
+            status=21,
+            statusFlags=isHardProcess | fromHardProcess,
+            genPartIdxMother=-1,
+            pt=0.0,
+            eta=0.0,
+            phi=0.0,
+            mass=0.0,
+        )
+        genpart.add(
+            pdgId=-q1,
+            status=21,
+            statusFlags=isHardProcess | fromHardProcess,
+            genPartIdxMother=-1,
+            pt=0.0,
+            eta=0.0,
+            phi=0.0,
+            mass=0.0,
+        )
+        ptV, etaV, phiV, _ = from_cartesian(p4V)
+        genpart.add(
+            pdgId=pdgV,
+            status=62,
+            statusFlags=isPrompt | isHardProcess | fromHardProcess | isLastCopy,
+            genPartIdxMother=0,
+            pt=ptV,
+            eta=etaV,
+            phi=phiV,
+            mass=mV,
+        )
+        lepflags = isPrompt | isHardProcess | fromHardProcess | isFirstCopy | isLastCopy
+        for pdg, p4 in [(pdg1, p4_1), (pdg2, p4_2)]:
+            pt, eta, phi, mass = from_cartesian(p4)
+            genpart.add(
+                pdgId=pdg,
+                status=np.where(np.abs(pdg) == 15, 2, 1),
+                statusFlags=lepflags,
+                genPartIdxMother=2,
+                pt=pt,
+                eta=eta,
+                phi=phi,
+                mass=mass,
+            )
+        # the tau decay products, the second one only for the Z
+        tauflags = (
+            isDirectPromptTauDecayProduct | fromHardProcess | isFirstCopy | isLastCopy
+        )
+        for imother, pdg, p4, mask in [
+            (3, np.sign(pdg1) * 13, p4_mu1, is_tau),
+            (4, np.sign(pdg2) * 13, p4_mu2, is_tau & is_z),
+        ]:
+            pt, eta, phi, _ = from_cartesian(p4)
+            genpart.add(
+                mask,
+                pdgId=pdg,
+                status=1,
+                statusFlags=tauflags,
+                genPartIdxMother=imother,
+                pt=pt,
+                eta=eta,
+                phi=phi,
+                mass=muon_mass,
+            )
+        slot_idx = genpart.slot_indices()
+        gen_muon1_idx = np.where(is_tau, slot_idx[:, 5], slot_idx[:, 3])
+        gen_muon2_idx = np.where(is_tau, slot_idx[:, 6], slot_idx[:, 4])
+
+        coll = genpart.to_awkward()
+        events["GenPart"] = ak.zip(
+            {
+                "pt": ak.values_astype(coll.pt, np.float32),
+                "eta": ak.values_astype(coll.eta, np.float32),
+                "phi": ak.values_astype(coll.phi, np.float32),
+                "mass": ak.values_astype(coll.mass, np.float32),
+                "pdgId": ak.values_astype(coll.pdgId, np.int32),
+                "status": ak.values_astype(coll.status, np.int32),
+                "statusFlags": ak.values_astype(coll.statusFlags, np.int32),
+                "genPartIdxMother": ak.values_astype(coll.genPartIdxMother, np.int32),
+            }
+        )
+
+        # dressed leptons and LHE particles from the stable leptons
+        dressed = Particles(n)
+        lhe = Particles(n)
+        for pdg, p4, p4_mu, mask in [
+            (pdg1, p4_1, p4_mu1, np.ones(n, dtype=bool)),
+            (pdg2, p4_2, p4_mu2, is_z),
+        ]:
+            pt, eta, phi, mass = from_cartesian(p4)
+            lhe.add(pdgId=pdg, status=1, pt=pt, eta=eta, phi=phi, mass=mass)
+            pt, eta, phi, _ = from_cartesian(p4_mu)
+            dressed.add(
+                mask,
+                pdgId=np.sign(pdg) * 13,
+                pt=pt * rng.uniform(1.0, 1.02, n),
+                eta=eta,
+                phi=phi,
+                mass=muon_mass,
+            )
+        events["GenDressedLepton"] = ak.zip(
+            {
+                k: ak.values_astype(v, np.int32 if k == "pdgId" else np.float32)
+                for k, v in zip(dressed.columns.keys(), ak.unzip(dressed.to_awkward()))
+            }
+        )
+        events["LHEPart"] = ak.zip(
+            {
+                k: ak.values_astype(
+                    v, np.int32 if k in ["pdgId", "status"] else np.float32
+                )
+                for k, v in zip(lhe.columns.keys(), ak.unzip(lhe.to_awkward()))
+            }
+        )
+
+        # neutrinos from the W decay for the generator MET
+        nu = np.where(is_z[:, np.newaxis], 0.0, p4_2)
+        events["GenMET_pt"] = np.hypot(nu[:, 0], nu[:, 1]).astype(np.float32)
+        events["GenMET_phi"] = np.arctan2(nu[:, 1], nu[:, 0]).astype(np.float32)
+        events["MET_fiducialGenPt"] = events["GenMET_pt"]
+        events["MET_fiducialGenPhi"] = events["GenMET_phi"]
+    else:
+        gen_muon1_idx = np.full(n, -1)
+        gen_muon2_idx = np.full(n, -1)
+
+    flav = np.where(is_tau, 15, 1)
+    charge2 = np.where(is_z, 1, 0)
+    muons, custom = reco_muons(
+        rng,
+        n,
+        [
+            (
+                p4_mu1,
+                charge1,
+                gen_muon1_idx,
+                flav,
+                ~is_bkg | (rng.uniform(size=n) < 0.5),
+            ),
+            (p4_mu2, charge2, gen_muon2_idx, flav, is_z),
+        ],
+        is_data,
+    )
+    events["Muon"] = muons
+    events.update(custom)
+
+    trigobj, passed = trigger_objects(rng, muons)
+    events["TrigObj"] = trigobj
+    events["HLT_IsoMu24"] = passed
+    events["HLT_IsoTkMu24"] = passed
+    events["HLT_IsoMu27"] = passed & (rng.uniform(size=n) < 0.9)
+    events["HLT_Mu17"] = passed
+
+    # hadronic recoil balancing the boson with a resolution of ~10 GeV per component
+    recoil = -0.85 * p4V[:, :2] + 10.0 * rng.standard_normal((n, 2))
+    visible = np.zeros((n, 2))
+    for p4, mask in [(p4_mu1, np.ones(n, dtype=bool)), (p4_mu2, is_z)]:
+        visible += np.where(mask[:, np.newaxis], p4[:, :2], 0.0)
+    met = -(visible + recoil)
+    for name, scale in [
+        ("MET", 1.0),
+        ("RawMET", 1.05),
+        ("PuppiMET", 0.98),
+        ("DeepMETResolutionTune", 1.0),
+        ("DeepMETResponseTune", 1.0),
+    ]:
+        met_var = met * (scale + 0.02 * rng.standard_normal((n, 1)))
+        events[f"{name}_pt"] = np.hypot(met_var[:, 0], met_var[:, 1]).astype(np.float32)
+        events[f"{name}_phi"] = np.arctan2(met_var[:, 1], met_var[:, 0]).astype(
+            np.float32
+        )
+    events["MET_sumEt"] = (300.0 + rng.gamma(4.0, 150.0, n)).astype(np.float32)
+    events["RawMET_sumEt"] = events["MET_sumEt"]
+
+    # jets from the hadronic recoil plus additional soft jets
+    jets = Particles(n)
+    recoil_pt = np.hypot(recoil[:, 0], recoil[:, 1])
+    jets.add(
+        recoil_pt > 20.0,
+        pt=recoil_pt,
+        eta=rng.normal(0.0, 2.0, n),
+        phi=np.arctan2(recoil[:, 1], recoil[:, 0]),
+    )
+    for _ in range(3):
+        pt = 15.0 + rng.exponential(15.0, n)
+        jets.add(
+            rng.uniform(size=n) < 0.4,
+            pt=pt,
+            eta=rng.normal(0.0, 2.0, n),
+            phi=rng.uniform(-np.pi, np.pi, n),
+        )
+    coll = jets.to_awkward()
+    njet_flat = int(ak.sum(ak.num(coll.pt)))
+    unflat = lambda x: ak.unflatten(x, ak.num(coll.pt))
+    events["Jet"] = ak.zip(
+        {
+            "pt": ak.values_astype(coll.pt, np.float32),
+            "eta": ak.values_astype(coll.eta, np.float32),
+            "phi": ak.values_astype(coll.phi, np.float32),
+            "mass": unflat(rng.uniform(2.0, 15.0, njet_flat).astype(np.float32)),
+            "jetId": unflat(np.full(njet_flat, 6, dtype=np.int32)),
+            "puId": unflat(np.full(njet_flat, 7, dtype=np.int32)),
+            "chEmEF": unflat(rng.uniform(0.0, 0.2, njet_flat).astype(np.float32)),
+            "neEmEF": unflat(rng.uniform(0.0, 0.3, njet_flat).astype(np.float32)),
+            "muEF": unflat(rng.uniform(0.0, 0.05, njet_flat).astype(np.float32)),
+        }
+    )
+
+    # rare electrons, to exercise the electron veto
+    electrons = Particles(n)
+    electrons.add(
+        rng.uniform(size=n) < 0.03,
+        pt=10.0 + rng.exponential(15.0, n),
+        eta=rng.uniform(-2.5, 2.5, n),
+        phi=rng.uniform(-np.pi, np.pi, n),
+        charge=rng.choice([-1, 1], n),
+    )
+    coll = electrons.to_awkward()
+    nele_flat = int(ak.sum(ak.num(coll.pt)))
+    unflat = lambda x: ak.unflatten(x, ak.num(coll.pt))
+    events["Electron"] = ak.zip(
+        {
+            "pt": ak.values_astype(coll.pt, np.float32),
+            "eta": ak.values_astype(coll.eta, np.float32),
+            "phi": ak.values_astype(coll.phi, np.float32),
+            "mass": unflat(np.zeros(nele_flat, dtype=np.float32)),
+            "charge": ak.values_astype(coll.charge, np.int32),
+            "cutBased": unflat(rng.integers(0, 5, nele_flat).astype(np.int32)),
+            "dxy": unflat((0.01 * rng.standard_normal(nele_flat)).astype(np.float32)),
+            "dz": unflat((0.02 * rng.standard_normal(nele_flat)).astype(np.float32)),
+            "pfRelIso03_all": unflat(
+                rng.exponential(0.1, nele_flat).astype(np.float32)
+            ),
+        }
+    )
+
+    # empty secondary vertex collection
+    events["SV"] = ak.zip(
+        {
+            k: ak.unflatten(np.zeros(0, dtype=t), np.zeros(n, dtype=np.int64))
+            for k, t in [
+                ("dlenSig", np.float32),
+                ("ntracks", np.int32),
+                ("eta", np.float32),
+                ("phi", np.float32),
+            ]
+        }
+    )
+
+    events["PV_npvs"] = rng.poisson(18.0, n).astype(np.int32) + 1
+    events["PV_npvsGood"] = events["PV_npvs"]
+    events["PV_z"] = rng.normal(0.0, 3.5, n).astype(np.float32)
+    for flag in [
+        "globalSuperTightHalo2016Filter",
+        "EcalDeadCellTriggerPrimitiveFilter",
+        "goodVertices",
+        "HBHENoiseIsoFilter",
+        "HBHENoiseFilter",
+        "BadPFMuonFilter",
+    ]:
+        events[f"Flag_{flag}"] = np.ones(n, dtype=bool)
+
+    if is_data:
+        # only certified lumi sections, so that the events pass the lumi mask
+        runls = lumi_sections[rng.integers(0, len(lumi_sections), n)]
+        events["run"] = runls[:, 0]
+        events["luminosityBlock"] = runls[:, 1]
+    else:
+        events["run"] = np.ones(n, dtype=np.uint32)
+        events["luminosityBlock"] = rng.integers(1, 1000, n).astype(np.uint32)
+    events["event"] = (np.arange(n) + file_index * n + 1).astype(np.uint64)
+
+    if is_data:
+        return events
+
+    events["genWeight"] = np.where(rng.uniform(size=n) < 0.02, -1.0, 1.0).astype(
+        np.float32
+    )
+    events["Pileup_nTrueInt"] = rng.gamma(9.0, 2.8, n).astype(np.float32)
+    for name in ["Nom", "Up", "Dn"]:
+        shift = {"Nom": 0.0, "Up": 0.005, "Dn": -0.005}[name]
+        events[f"L1PreFiringWeight_{name}"] = np.full(n, 0.98 + shift, dtype=np.float32)
+        events[f"L1PreFiringWeight_ECAL_{name}"] = np.full(
+            n, 0.99 + shift, dtype=np.float32
+        )
+    events["L1PreFiringWeight_Muon_Nom"] = np.full(n, 0.995, dtype=np.float32)
+    for var in ["StatUp", "StatDn", "SystUp", "SystDn"]:
+        shift = 0.001 if var.endswith("Up") else -0.001
+        events[f"L1PreFiringWeight_Muon_{var}"] = np.full(
+            n, 0.995 + shift, dtype=np.float32
+        )
+
+    def weight_vector(nweights, spread, nominal_index=None):
+        w = 1.0 + spread * rng.standard_normal((n, nweights))
+        if nominal_index is not None:
+            w[:, nominal_index] = 1.0
+        return ak.from_regular(ak.Array(w.astype(np.float32)))
+
+    events["LHEScaleWeight"] = weight_vector(9, 0.05, nominal_index=4)
+    for branch, size in pdf_branch_sizes().items():
+        events[branch] = weight_vector(size, 0.01, nominal_index=0)
+
+    info = bosons["Z" if is_z[0] else "W"]
+    bw_nominal = breit_wigner(mV, info["mass"], info["width"])
+    massw = np.stack(
+        [breit_wigner(mV, m, info["width"]) / bw_nominal for m in info["massvals"]],
+        axis=-1,
+    )
+    widthw = np.stack(
+        [breit_wigner(mV, info["mass"], w) / bw_nominal for w in info["widthvals"]],
+        axis=-1,
+    )
+    events["MEParamWeight"] = ak.from_regular(ak.Array(massw.astype(np.float32)))
+    events["MEParamWeightAltSet1"] = ak.from_regular(
+        ak.Array(widthw.astype(np.float32))
+    )
+    if info["nsin2theta"]:
+        events["MEParamWeightAltSet4"] = weight_vector(info["nsin2theta"], 0.005)
+
+    return events
+
+
+def branch_types(events):
+    return {
+        key: val.type if isinstance(val, ak.Array) else val.dtype
+        for key, val in events.items()
+    }
+
+
+def output_paths(name, info):
+    base_path = args.outpath
+    if name in genDataDict:
+        base_path = base_path.replace("NanoAOD", "NanoGen")
+    paths = info["filepaths"][:1] if args.onlyFirstPath else info["filepaths"]
+    return [
+        path.format(BASE_PATH=base_path, NANO_PROD_TAG=args.nanoProdTag, ERA=args.era)
+        for path in paths
+    ]
+
+
+datasets = {**dataDictV9extended, **genDataDict}
+rng = np.random.default_rng(args.seed)
+
+for name in args.filterProcs:
+    if name not in datasets:
+        raise ValueError(
+            f"Dataset {name} not found, available datasets are {list(datasets.keys())}"
+        )
+    proc = process_type(name)
+    if name in genDataDict and proc in ["data", "background"]:
+        logger.warning(f"Skipping generator dataset {name} of unsupported type")
+        continue
+
+    lumi_sections = None
+    if proc == "data":
+        lumi_sections = certified_lumi_sections(datasets[name]["lumijson"])
+
+    for path in output_paths(name, datasets[name]):
+        os.makedirs(path, exist_ok=True)
+        for i in range(args.nFiles):
+            events = generate(rng, proc, args.nEvents, i, lumi_sections)
+            outfile = f"{path}/synthetic_{i}.root"
+            with uproot.recreate(outfile) as fout:
+                # a flat TTree as in NanoAOD, with the collections split in counter and per field branches
+                tree = fout.mktree("Events", branch_types(events))
+                tree.extend(events)
+            logger.info(f"Wrote {args.nEvents} {proc} events to {outfile}")
+
+logger.info(f"Use --dataPath {args.outpath} to run the histmakers on these files")
@@ -1,9 +1,15 @@
 import argparse
 
-from utilities.io_tools import input_tools
+from utilities.io_tools import hist_service, input_tools
 
 parser = argparse.ArgumentParser()
 parser.add_argument("infile", type=str, help="Input hdf5 file")
+parser.add_argument(
+    "--server",
+    type=str,
+    default=None,
+    help="Query a running scripts/utilities/hist_server.py at this address (host:port or unix socket) instead of reading the file, infile is then the name of the file as loaded by the server",
+)
 parsers = parser.add_subparsers(dest="mode")
 histparser = parsers.add_parser("hists", help="Print info about histograms")
 histparser.add_argument(
@@ -16,16 +22,29 @@ sampleparser = parsers.add_parser("samples", help="Print info about samples")
 
 args = parser.parse_args()
 
+client = hist_service.HistClient(args.server) if args.server else None
+
 if args.mode == "hists":
-    names = input_tools.read_hist_names(args.infile, args.sample)
+    if client:
+        names = client.hist_names(args.sample, file=args.infile)
+    else:
+        names = input_tools.read_hist_names(args.infile, args.sample)
     if not args.hist:
         print(f"Valid names for process {args.sample} are:")
         print(names)
+    elif client:
+        axes = client.axes(args.sample, args.hist, file=args.infile)
+        print(f"Histogram {args.hist} has axes {[a['name'] for a in axes]}")
+        for a in axes:
+            print(a)
     else:
         h = input_tools.read_and_scale(args.infile, args.sample, args.hist)
         print(f"Histogram {args.hist} has axes {h.axes}")
         print(h)
 
 if args.mode == "samples":
-    keys = input_tools.read_keys(args.infile)
+    if client:
+        keys = client.procs(file=args.infile)
+    else:
+        keys = input_tools.read_keys(args.infile)
     print(f"Valid samples in file are {[k for k in keys if k != 'meta_info']}")
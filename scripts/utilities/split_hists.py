@@ -6,6 +6,7 @@ import boost_histogram as bh
 import h5py
 
 import wums.ioutils
+from utilities.io_tools import input_tools
 from wums import logging
 
 parser = argparse.ArgumentParser()
@@ -66,7 +67,8 @@ newfiles = True
 # def copy_and_write(key, value, isplit)
 
 with h5py.File(args.input, "r") as h5file:
-    keys = list(h5file.keys())
+    # the index describes the original histograms, it is not copied to the split files
+    keys = [k for k in h5file.keys() if k != input_tools.results_index_name]
 
 print(keys)
 
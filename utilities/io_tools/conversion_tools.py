@@ -1,4 +1,5 @@
 import itertools
+import os
 import re
 
 import hist
@@ -302,6 +303,41 @@ def combine_channels(meta, merge_gen_charge_W):
     return channel_info
 
 
+# POI dataframes and their name index, per fit result file and POI type,
+# only the most recently read ones are kept
+_poi_cache = {}
+_poi_cache_size = 16
+
+
+def read_pois_indexed(infile, fitresult, poi_type, grouped=True, uncertainties=None):
+    """
+    Read the POIs of one type with read_impacts_pois together with a PoiIndex of their names.
+    Both are cached for the fit result file, such that the names are only decoded once even
+    when the same POIs are converted multiple times (e.g. as result and as reference)
+    """
+    key = (
+        os.path.realpath(infile),
+        os.path.getmtime(infile),
+        poi_type,
+        grouped,
+        tuple(uncertainties) if uncertainties is not None else None,
+    )
+    if key not in _poi_cache:
+        df = rabbit.io_tools.read_impacts_pois(
+            fitresult, poi_type=poi_type, group=grouped, uncertainties=uncertainties
+        )
+        if df is None or len(df) == 0:
+            index = None
+        else:
+            df = df.reset_index(drop=True)
+            index = rabbit_input.PoiIndex(df["Name"].values)
+        if len(_poi_cache) >= _poi_cache_size:
+            # dicts keep the insertion order, drop the oldest entry
+            del _poi_cache[next(iter(_poi_cache))]
+        _poi_cache[key] = (df, index)
+    return _poi_cache[key]
+
+
 def fitresult_pois_to_hist(
     infile,
     result=None,
@@ -361,8 +397,8 @@ def fitresult_pois_to_hist(
     for poi_type in poi_types:
         logger.debug(f"Now at POI type {poi_type}")
 
-        df = rabbit.io_tools.read_impacts_pois(
-            fitresult, poi_type=poi_type, group=grouped, uncertainties=uncertainties
+        df, poi_index = read_pois_indexed(
+            infile, fitresult, poi_type, grouped=grouped, uncertainties=uncertainties
         )
         if df is None or len(df) == 0:
             logger.warning(
@@ -371,24 +407,7 @@ def fitresult_pois_to_hist(
             continue
 
         # find all axes where the flow bins are included in the unfolding, needed for correct reshaping
-        flow_axes = list(
-            set(
-                [
-                    l
-                    for i in df["Name"]
-                    .apply(
-                        lambda x: [
-                            i[:-1]
-                            for i in x.split("_")[1:-1]
-                            if len(i) and i[-1] in ["U", "O"]
-                        ]
-                    )
-                    .values
-                    if i
-                    for l in i
-                ]
-            )
-        )
+        flow_axes = poi_index.flow_axes()
 
         action_val, action_err = transform_poi(poi_type, meta_info)
 
@@ -459,15 +478,23 @@ def fitresult_pois_to_hist(
                             result[poi_key][channel][proc] = {}
 
                         data = rabbit_input.select_pois(
-                            df, axes_names, base_processes=proc, flow=True
+                            df,
+                            axes_names,
+                            base_processes=proc,
+                            flow=True,
+                            index=poi_index,
                         )
-                        data = data.loc[
-                            data["Name"].apply(lambda x: not x.endswith("totalxsec"))
-                        ]
+                        data = data.loc[~data["Name"].str.endswith("totalxsec")]
                     else:
                         data = rabbit_input.select_pois(
-                            df, axes_names, base_processes=proc, flow=True
+                            df,
+                            axes_names,
+                            base_processes=proc,
+                            flow=True,
+                            index=poi_index,
                         )
+                    # don't modify the cached dataframe
+                    data = data.copy()
 
                     for u in filter(lambda x: x.startswith("err_"), data.keys()):
                         data.loc[:, u] = action_err(
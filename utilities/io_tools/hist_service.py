@@ -0,0 +1,351 @@
+"""
+Long-lived service answering queries about histmaker outputs.
+The files are opened once and the decoded histograms are kept in an LRU cache,
+so that repeated queries (e.g. from a notebook) don't reload and unpickle the full output.
+
+Endpoints (GET, parameters as query string):
+    /files                                   loaded files
+    /procs     file                          processes in a file
+    /hists     file, proc                    histogram names of a process
+    /axes      file, proc, hist              axes of a histogram
+    /values    file, proc, hist [, project, select, scale, flow, format]
+                                             values and variances of a (projected) histogram,
+                                             as json or as a .npy buffer with values and variances stacked
+    /yields    file, hist [, procs, select, scale]
+                                             sum of values and variances for each process
+    /stats                                   cache usage
+
+'file' is the index or the base name of a loaded file, it can be omitted if only one file is loaded.
+'project' is a comma separated list of axes to keep.
+'select' is a semicolon separated list of "axis:bin" (removes the axis) or "axis:low:high" (sums the bins in [low, high) ),
+bins are given as indices, or as axis values if they contain a '.'.
+'scale' is one of "none", "xsec" (default, cross section over sum of weights) or "lumi" (xsec times luminosity of data)
+"""
+
+import collections
+import http.client
+import http.server
+import io
+import json
+import os
+import socket
+import socketserver
+import threading
+import urllib.parse
+
+import h5py
+import hist
+import numpy as np
+
+from utilities.io_tools import input_tools
+from wums import ioutils, logging
+
+logger = logging.child_logger(__name__)
+
+
+def _parse_bin(value):
+    if value == "":
+        return None
+    if "." in value:
+        return complex(0, float(value))
+    return int(value)
+
+
+def parse_selection(select):
+    selection = {}
+    if not select:
+        return selection
+    for sel in select.split(";"):
+        name, *bins = sel.split(":")
+        if len(bins) == 1:
+            selection[name] = _parse_bin(bins[0])
+        elif len(bins) == 2:
+            selection[name] = slice(_parse_bin(bins[0]), _parse_bin(bins[1]), hist.sum)
+        else:
+            raise ValueError(f"Invalid selection {sel}")
+    return selection
+
+
+def axis_info(axis):
+    info = {
+        "name": axis.name,
+        "type": type(axis).__name__,
+        "size": axis.size,
+        "underflow": axis.traits.underflow,
+        "overflow": axis.traits.overflow,
+    }
+    if isinstance(axis, (hist.axis.IntCategory, hist.axis.StrCategory)):
+        info["bins"] = [b for b in axis]
+    else:
+        info["edges"] = axis.edges.tolist()
+    return info
+
+
+class HistStore(object):
+    """
+    Open histmaker outputs and cache the decoded (and scaled) histograms, least recently used first out
+    """
+
+    def __init__(self, infiles, cache_size=64):
+        self.cache_size = cache_size
+        self.names = []
+        self.files = []
+        self.results = []
+        for infile in infiles:
+            h5file = h5py.File(infile, "r")
+            self.names.append(os.path.basename(infile))
+            self.files.append(h5file)
+            self.results.append(input_tools.load_results_h5py(h5file))
+            logger.info(f"Loaded {infile}")
+
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        for h5file in self.files:
+            h5file.close()
+
+    def file_index(self, file=None):
+        if file is None:
+            if len(self.files) != 1:
+                raise ValueError("Multiple files loaded, specify 'file'")
+            return 0
+        if file in self.names:
+            return self.names.index(file)
+        return int(file)
+
+    def procs(self, file=None):
+        results = self.results[self.file_index(file)]
+        return [k for k in results.keys() if k != "meta_info"]
+
+    def hist_names(self, proc, file=None):
+        results = self.results[self.file_index(file)]
+        if proc not in results:
+            raise ValueError(f"Invalid process {proc}")
+        return list(results[proc]["output"].keys())
+
+    def get(self, proc, name, file=None, scale="xsec"):
+        ifile = self.file_index(file)
+        key = (ifile, proc, name, scale)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        results = self.results[ifile]
+        if scale == "none":
+            h = results[proc]["output"][name]
+            if isinstance(h, ioutils.H5PickleProxy):
+                h = h.get()
+        else:
+            h = input_tools.load_and_scale(
+                results, proc, name, calculate_lumi=scale == "lumi"
+            )
+
+        with self._lock:
+            self._cache[key] = h
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return h
+
+    def select(self, proc, name, file=None, scale="xsec", select=None, project=None):
+        h = self.get(proc, name, file, scale)
+        selection = parse_selection(select)
+        if selection:
+            h = h[selection]
+        if project:
+            h = h.project(*project.split(","))
+        return h
+
+    def yields(self, name, procs=None, file=None, scale="xsec", select=None):
+        if procs is None:
+            procs = [
+                p for p in self.procs(file) if name in self.hist_names(p, file=file)
+            ]
+        else:
+            procs = procs.split(",")
+        res = {}
+        for proc in procs:
+            h = self.select(proc, name, file, scale, select)
+            value = h.sum(flow=True)
+            if hasattr(value, "variance"):
+                res[proc] = {"value": value.value, "variance": value.variance}
+            else:
+                res[proc] = {"value": float(value), "variance": float(value)}
+        return res
+
+
+class HistRequestHandler(http.server.BaseHTTPRequestHandler):
+    store = None
+
+    def send(self, body, content_type="application/json", status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, obj, status=200):
+        self.send(json.dumps(obj).encode(), status=status)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        params = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        try:
+            self.handle_query(url.path.strip("/"), params)
+        except (KeyError, ValueError, IndexError) as e:
+            self.send_json({"error": f"{type(e).__name__}: {e}"}, status=400)
+
+    def handle_query(self, endpoint, params):
+        store = self.store
+        file = params.get("file")
+        if endpoint == "files":
+            self.send_json(store.names)
+        elif endpoint == "procs":
+            self.send_json(store.procs(file))
+        elif endpoint == "hists":
+            self.send_json(store.hist_names(params["proc"], file))
+        elif endpoint == "axes":
+            h = store.get(params["proc"], params["hist"], file, "none")
+            self.send_json([axis_info(a) for a in h.axes])
+        elif endpoint == "values":
+            h = store.select(
+                params["proc"],
+                params["hist"],
+                file,
+                params.get("scale", "xsec"),
+                params.get("select"),
+                params.get("project"),
+            )
+            flow = params.get("flow", "0") == "1"
+            values = np.asarray(h.values(flow=flow))
+            variances = h.variances(flow=flow)
+            if variances is None:
+                variances = values
+            if params.get("format", "json") == "npy":
+                buf = io.BytesIO()
+                np.save(buf, np.stack([values, np.asarray(variances)]))
+                self.send(buf.getvalue(), content_type="application/octet-stream")
+            else:
+                self.send_json(
+                    {
+                        "axes": [axis_info(a) for a in h.axes],
+                        "values": values.tolist(),
+                        "variances": np.asarray(variances).tolist(),
+                    }
+                )
+        elif endpoint == "yields":
+            self.send_json(
+                store.yields(
+                    params["hist"],
+                    params.get("procs"),
+                    file,
+                    params.get("scale", "xsec"),
+                    params.get("select"),
+                )
+            )
+        elif endpoint == "stats":
+            self.send_json(
+                {
+                    "cached": len(store._cache),
+                    "hits": store.hits,
+                    "misses": store.misses,
+                }
+            )
+        else:
+            self.send_json({"error": f"Unknown endpoint {endpoint}"}, status=404)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ThreadingUnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("local", 0)
+
+
+def make_server(store, address):
+    """
+    address is either "host:port" for a TCP server or the path of a unix socket
+    """
+    handler = type("Handler", (HistRequestHandler,), {"store": store})
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        return http.server.ThreadingHTTPServer((host, int(port)), handler)
+    if os.path.exists(address):
+        os.remove(address)
+    return ThreadingUnixHTTPServer(address, handler)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+class HistClient(object):
+    """
+    Query a running service, e.g. HistClient("localhost:8765").values("ZmumuPostVFP", "nominal", project="pt")
+    """
+
+    def __init__(self, address, timeout=None):
+        self.address = address
+        self.timeout = timeout
+
+    def connection(self):
+        if ":" in self.address:
+            host, port = self.address.rsplit(":", 1)
+            return http.client.HTTPConnection(host, int(port), timeout=self.timeout)
+        return _UnixHTTPConnection(self.address, timeout=self.timeout)
+
+    def query(self, endpoint, **params):
+        params = {k: v for k, v in params.items() if v is not None}
+        conn = self.connection()
+        try:
+            conn.request("GET", f"/{endpoint}?{urllib.parse.urlencode(params)}")
+            response = conn.getresponse()
+            body = response.read()
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise RuntimeError(
+                f"Query {endpoint} failed: {json.loads(body).get('error', body)}"
+            )
+        if response.getheader("Content-Type") == "application/octet-stream":
+            return np.load(io.BytesIO(body))
+        return json.loads(body)
+
+    def procs(self, file=None):
+        return self.query("procs", file=file)
+
+    def hist_names(self, proc, file=None):
+        return self.query("hists", proc=proc, file=file)
+
+    def axes(self, proc, name, file=None):
+        return self.query("axes", proc=proc, hist=name, file=file)
+
+    def values(self, proc, name, file=None, **kwargs):
+        # returns values and variances as numpy arrays
+        res = self.query(
+            "values", proc=proc, hist=name, file=file, format="npy", **kwargs
+        )
+        return res[0], res[1]
+
+    def yields(self, name, procs=None, file=None, **kwargs):
+        if procs is not None and not isinstance(procs, str):
+            procs = ",".join(procs)
+        return self.query("yields", hist=name, procs=procs, file=file, **kwargs)
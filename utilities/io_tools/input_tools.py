@@ -1,3 +1,4 @@
+import collections.abc
 import json
 import os
 import pickle
@@ -23,11 +24,117 @@ scetlib_tnp_match_expr = [
 ]
 
 
+# record of the histmaker output files with the metadata and an index of the results,
+# readable without loading the results
+results_index_name = "meta_index"
+results_index_version = 1
+
+
 def load_results_h5py(h5file):
     if "results" in h5file.keys():
         return ioutils.pickle_load_h5py(h5file["results"])
     else:
-        return {k: ioutils.pickle_load_h5py(v) for k, v in h5file.items()}
+        return {
+            k: ioutils.pickle_load_h5py(v)
+            for k, v in h5file.items()
+            if k != results_index_name
+        }
+
+
+def describe_output(obj):
+    # properties of an output object needed to plan reading it, without the contents
+    if isinstance(obj, hist.Hist):
+        return {
+            "type": "Hist",
+            "axes": list(obj.axes.name),
+            "shape": list(obj.axes.size),
+            "storage": obj.storage_type.__name__,
+            "nbytes": obj.view(flow=True).nbytes,
+        }
+    return {"type": type(obj).__name__}
+
+
+def make_results_index(results, meta_info=None):
+    """
+    Index of the results of a histmaker, with the same structure as the results
+    (datasets with 'dataset', 'lumi', 'weight_sum', 'event_count' and 'output') but with the
+    description of the output objects instead of the objects, and without the list of input files
+    """
+    datasets = {}
+    for name, result in results.items():
+        if not isinstance(result, dict) or "dataset" not in result:
+            continue
+        entry = {k: v for k, v in result.items() if k not in ["dataset", "output"]}
+        entry["dataset"] = {
+            k: v for k, v in result["dataset"].items() if k != "filepaths"
+        }
+        entry["dataset"]["n_files"] = len(result["dataset"].get("filepaths", []))
+        entry["output"] = {
+            k: describe_output(v.get() if isinstance(v, ioutils.H5PickleProxy) else v)
+            for k, v in result.get("output", {}).items()
+        }
+        datasets[name] = entry
+
+    if meta_info is None:
+        meta_info = results.get("meta_info", results.get("meta_data", None))
+
+    return {
+        "version": results_index_version,
+        "meta_info": meta_info,
+        "datasets": datasets,
+    }
+
+
+class LazyResults(collections.abc.Mapping):
+    """
+    Results of an output file with one record per dataset, each record is only loaded when it is accessed
+    """
+
+    def __init__(self, h5file):
+        self.h5file = h5file
+        self._keys = [k for k in h5file.keys() if k != results_index_name]
+        self._loaded = {}
+
+    def __getitem__(self, key):
+        if key not in self._loaded:
+            if key not in self._keys:
+                raise KeyError(key)
+            self._loaded[key] = ioutils.pickle_load_h5py(self.h5file[key])
+        return self._loaded[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def loaded(self):
+        # the records loaded so far
+        return self._loaded
+
+
+def read_index_h5py(h5file):
+    if results_index_name not in h5file.keys():
+        return None
+    return ioutils.pickle_load_h5py(h5file[results_index_name])
+
+
+def get_index(infile):
+    """
+    Metadata and index of the results of a histmaker output file, see make_results_index.
+    Only the index is read from files written with it, the results are loaded for older files
+    """
+    if infile.endswith(".hdf5"):
+        with h5py.File(infile, "r") as h5file:
+            index = read_index_h5py(h5file)
+            if index is None:
+                logger.info(f"No index found in {infile}, load the results")
+                index = make_results_index(load_results_h5py(h5file))
+        return index
+    elif infile.endswith(".pkl.lz4"):
+        with lz4.frame.open(infile) as f:
+            return make_results_index(pickle.load(f))
+    raise ValueError(f"{infile} has unsupported file type")
 
 
 def read_and_scale_pkllz4(fname, proc, histname, calculate_lumi=False, scale=1):
@@ -37,9 +144,15 @@ def read_and_scale_pkllz4(fname, proc, histname, calculate_lumi=False, scale=1):
     return load_and_scale(results, proc, histname, calculate_lumi, scale)
 
 
+def load_index_or_results_h5py(h5file):
+    # the datasets of the index have the same structure as the results, apart from the output objects
+    index = read_index_h5py(h5file)
+    return index["datasets"] if index is not None else load_results_h5py(h5file)
+
+
 def read_hist_names(fname, proc):
     with h5py.File(fname, "r") as h5file:
-        results = load_results_h5py(h5file)
+        results = load_index_or_results_h5py(h5file)
         if proc not in results:
             raise ValueError(f"Invalid process {proc}! No output found in file {fname}")
         return results[proc]["output"].keys()
@@ -47,19 +160,20 @@ def read_hist_names(fname, proc):
 
 def read_keys(fname):
     with h5py.File(fname, "r") as h5file:
-        results = load_results_h5py(h5file)
-        return results.keys()
+        if "results" in h5file.keys():
+            return load_results_h5py(h5file).keys()
+        return [k for k in h5file.keys() if k != results_index_name]
 
 
 def read_xsec(fname, proc):
     with h5py.File(fname, "r") as h5file:
-        results = load_results_h5py(h5file)
+        results = load_index_or_results_h5py(h5file)
         return results[proc]["dataset"]["xsec"]
 
 
 def read_sumw(fname, proc):
     with h5py.File(fname, "r") as h5file:
-        results = load_results_h5py(h5file)
+        results = load_index_or_results_h5py(h5file)
         return results[proc]["weight_sum"]
 
 
@@ -74,33 +188,37 @@ def read_and_scale(
         )
 
 
+def process_scale(res_dict, proc, calculate_lumi=False, scale=1.0, apply_xsec=True):
+    # normalisation of the histograms of a process, cross section over sum of weights (times luminosity) for simulation
+    if res_dict[proc]["dataset"]["is_data"]:
+        return scale
+    if apply_xsec:
+        scale = (
+            res_dict[proc]["dataset"]["xsec"] / res_dict[proc]["weight_sum"] * scale
+        )
+    if calculate_lumi:
+        data_keys = [
+            p
+            for p in res_dict.keys()
+            if "dataset" in res_dict[p]
+            and "is_data" in res_dict[p]["dataset"]
+            and res_dict[p]["dataset"]["is_data"]
+        ]
+        lumi = sum([res_dict[p]["lumi"] for p in data_keys]) * 1000
+        if not lumi:
+            logger.warning("Did not find a data hist! Skipping calculate_lumi option")
+            lumi = 1
+        scale *= lumi
+    return scale
+
+
 def load_and_scale(
     res_dict, proc, histname, calculate_lumi=False, scale=1.0, apply_xsec=True
 ):
     h = res_dict[proc]["output"][histname]
     if isinstance(h, ioutils.H5PickleProxy):
         h = h.get()
-    if not res_dict[proc]["dataset"]["is_data"]:
-        if apply_xsec:
-            scale = (
-                res_dict[proc]["dataset"]["xsec"] / res_dict[proc]["weight_sum"] * scale
-            )
-        if calculate_lumi:
-            data_keys = [
-                p
-                for p in res_dict.keys()
-                if "dataset" in res_dict[p]
-                and "is_data" in res_dict[p]["dataset"]
-                and res_dict[p]["dataset"]["is_data"]
-            ]
-            lumi = sum([res_dict[p]["lumi"] for p in data_keys]) * 1000
-            if not lumi:
-                logger.warning(
-                    "Did not find a data hist! Skipping calculate_lumi option"
-                )
-                lumi = 1
-            scale *= lumi
-    return h * scale
+    return h * process_scale(res_dict, proc, calculate_lumi, scale, apply_xsec)
 
 
 def read_all_and_scale(fname, procs, histnames, lumi=False):
@@ -744,6 +862,9 @@ def get_metadata(infile):
             results = pickle.load(f)
     elif infile.endswith(".hdf5"):
         h5file = h5py.File(infile, "r")
+        index = read_index_h5py(h5file)
+        if index is not None:
+            return index["meta_info"]
         if "meta_info" in h5file.keys():
             return ioutils.pickle_load_h5py(h5file["meta_info"])
         meta = h5file.get("meta", h5file.get("results", None))
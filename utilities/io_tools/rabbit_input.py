@@ -1,6 +1,7 @@
 import itertools
 import re
 
+import numpy as np
 import pandas as pd
 
 import rabbit.io_tools
@@ -63,59 +64,102 @@ def decode_poi_bin(name, var):
         return next(filter(None, re.split(r"(\d+)", name_split[-1])))
 
 
-def filter_poi_bins(names, gen_axes, selections={}, base_processes=[], flow=False):
-    if isinstance(gen_axes, str):
-        gen_axes = [gen_axes]
-    if isinstance(base_processes, str):
-        base_processes = [base_processes]
-    df = pd.DataFrame({"Name": names})
-    for axis in gen_axes:
-        df[axis] = df["Name"].apply(lambda x, a=axis: decode_poi_bin(x, a))
-        df.dropna(inplace=True)
-        if flow:
-            # set underflow to -1, overflow to max bin number+1
-            max_bin = pd.to_numeric(df[axis], errors="coerce").max()
-            df[axis] = df[axis].apply(
-                lambda x, iu=max_bin: (
-                    -1
-                    if x[0] == "U"
-                    else iu + 1 if x[0] == "O" else int(x) if x is not None else None
-                )
+class PoiIndex:
+    """
+    Index of a list of POI names, e.g. 'W_qGen0_ptGen3_absEtaGenU_mu'.
+    The names are decoded once per gen axis and process, such that selecting the POIs
+    for many different processes and gen axes combinations only needs array operations.
+    """
+
+    def __init__(self, names):
+        self.names = pd.Series(np.asarray(names, dtype=str))
+        self._bins = {}
+        self._processes = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def axis_bins(self, axis, flow=False):
+        # bin numbers of the gen axis for each POI, NaN if the axis is not part of the name,
+        # underflow (overflow) bins are -1 (max bin number+1) if flow=True, otherwise NaN
+        key = (axis, flow)
+        if key not in self._bins:
+            codes = self.names.str.extract(rf"^.*{re.escape(axis)}(\d+|U|O)")[0]
+            # writable copy, the array of the series is read-only with copy-on-write
+            bins = np.array(pd.to_numeric(codes, errors="coerce"), dtype=float)
+            if flow:
+                max_bin = np.nanmax(bins) if np.any(np.isfinite(bins)) else -1
+                bins[(codes == "U").to_numpy()] = -1
+                bins[(codes == "O").to_numpy()] = max_bin + 1
+            self._bins[key] = bins
+        return self._bins[key]
+
+    def process_mask(self, base_process, naxes):
+        # POIs from the base process with exactly 'naxes' gen axes
+        # (strip off process prefix and poi type postfix and compare length of gen axes assuming they are separated by '_')
+        if base_process not in self._processes:
+            starts = self.names.str.startswith(base_process).to_numpy()
+            ntokens = (
+                self.names.str.replace(base_process, "", regex=False)
+                .str.count("_")
+                .to_numpy()
+                - 1
             )
-        else:
-            # set underflow and overflow to None
-            df[axis] = df[axis].apply(
-                lambda x: None if x is None or x[0] in ["U", "O"] else int(x)
+            self._processes[base_process] = (starts, np.maximum(ntokens, 0))
+        starts, ntokens = self._processes[base_process]
+        return starts & (ntokens == naxes)
+
+    def select(self, gen_axes, selections={}, base_processes=[], flow=False):
+        if isinstance(gen_axes, str):
+            gen_axes = [gen_axes]
+        if isinstance(base_processes, str):
+            base_processes = [base_processes]
+
+        mask = np.zeros(len(self), dtype=bool)
+        for p in base_processes:
+            mask |= self.process_mask(p, len(gen_axes))
+
+        bins = [self.axis_bins(axis, flow) for axis in gen_axes]
+        for b in bins:
+            mask &= np.isfinite(b)
+
+        # gen bin selections
+        for k, v in selections.items():
+            mask &= self.axis_bins(k, flow) == v
+
+        idxs = np.flatnonzero(mask)
+        if len(bins):
+            # sort by the gen axes, the first axis varies slowest
+            order = np.lexsort([b[idxs] for b in bins[::-1]])
+            idxs = idxs[order]
+        return idxs.tolist()
+
+    def flow_axes(self):
+        # all axes where the flow bins are included
+        return list(
+            set(
+                t[:-1]
+                for name in self.names
+                for t in name.split("_")[1:-1]
+                if len(t) and t[-1] in ["U", "O"]
             )
-
-    # filter out rows with NaNs
-    mask = ~df.isna().any(axis=1)
-    # select rows from base process
-    if len(base_processes):
-        mask = mask & df["Name"].apply(
-            lambda x, b=base_processes: any([x.startswith(p) for p in b])
-        )
-    # remove rows that have additional axes that are not required (strip off process prefix and poi type postfix and compare length of gen axes assuming they are separated by '_')
-    mask = mask & df["Name"].apply(
-        lambda x, a=gen_axes, b=base_processes: any(
-            (
-                len(x.replace(p, "").split("_")[1:-1]) == len(a)
-                if x.startswith(p)
-                else False
-            )
-            for p in b
         )
-    )
-    # gen bin selections
-    for k, v in selections.items():
-        mask = mask & (df[k] == v)
 
-    filtered_df = df[mask]
 
-    return filtered_df.sort_values(list(gen_axes)).index.to_list()
+def filter_poi_bins(
+    names, gen_axes, selections={}, base_processes=[], flow=False, index=None
+):
+    if index is None:
+        index = PoiIndex(names)
+    return index.select(
+        gen_axes, selections=selections, base_processes=base_processes, flow=flow
+    )
 
 
-def select_pois(df, gen_axes=[], selections={}, base_processes=[], flow=False):
+def select_pois(
+    df, gen_axes=[], selections={}, base_processes=[], flow=False, index=None
+):
+    # a PoiIndex of df["Name"] can be given to avoid decoding the names again for each selection
     return df.iloc[
         filter_poi_bins(
             df["Name"].values,
@@ -123,5 +167,6 @@ def select_pois(df, gen_axes=[], selections={}, base_processes=[], flow=False):
             selections=selections,
             base_processes=base_processes,
             flow=flow,
+            index=index,
         )
     ]
@@ -0,0 +1,105 @@
+import os
+import tempfile
+
+import h5py
+import hist
+import numpy as np
+
+from wums import logging
+
+logger = logging.child_logger(__name__)
+
+
+class StagedTensorWriter(object):
+    """
+    Wrap a rabbit TensorWriter such that the systematic variations are streamed to a chunked HDF5 staging file
+    as soon as they are produced, instead of being accumulated by the writer while the inputs are processed.
+    They are added to the writer, one at a time and in the original order, only when 'write' is called,
+    so the peak memory is the larger of the input processing and the final assembly rather than their sum.
+    All other calls are passed to the wrapped writer, the output file is the same.
+    """
+
+    def __init__(self, writer, staging_dir=None, compression=None):
+        self.writer = writer
+        self.compression = compression
+        fd, self.staging_path = tempfile.mkstemp(
+            suffix=".hdf5", prefix="rabbit_staging_", dir=staging_dir
+        )
+        os.close(fd)
+        self.staging_file = h5py.File(self.staging_path, "w")
+        # empty histograms with the axes of the staged variations, shared between variations with the same axes
+        self.templates = []
+        self.records = []
+        self.staged_bytes = 0
+        logger.info(f"Staging systematic variations in {self.staging_path}")
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    def template_index(self, h):
+        for i, t in enumerate(self.templates):
+            if t.storage_type == h.storage_type and t.axes == h.axes:
+                return i
+        self.templates.append(hist.Hist(*h.axes, storage=h.storage_type()))
+        return len(self.templates) - 1
+
+    def add_systematic(self, h, name, process, channel, **kwargs):
+        paired = isinstance(h, (list, tuple))
+        # up and down variations are passed together
+        hists = h if paired else [h]
+
+        datasets = []
+        for i, hvar in enumerate(hists):
+            values = np.asarray(hvar.view(flow=True))
+            dsname = f"{len(self.records)}_{i}"
+            self.staging_file.create_dataset(
+                dsname,
+                data=values,
+                chunks=True if values.ndim else None,
+                compression=self.compression,
+            )
+            self.staged_bytes += values.nbytes
+            datasets.append((dsname, self.template_index(hvar)))
+
+        self.records.append(
+            {
+                "datasets": datasets,
+                "container": type(h) if paired else None,
+                "args": (name, process, channel),
+                "kwargs": kwargs,
+            }
+        )
+
+    def load_hist(self, dsname, itemplate):
+        h = self.templates[itemplate].copy()
+        h.view(flow=True)[...] = self.staging_file[dsname][...]
+        return h
+
+    def flush(self):
+        # add the staged systematics to the writer in the order they were produced
+        logger.info(
+            f"Adding {len(self.records)} staged systematics ({self.staged_bytes/1024**3:.2f} GB) to the writer"
+        )
+        for record in self.records:
+            hists = [self.load_hist(*ds) for ds in record["datasets"]]
+            self.writer.add_systematic(
+                record["container"](hists) if record["container"] else hists[0],
+                *record["args"],
+                **record["kwargs"],
+            )
+            for dsname, _ in record["datasets"]:
+                del self.staging_file[dsname]
+        self.records = []
+        self.staged_bytes = 0
+
+    def close(self):
+        self.staging_file.close()
+        if os.path.isfile(self.staging_path):
+            os.remove(self.staging_path)
+
+    def write(self, *args, **kwargs):
+        try:
+            self.flush()
+        finally:
+            self.close()
+        return self.writer.write(*args, **kwargs)
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import pickle
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from utilities.io_tools import input_tools
+from wums import ioutils, logging
+
+logger = logging.child_logger(__name__)
+
+yield_columns = ["process", "histogram", "selection", "yield", "variance"]
+
+# computed yields of each file, keyed by the real path, the entries are only reused as long as the file is not modified
+_yields_cache = {}
+
+
+def hist_yield(h, flow=False):
+    """
+    Sum of the values and of the variances of a histogram, from a single pass over its view.
+    The variance is None for histograms without variances
+    """
+    view = h.view(flow=flow)
+    if view.dtype.names is not None and "variance" in view.dtype.names:
+        return float(np.sum(view["value"])), float(np.sum(view["variance"]))
+    return float(np.sum(view)), None
+
+
+def _selection_key(selection):
+    # hashable and stable between sessions (for the cache on disk)
+    def key(v):
+        if isinstance(v, slice):
+            return ("slice", key(v.start), key(v.stop), key(v.step))
+        if callable(v):
+            return getattr(v, "__name__", repr(v))
+        if isinstance(v, (bool, int, float, complex, str)) or v is None:
+            return v
+        return repr(v)
+
+    return tuple(sorted((k, key(v)) for k, v in selection.items()))
+
+
+def _file_key(infile):
+    stat = os.stat(infile)
+    return os.path.realpath(infile), stat.st_mtime_ns, stat.st_size
+
+
+def _cache_file(cache_dir, path):
+    return os.path.join(
+        cache_dir, f"yields_{hashlib.sha1(path.encode()).hexdigest()}.pkl"
+    )
+
+
+def _load_cache(infile, cache_dir=None):
+    key = _file_key(infile)
+    entry = _yields_cache.get(key[0])
+    if entry is not None and entry["key"] == key:
+        return entry
+    entry = {"key": key, "yields": {}}
+    if cache_dir is not None:
+        cache_file = _cache_file(cache_dir, key[0])
+        if os.path.isfile(cache_file):
+            with open(cache_file, "rb") as f:
+                stored = pickle.load(f)
+            if stored["key"] == key:
+                entry = stored
+    _yields_cache[key[0]] = entry
+    return entry
+
+
+def _store_cache(entry, cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(_cache_file(cache_dir, entry["key"][0]), "wb") as f:
+        pickle.dump(entry, f)
+
+
+def make_yields_df(
+    infile,
+    histnames,
+    procs=None,
+    selections=None,
+    calculate_lumi=True,
+    apply_xsec=True,
+    flow=False,
+    cache_dir=None,
+):
+    """
+    Yields of histmaker outputs as a tidy dataframe with one row per (process, histogram, selection).
+    The results file is opened once, each histogram is read at most once and reduced for all selections,
+    only the requested histograms are read.
+    The yields are cached per file (in memory and, if 'cache_dir' is given, on disk),
+    so that tables built from many configurations of the same files only compute new entries.
+
+    selections: dict of {label: {axis: index or slice}} passed to the histogram's __getitem__, e.g.
+        {"inclusive": {}, "passIso": {"passIso": True}} ("inclusive" is used if not given).
+    Uncertainties are the square root of the summed variances (NaN for histograms without variances)
+    """
+    if isinstance(histnames, str):
+        histnames = [histnames]
+    if selections is None:
+        selections = {"inclusive": {}}
+
+    entry = _load_cache(infile, cache_dir)
+    cached = entry["yields"]
+
+    def cache_key(proc, histname, label):
+        selection = _selection_key(selections[label])
+        return (proc, histname, selection, calculate_lumi, apply_xsec, flow)
+
+    h5file = None
+    results = None
+    updated = False
+    try:
+        if procs is None:
+            if entry.get("procs") is None:
+                h5file = h5py.File(infile, "r")
+                results = input_tools.load_results_h5py(h5file)
+                entry["procs"] = [p for p in results.keys() if p != "meta_info"]
+                updated = True
+            procs = entry["procs"]
+
+        for proc in procs:
+            for histname in histnames:
+                missing = [
+                    label
+                    for label in selections
+                    if cache_key(proc, histname, label) not in cached
+                ]
+                if not missing:
+                    continue
+                if results is None:
+                    h5file = h5py.File(infile, "r")
+                    results = input_tools.load_results_h5py(h5file)
+                if histname not in results[proc]["output"]:
+                    logger.debug(f"Histogram {histname} not found for {proc}")
+                    continue
+                h = results[proc]["output"][histname]
+                if isinstance(h, ioutils.H5PickleProxy):
+                    h = h.get()
+                scale = input_tools.process_scale(
+                    results, proc, calculate_lumi, apply_xsec=apply_xsec
+                )
+                for label in missing:
+                    selection = selections[label]
+                    value, variance = hist_yield(
+                        h[selection] if selection else h, flow=flow
+                    )
+                    cached[cache_key(proc, histname, label)] = (
+                        value * scale,
+                        np.nan if variance is None else variance * scale**2,
+                    )
+                updated = True
+    finally:
+        if h5file is not None:
+            h5file.close()
+
+    if updated and cache_dir is not None:
+        _store_cache(entry, cache_dir)
+
+    rows = [
+        (proc, histname, label, *cached[cache_key(proc, histname, label)])
+        for proc in procs
+        for histname in histnames
+        for label in selections
+        if cache_key(proc, histname, label) in cached
+    ]
+    df = pd.DataFrame(rows, columns=yield_columns)
+    df["uncertainty"] = np.sqrt(df["variance"])
+    df.insert(0, "file", infile)
+    return df
+
+
+def make_yields_table(infiles, histnames, **kwargs):
+    # yields of several files, with one row per file, process, histogram and selection
+    return pd.concat(
+        [make_yields_df(infile, histnames, **kwargs) for infile in infiles],
+        ignore_index=True,
+    )
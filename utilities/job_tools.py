@@ -0,0 +1,228 @@
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+
+from wums import logging
+
+logger = logging.child_logger(__name__)
+
+
+class Job(object):
+    def __init__(
+        self,
+        name,
+        cmd,
+        deps=[],
+        inputs=[],
+        outputs=[],
+        threads=1,
+        retries=0,
+        dry_run=False,
+    ):
+        self.name = name
+        self.cmd = cmd
+        self.deps = list(deps)
+        # files whose content (together with the command) defines if a previous run can be reused
+        self.inputs = list(inputs)
+        # files that must exist for a previous run to be reused
+        self.outputs = list(outputs)
+        self.threads = threads
+        self.retries = retries
+        # only print the command, the job counts as successful
+        self.dry_run = dry_run
+
+        self.status = "pending"
+        self.attempts = 0
+        self.duration = 0.0
+
+    def input_hash(self):
+        sha = hashlib.sha256(self.cmd.encode())
+        for path in self.inputs:
+            sha.update(path.encode())
+            if not os.path.isfile(path):
+                sha.update(b"missing")
+                continue
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+        return sha.hexdigest()
+
+
+class JobGraph(object):
+    """
+    Run shell commands with dependencies between them on a local pool of workers.
+    Jobs are started as soon as all their dependencies succeeded and enough of the 'ncores' cores are free,
+    each job takes 'threads' cores (the thread count is passed to the job through OMP_NUM_THREADS and the TF equivalents).
+    Jobs depending on a failed job are not run, independent jobs continue.
+
+    With a 'cache_dir', a stamp with the hash of the command and the content of the inputs is written for each successful job,
+    a job with an unchanged hash (and existing outputs) is not rerun.
+    With a 'log_dir', the output of each job goes to a separate log file and a summary of each job is appended to jobs.jsonl
+    """
+
+    def __init__(self, ncores=1, cache_dir=None, log_dir=None):
+        self.ncores = max(1, ncores)
+        self.cache_dir = cache_dir
+        self.log_dir = log_dir
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, cmd, deps=[], **kwargs):
+        if name in self.jobs:
+            raise ValueError(f"Job {name} already defined")
+        for dep in deps:
+            if dep not in self.jobs:
+                raise ValueError(f"Dependency {dep} of job {name} is not defined")
+        self.jobs[name] = Job(name, cmd, deps=deps, **kwargs)
+        return name
+
+    def stamp_file(self, job):
+        return os.path.join(self.cache_dir, f"{job.name}.json")
+
+    def is_cached(self, job):
+        if self.cache_dir is None or job.dry_run:
+            return False
+        stamp = self.stamp_file(job)
+        if not os.path.isfile(stamp):
+            return False
+        with open(stamp, "r") as f:
+            info = json.load(f)
+        if info.get("hash") != job.input_hash():
+            return False
+        return all(os.path.exists(o) for o in job.outputs)
+
+    def write_stamp(self, job):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.stamp_file(job), "w") as f:
+            json.dump(
+                {
+                    "cmd": job.cmd,
+                    "hash": job.input_hash(),
+                    "time": datetime.datetime.now().isoformat(),
+                },
+                f,
+                indent=2,
+            )
+
+    def write_record(self, job):
+        if self.log_dir is None:
+            return
+        record = {
+            "name": job.name,
+            "cmd": job.cmd,
+            "status": job.status,
+            "attempts": job.attempts,
+            "duration": job.duration,
+            "threads": job.threads,
+            "time": datetime.datetime.now().isoformat(),
+        }
+        with self._lock:
+            with open(os.path.join(self.log_dir, "jobs.jsonl"), "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def execute(self, job):
+        env = dict(os.environ)
+        for var in [
+            "OMP_NUM_THREADS",
+            "TF_NUM_INTRAOP_THREADS",
+            "TF_NUM_INTEROP_THREADS",
+        ]:
+            env[var] = str(job.threads)
+
+        time0 = time.monotonic()
+        for attempt in range(job.retries + 1):
+            job.attempts = attempt + 1
+            logger.info(f"Start {job.name} (attempt {job.attempts}): {job.cmd}")
+            if self.log_dir is not None:
+                with open(os.path.join(self.log_dir, f"{job.name}.log"), "a") as log:
+                    log.write(f"# attempt {job.attempts}: {job.cmd}\n")
+                    log.flush()
+                    res = subprocess.run(
+                        job.cmd, shell=True, env=env, stdout=log, stderr=log
+                    )
+            else:
+                res = subprocess.run(job.cmd, shell=True, env=env)
+            if res.returncode == 0:
+                break
+            logger.warning(f"Job {job.name} failed with exit code {res.returncode}")
+        job.duration = time.monotonic() - time0
+        return res.returncode == 0
+
+    def run(self):
+        # returns True if all jobs succeeded
+        if self.log_dir is not None:
+            os.makedirs(self.log_dir, exist_ok=True)
+
+        pending = list(self.jobs.values())
+        running = {}
+        cores_used = 0
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.ncores) as pool:
+            while pending or running:
+                # resolve jobs that can't run or don't need to run
+                for job in pending[:]:
+                    deps_status = [self.jobs[d].status for d in job.deps]
+                    if any(s in ["failed", "skipped"] for s in deps_status):
+                        job.status = "skipped"
+                        logger.warning(f"Skip {job.name} because a dependency failed")
+                    elif any(s != "done" for s in deps_status):
+                        continue
+                    elif job.dry_run:
+                        print(job.cmd)
+                        job.status = "done"
+                    elif self.is_cached(job):
+                        logger.info(
+                            f"Inputs of {job.name} unchanged, reuse previous run"
+                        )
+                        job.status = "done"
+                    else:
+                        continue
+                    pending.remove(job)
+                    self.write_record(job)
+
+                # start ready jobs while there are free cores, a job with more threads than cores runs alone
+                for job in pending[:]:
+                    if any(self.jobs[d].status != "done" for d in job.deps):
+                        continue
+                    threads = min(job.threads, self.ncores)
+                    if running and cores_used + threads > self.ncores:
+                        continue
+                    job.status = "running"
+                    pending.remove(job)
+                    running[pool.submit(self.execute, job)] = job
+                    cores_used += threads
+
+                if not running:
+                    continue
+
+                finished, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in finished:
+                    job = running.pop(future)
+                    cores_used -= min(job.threads, self.ncores)
+                    try:
+                        success = future.result()
+                    except Exception as e:
+                        logger.error(f"Job {job.name} raised {e}")
+                        success = False
+                    job.status = "done" if success else "failed"
+                    if success:
+                        logger.info(f"Finished {job.name} in {job.duration:.1f} s")
+                        if self.cache_dir is not None:
+                            self.write_stamp(job)
+                    else:
+                        logger.error(
+                            f"Job {job.name} failed after {job.attempts} attempts: {job.cmd}"
+                        )
+                    self.write_record(job)
+
+        failed = [j.name for j in self.jobs.values() if j.status != "done"]
+        if failed:
+            logger.error(f"{len(failed)} jobs failed or were skipped: {failed}")
+        return len(failed) == 0
@@ -197,6 +197,11 @@ def common_parser(analysis_label=""):
         action="store_true",
         help="Save all recoil related histograms for calibration and validation",
     )
+    parser.add_argument(
+        "--recoilQuantileSketches",
+        action="store_true",
+        help="Store the fine resolution distributions of the recoil histograms as quantile sketches instead of histograms with O(10^5) bins",
+    )
     parser.add_argument(
         "--recoilUnc",
         action="store_true",
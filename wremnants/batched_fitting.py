@@ -0,0 +1,148 @@
+import numpy as np
+import tensorflow as tf
+
+from wums import logging
+
+logger = logging.child_logger(__name__)
+
+
+def _edm(grad, hess):
+    # estimated distance to minimum, 0.5 * g^T H^-1 g for each fit in the batch
+    try:
+        step = np.linalg.solve(hess, grad[..., np.newaxis])[..., 0]
+    except np.linalg.LinAlgError:
+        step = np.einsum("bij,bj->bi", np.linalg.pinv(hess), grad)
+    return 0.5 * np.einsum("bi,bi->b", grad, step)
+
+
+def fit_hists_batched(
+    hists, func, initial_parmvals, max_iter=100, edmtol=1e-5, func_kwargs=None
+):
+    """
+    Chi2 fit of the same function to a list of histograms with identical binning.
+    All fits are minimised together, stacking them along a leading batch dimension of a single
+    compiled graph, instead of one minimisation (and one graph tracing) per histogram.
+
+    func(xvals, parms) has the same signature as for wums.fitutils.fit_hist, parms[i] is the
+    i-th parameter of all fits with shape (nbatch, 1, ..., 1) and xvals the bin centers with a
+    leading dimension of size 1, so functions written for a single fit broadcast over the batch.
+
+    initial_parmvals is either a 1D array, used for all the fits, or one row per histogram.
+    Returns a list with one result per histogram, with the same content as wums.fitutils.fit_hist
+    """
+    if func_kwargs is None:
+        func_kwargs = {}
+
+    axes = hists[0].axes
+    for h in hists[1:]:
+        if h.axes != axes:
+            raise ValueError("All histograms of a batched fit must have the same axes")
+
+    nbatch = len(hists)
+    ndim = len(axes)
+
+    xvals = [
+        tf.constant(np.asarray(c, dtype=np.float64)[np.newaxis, ...])
+        for c in axes.centers
+    ]
+    yvals = tf.constant(np.stack([h.values() for h in hists]).astype(np.float64))
+    yvariances = np.stack([h.variances() for h in hists]).astype(np.float64)
+    # zero-variance bins are excluded from the chi2, as in wums.fitutils.chisq_loss
+    zero_variance = tf.constant(yvariances == 0.0)
+    yvariances = tf.constant(np.where(yvariances == 0.0, 1.0, yvariances))
+
+    x0 = np.asarray(initial_parmvals, dtype=np.float64)
+    if x0.ndim == 1:
+        x0 = np.broadcast_to(x0, (nbatch, len(x0)))
+    x0 = np.array(x0)
+    npar = x0.shape[-1]
+
+    def chisq(x):
+        parms = tf.reshape(tf.transpose(x), [npar, nbatch] + [1] * ndim)
+        expected = func(xvals, parms, **func_kwargs)
+        expected = tf.broadcast_to(expected, yvals.shape)
+        chisqv = (expected - yvals) ** 2 / yvariances
+        chisqv = tf.where(zero_variance, tf.zeros_like(chisqv), chisqv)
+        return tf.reduce_sum(tf.reshape(chisqv, [nbatch, -1]), axis=-1)
+
+    @tf.function
+    def loss_val(x):
+        return chisq(x)
+
+    @tf.function
+    def loss_val_grad_hess(x):
+        with tf.GradientTape() as t2:
+            t2.watch(x)
+            with tf.GradientTape() as t1:
+                t1.watch(x)
+                val = chisq(x)
+            # the fits are independent, so the gradient of the sum is the gradient of each fit
+            grad = t1.gradient(tf.reduce_sum(val), x)
+        hess = t2.batch_jacobian(grad, x)
+        return val, grad, hess
+
+    def evaluate(x):
+        val, grad, hess = loss_val_grad_hess(tf.constant(x))
+        return val.numpy(), grad.numpy(), hess.numpy()
+
+    # damped Newton (Levenberg-Marquardt) iterations, the damping is adapted for each fit
+    x = x0
+    damping = np.full(nbatch, 1e-8)
+    identity = np.eye(npar)
+    for i in range(max_iter):
+        val, grad, hess = evaluate(x)
+        edmval = _edm(grad, hess)
+        # a negative edm means that the hessian is not positive definite yet
+        converged = (edmval >= 0.0) & (edmval < edmtol)
+        if np.all(converged):
+            break
+
+        scale = np.maximum(
+            np.abs(np.diagonal(hess, axis1=1, axis2=2)).max(axis=-1), 1.0
+        )
+        damped = hess + (damping * scale)[:, np.newaxis, np.newaxis] * identity
+        try:
+            step = -np.linalg.solve(damped, grad[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:
+            step = -np.einsum("bij,bj->bi", np.linalg.pinv(damped), grad)
+        step = np.where(np.isfinite(step), step, 0.0)
+        step[converged] = 0.0
+
+        xnew = x + step
+        valnew = loss_val(tf.constant(xnew)).numpy()
+        improved = np.isfinite(valnew) & (valnew <= val)
+        x = np.where(improved[:, np.newaxis], xnew, x)
+        damping = np.clip(np.where(improved, damping * 0.1, damping * 10.0), 1e-12, 1e8)
+
+    val, grad, hess = evaluate(x)
+    edmval = _edm(grad, hess)
+    eigvals = np.linalg.eigvalsh(hess)
+
+    results = []
+    for ib in range(nbatch):
+        status = 0 if 0.0 <= edmval[ib] < edmtol else 1
+        covstatus = 0 if np.all(eigvals[ib] > 0.0) else 1
+        try:
+            # the chi2 loss is twice the negative log-likelihood
+            cov = 2.0 * np.linalg.inv(hess[ib])
+        except np.linalg.LinAlgError:
+            cov = np.full((npar, npar), np.nan)
+            covstatus = 1
+        results.append(
+            {
+                "x": x[ib],
+                "hess": hess[ib],
+                "cov": cov,
+                "status": status,
+                "covstatus": covstatus,
+                "hess_eigvals": eigvals[ib],
+                "edmval": edmval[ib],
+                "loss_val": float(val[ib]),
+            }
+        )
+
+    nbad = sum(r["status"] != 0 or r["covstatus"] != 0 for r in results)
+    logger.debug(
+        f"Batched fit of {nbatch} histograms done after {i+1} iterations, {nbad} bad fits"
+    )
+    return results
@@ -0,0 +1,484 @@
+import concurrent.futures
+import os
+import time
+
+import awkward as ak
+import numpy as np
+import uproot
+
+from wums import ioutils, logging
+
+logger = logging.child_logger(__name__)
+
+# (sqrt(s)/2 and proton mass) as used in csVariables.hpp
+beam_energy = 6500.0
+proton_mass = 0.93827208816
+
+# scales and offsets to convert angular factors into moments, see csAngularMoments in theoryTools.hpp
+helicity_moment_scales = np.array([0.0, 20.0 / 3.0, 5.0, 20.0, 4.0, 4.0, 5.0, 5.0, 4.0])
+helicity_moment_offsets = np.array([1.0, 2.0 / 3.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
+
+
+def flatten_jagged(arr):
+    """
+    Flat numpy array of a jagged branch together with the offset of the first element of each event
+    """
+    counts = ak.to_numpy(ak.num(arr))
+    starts = np.cumsum(counts) - counts
+    return ak.to_numpy(ak.flatten(arr)), starts, counts
+
+
+def to_numpy_2d(arr, start=0, stop=None):
+    """
+    Regular (events, entries) numpy array from a jagged branch with the same length for all events
+    """
+    return ak.to_numpy(ak.to_regular(arr[:, start:stop], axis=1))
+
+
+def prefsr_lepton_indices(status, statusFlags, pdgId, motherIdx):
+    """
+    Vectorised version of wrem::prefsrLeptons, returns the global (flattened) indices of
+    the lepton and the antilepton for each event
+    """
+    status, starts, counts = flatten_jagged(status)
+    statusFlags = flatten_jagged(statusFlags)[0]
+    pdgId = flatten_jagged(pdgId)[0]
+    motherIdx = flatten_jagged(motherIdx)[0]
+
+    event_starts = np.repeat(starts, counts)
+    mother_pdg = np.where(
+        motherIdx >= 0, pdgId[np.maximum(motherIdx, 0) + event_starts], 0
+    )
+
+    abs_pdg = np.abs(pdgId)
+    is_lepton = (abs_pdg >= 11) & (abs_pdg <= 16)
+    is_motherV = (mother_pdg == 23) | (np.abs(mother_pdg) == 24)
+    is_photos = is_lepton & (status == 746) & is_motherV
+    is_fromHardProcess = (statusFlags & (1 << 8)) != 0
+    is_other = is_lepton & (is_motherV | (status == 23)) & is_fromHardProcess
+    is_all = is_photos | is_other
+
+    def first_two(mask):
+        nevents = len(starts)
+        event = np.repeat(np.arange(nevents), counts)[mask]
+        idx = np.flatnonzero(mask)
+        n = np.bincount(event, minlength=nevents)
+        # rank of each selected particle within its event
+        rank = np.arange(len(idx)) - np.repeat(np.cumsum(n) - n, n)
+        out = np.zeros((nevents, 2), dtype=np.int64)
+        keep = rank < 2
+        out[event[keep], rank[keep]] = idx[keep]
+        return out, n
+
+    photos_idxs, nphotos = first_two(is_photos)
+    all_idxs, nall = first_two(is_all)
+
+    use_photos = nphotos == 2
+    if not np.all(use_photos | (nall == 2)):
+        bad = np.flatnonzero(~(use_photos | (nall == 2)))[0]
+        raise ValueError(
+            f"Expected to find 2 pre-FSR leptons, but found {nall[bad]}, {nphotos[bad]}"
+        )
+
+    selected = np.where(use_photos[:, np.newaxis], photos_idxs, all_idxs)
+    # particle (positive pdgId) first, antiparticle second
+    swap = pdgId[selected[:, 0]] <= 0
+    selected[swap] = selected[swap][:, ::-1]
+    return selected[:, 0], selected[:, 1]
+
+
+def to_cartesian(pt, eta, phi, mass):
+    px = pt * np.cos(phi)
+    py = pt * np.sin(phi)
+    pz = pt * np.sinh(eta)
+    energy = np.sqrt(px**2 + py**2 + pz**2 + mass**2)
+    return np.stack([px, py, pz, energy], axis=-1)
+
+
+def boost(p4, beta):
+    """
+    Boost four vectors p4 (..., 4) with velocity beta (..., 3), same convention as ROOT::Math::Boost
+    """
+    b2 = np.sum(beta**2, axis=-1)
+    gamma = 1.0 / np.sqrt(1.0 - b2)
+    bp = np.sum(beta * p4[..., :3], axis=-1)
+    gamma2 = np.where(b2 > 0, (gamma - 1.0) / np.where(b2 > 0, b2, 1.0), 0.0)
+    p3 = (
+        p4[..., :3]
+        + (gamma2 * bp)[..., np.newaxis] * beta
+        + (gamma * p4[..., 3])[..., np.newaxis] * beta
+    )
+    energy = gamma * (p4[..., 3] + bp)
+    return np.concatenate([p3, energy[..., np.newaxis]], axis=-1)
+
+
+def _unit(v):
+    return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+
+def cs_sine_cosine_theta_phi(antilepton, lepton):
+    """
+    Vectorised version of wrem::csSineCosThetaPhi for cartesian four vectors (..., 4),
+    returns (sintheta, costheta, sinphi, cosphi)
+    """
+    dilepton = lepton + antilepton
+    zsign = np.where(dilepton[..., 2] < 0, -1.0, 1.0)
+    pbeam = np.sqrt(beam_energy**2 - proton_mass**2)
+    zeros = np.zeros_like(zsign)
+    energy = np.full_like(zsign, beam_energy)
+    proton1 = np.stack([zeros, zeros, zsign * pbeam, energy], axis=-1)
+    proton2 = np.stack([zeros, zeros, -zsign * pbeam, energy], axis=-1)
+
+    beta = -dilepton[..., :3] / dilepton[..., 3:4]
+    pro1boost = _unit(boost(proton1, beta)[..., :3])
+    pro2boost = _unit(boost(proton2, beta)[..., :3])
+    lepton_boost = _unit(boost(lepton, beta)[..., :3])
+
+    csFrame = _unit(pro1boost - pro2boost)
+    csYaxis = _unit(np.cross(pro1boost, -pro2boost))
+    csXaxis = _unit(np.cross(csYaxis, csFrame))
+
+    costheta = np.sum(csFrame * lepton_boost, axis=-1)
+    sintheta = np.linalg.norm(np.cross(csFrame, lepton_boost), axis=-1)
+    sinphi = np.sum(csYaxis * lepton_boost, axis=-1) / sintheta
+    cosphi = np.sum(csXaxis * lepton_boost, axis=-1) / sintheta
+    return sintheta, costheta, sinphi, cosphi
+
+
+def cs_sine_cosine_theta_phi_transported(antilepton, lepton, targetV):
+    """
+    Vectorised version of wrem::csSineCosThetaPhiTransported, the leptons are boosted into the rest frame
+    of the dilepton system and from there into the lab frame with the momentum of targetV
+    """
+    dilepton = lepton + antilepton
+    beta = -dilepton[..., :3] / dilepton[..., 3:4]
+    target_beta = targetV[..., :3] / targetV[..., 3:4]
+    lepton_target = boost(boost(lepton, beta), target_beta)
+    antilepton_target = boost(boost(antilepton, beta), target_beta)
+    return cs_sine_cosine_theta_phi(antilepton_target, lepton_target)
+
+
+def cs_angular_factors(sintheta, costheta, sinphi, cosphi):
+    sin2theta = 2.0 * sintheta * costheta
+    sin2phi = 2.0 * sinphi * cosphi
+    cos2phi = 1.0 - 2.0 * sinphi * sinphi
+    return np.stack(
+        [
+            1.0 + costheta * costheta,
+            0.5 * (1.0 - 3.0 * costheta * costheta),
+            sin2theta * cosphi,
+            0.5 * sintheta * sintheta * cos2phi,
+            sintheta * cosphi,
+            costheta,
+            sintheta * sintheta * sin2phi,
+            sin2theta * sinphi,
+            sintheta * sinphi,
+        ],
+        axis=-1,
+    )
+
+
+def cs_angular_moments(csvars, weight=1.0):
+    moments = (
+        helicity_moment_scales * cs_angular_factors(*csvars) + helicity_moment_offsets
+    )
+    return np.asarray(weight)[..., np.newaxis] * moments
+
+
+def helicity_helicity_tensor(moments):
+    # diagonal (helicity, helicity) tensor as in wrem::makeHelicityMomentHelicityTensor
+    return moments[..., np.newaxis] * np.eye(moments.shape[-1])
+
+
+def mass_weight_width_decor(
+    mass_weights, width_weights, m0, gamma0, massvals, widthvals
+):
+    """
+    Vectorised version of wrem::MassWeightHelper, the mass weights are corrected with a power of one
+    of the width weights to remove the width change which accompanies the mass change
+    """
+    res = np.empty_like(mass_weights)
+    # MassWeightHelper never updates its minimum distance, it always ends up with the last width weight
+    widthIdx = len(widthvals) - 1
+    logGammaRatio = np.log(widthvals[widthIdx] / gamma0)
+    for i, m in enumerate(massvals):
+        logGammaTargetRatio = np.log(gamma0 / ((m / m0) ** 3 * gamma0))
+        widthPower = logGammaTargetRatio / logGammaRatio
+        with np.errstate(all="ignore"):
+            res[:, i] = mass_weights[:, i] * width_weights[:, widthIdx] ** widthPower
+        # protect against rare pathological cases where width weight is zero
+        res[:, i] = np.where(np.isfinite(res[:, i]), res[:, i], mass_weights[:, i])
+    return res
+
+
+def scale_tensor(scale_weights, thres=10.0):
+    # (mur, muf) ordering as in wrem::makeScaleTensor
+    return np.clip(scale_weights[:, :9], -thres, thres).reshape(-1, 3, 3)
+
+
+def boson_vars(p4):
+    """
+    Transverse momentum, mass and rapidity of cartesian four vectors (..., 4)
+    """
+    pt = np.hypot(p4[..., 0], p4[..., 1])
+    mass = np.sqrt(np.maximum(p4[..., 3] ** 2 - np.sum(p4[..., :3] ** 2, axis=-1), 0.0))
+    y = 0.5 * np.log((p4[..., 3] + p4[..., 2]) / (p4[..., 3] - p4[..., 2]))
+    return pt, mass, y
+
+
+def select_gen_part(status, pdgId, absPdgIdMin, absPdgIdMax, statusMin, statusMax):
+    """
+    Vectorised version of wrem::selectGenPart, returns the global (flattened) index of the particle
+    with the highest status in the given ranges for each event
+    """
+    abs_pdg = np.abs(pdgId)
+    score = ak.where(
+        (abs_pdg >= absPdgIdMin)
+        & (abs_pdg <= absPdgIdMax)
+        & (status >= statusMin)
+        & (status <= statusMax),
+        status,
+        -1,
+    )
+    # the first of the particles with the highest status
+    idx = ak.to_numpy(ak.argmax(score, axis=1))
+    if np.any(ak.to_numpy(ak.max(score, axis=1, initial=-1)) < 0):
+        raise ValueError(
+            "Expected to find a gen particle matching the criteria, but did not."
+        )
+    counts = ak.to_numpy(ak.num(status))
+    return np.cumsum(counts) - counts + idx
+
+
+def intermediate_gen_vars(arrays, label, statusMin, statusMax, prefsr):
+    """
+    Columns of theory_tools.define_intermediate_gen_vars, for the vector boson at an intermediate
+    state of the pythia history, given the columns of prefsr_vars
+    """
+    idx = select_gen_part(
+        arrays["GenPart_status"], arrays["GenPart_pdgId"], 23, 24, statusMin, statusMax
+    )
+    kin = {
+        var: flatten_jagged(arrays[f"GenPart_{var}"])[0][idx]
+        for var in ["pt", "eta", "phi", "mass"]
+    }
+    mom4V = to_cartesian(kin["pt"], kin["eta"], kin["phi"], kin["mass"])
+    yV = boson_vars(mom4V)[2]
+    return {
+        f"ptV{label}": kin["pt"],
+        f"massV{label}": kin["mass"],
+        f"yV{label}": yV,
+        f"absYV{label}": np.abs(yV),
+        f"chargeV{label}": prefsr["chargeVgen"],
+        f"csSineCosThetaPhi{label}": cs_sine_cosine_theta_phi_transported(
+            prefsr["genlanti"], prefsr["genl"], mom4V
+        ),
+    }
+
+
+def lhe_vars(arrays):
+    """
+    Columns of theory_tools.define_lhe_vars needed for the gen-level histograms
+    """
+    status = arrays["LHEPart_status"]
+    pdgId = arrays["LHEPart_pdgId"]
+    abs_pdg = np.abs(pdgId)
+    lheLeps = (status == 1) & (abs_pdg >= 11) & (abs_pdg <= 16)
+    counts = ak.to_numpy(ak.num(status))
+    starts = np.cumsum(counts) - counts
+
+    idxs = []
+    for mask, label in [
+        (lheLeps & (pdgId > 0), "lepton"),
+        (lheLeps & (pdgId < 0), "anti-lepton"),
+    ]:
+        if np.any(ak.to_numpy(ak.sum(mask, axis=1)) != 1):
+            raise ValueError(f"lhe {label} not found.")
+        idxs.append(starts + ak.to_numpy(ak.argmax(mask, axis=1)))
+    idx_lep, idx_antilep = idxs
+
+    kin = {
+        var: flatten_jagged(arrays[f"LHEPart_{var}"])[0]
+        for var in ["pt", "eta", "phi", "mass", "pdgId"]
+    }
+    lep = to_cartesian(*[kin[v][idx_lep] for v in ["pt", "eta", "phi", "mass"]])
+    antilep = to_cartesian(*[kin[v][idx_antilep] for v in ["pt", "eta", "phi", "mass"]])
+    ptV, massV, yV = boson_vars(lep + antilep)
+    return {
+        "ptVlhe": ptV,
+        "massVlhe": massV,
+        "yVlhe": yV,
+        "absYVlhe": np.abs(yV),
+        "chargeVlhe": kin["pdgId"][idx_lep] + kin["pdgId"][idx_antilep],
+        "csSineCosThetaPhilhe": cs_sine_cosine_theta_phi(antilep, lep),
+    }
+
+
+def prefsr_vars(arrays):
+    """
+    Columns of theory_tools.define_prefsr_vars needed for the gen-level histograms
+    """
+    idx_lep, idx_antilep = prefsr_lepton_indices(
+        arrays["GenPart_status"],
+        arrays["GenPart_statusFlags"],
+        arrays["GenPart_pdgId"],
+        arrays["GenPart_genPartIdxMother"],
+    )
+    kin = {
+        var: flatten_jagged(arrays[f"GenPart_{var}"])[0]
+        for var in ["pt", "eta", "phi", "mass", "pdgId"]
+    }
+    genl = to_cartesian(*[kin[v][idx_lep] for v in ["pt", "eta", "phi", "mass"]])
+    genlanti = to_cartesian(
+        *[kin[v][idx_antilep] for v in ["pt", "eta", "phi", "mass"]]
+    )
+    ptVgen, massVgen, yVgen = boson_vars(genl + genlanti)
+
+    return {
+        "genl": genl,
+        "genlanti": genlanti,
+        "ptVgen": ptVgen,
+        "massVgen": massVgen,
+        "ptqVgen": ptVgen / massVgen,
+        "yVgen": yVgen,
+        "absYVgen": np.abs(yVgen),
+        "chargeVgen": kin["pdgId"][idx_lep] + kin["pdgId"][idx_antilep],
+        "csSineCosThetaPhigen": cs_sine_cosine_theta_phi(genlanti, genl),
+    }
+
+
+def fill_hist(h, cols, weight=None):
+    """
+    Fill hist `h` with arrays `cols` for the leading axes, the remaining axes are tensor axes
+    matching the trailing dimensions of `weight`, in the same way as HistoBoost with tensor weights.
+    All tensor entries are scattered with a single bincount over the linearised bin index.
+    """
+    view = h.view(flow=True)
+    shape = view.shape
+    ncols = len(cols)
+    nevents = len(cols[0])
+
+    idx = np.zeros(nevents, dtype=np.int64)
+    valid = np.ones(nevents, dtype=bool)
+    for ax, x, n in zip(h.axes[:ncols], cols, shape[:ncols]):
+        ix = np.asarray(ax.index(np.asarray(x)), dtype=np.int64) + int(
+            ax.traits.underflow
+        )
+        valid &= (ix >= 0) & (ix < n)
+        idx = idx * n + np.clip(ix, 0, n - 1)
+
+    tensor_axes = h.axes[ncols:]
+    tensor_shape_flow = shape[ncols:]
+    tensor_shape = tuple(ax.size for ax in tensor_axes)
+    tensor_idx = np.ravel_multi_index(
+        tuple(
+            i + int(ax.traits.underflow)
+            for i, ax in zip(np.indices(tensor_shape), tensor_axes)
+        ),
+        tensor_shape_flow,
+    ).ravel()
+    ntensor_flow = int(np.prod(tensor_shape_flow, dtype=np.int64))
+
+    if weight is None:
+        weight = np.ones(nevents)
+    weight = np.asarray(weight, dtype=np.float64).reshape(nevents, -1)
+    if weight.shape[1] != tensor_idx.size:
+        raise ValueError(
+            f"Weight tensor of shape {weight.shape[1:]} does not match tensor axes {tensor_shape}"
+        )
+
+    lin = (idx[valid, np.newaxis] * ntensor_flow + tensor_idx).ravel()
+    weight = weight[valid].ravel()
+    size = view.size
+
+    if hasattr(view, "value"):
+        view.value[...] += np.bincount(lin, weights=weight, minlength=size).reshape(
+            shape
+        )
+        view.variance[...] += np.bincount(
+            lin, weights=weight * weight, minlength=size
+        ).reshape(shape)
+    else:
+        view[...] += np.bincount(lin, weights=weight, minlength=size).reshape(shape)
+    return h
+
+
+def process_file(filepath, dataset, branches, fill_chunk, step_size="200 MB"):
+    """
+    Fill the histograms for a single file, reading only `branches` in chunks of `step_size`
+    fill_chunk(arrays, dataset, hists) fills the dict hists and returns the per event weights
+    """
+    hists = {}
+    weight_sum = 0.0
+    event_count = 0.0
+    with uproot.open(filepath) as f:
+        tree = f["Events"]
+        available = set(tree.keys())
+        for arrays in tree.iterate(
+            [b for b in branches if b in available], step_size=step_size
+        ):
+            weights = fill_chunk(arrays, dataset, hists)
+            weight_sum += float(np.sum(weights))
+            event_count += len(weights)
+    return hists, weight_sum, event_count
+
+
+def _merge_hists(hists, other):
+    for name, h in other.items():
+        if name in hists:
+            hists[name] += h
+        else:
+            hists[name] = h
+
+
+def build_and_run(datasets, branches, fill_chunk, nproc=1, step_size="200 MB"):
+    """
+    Columnar equivalent of narf.build_and_run for gen-level histmakers,
+    processing the files of all datasets in parallel over a process pool.
+    Returns the results in the same layout, to be written with histmaker_tools.write_analysis_output
+    """
+    time0 = time.time()
+    if nproc <= 0:
+        nproc = os.cpu_count()
+
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nproc) as executor:
+        futures = {}
+        for dataset in datasets:
+            results[dataset.name] = {
+                "dataset": {
+                    "name": dataset.name,
+                    "filepaths": dataset.filepaths,
+                    "xsec": getattr(dataset, "xsec", None),
+                    "is_data": getattr(dataset, "is_data", False),
+                    "group": getattr(dataset, "group", None),
+                },
+                "weight_sum": 0.0,
+                "event_count": 0.0,
+                "output": {},
+            }
+            for filepath in dataset.filepaths:
+                future = executor.submit(
+                    process_file, filepath, dataset, branches, fill_chunk, step_size
+                )
+                futures[future] = dataset.name
+
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            hists, weight_sum, event_count = future.result()
+            _merge_hists(results[name]["output"], hists)
+            results[name]["weight_sum"] += weight_sum
+            results[name]["event_count"] += event_count
+
+    nevents = sum(r["event_count"] for r in results.values())
+    dt = time.time() - time0
+    logger.info(
+        f"Processed {nevents} events in {dt:.1f}s ({nevents/max(dt, 1e-9):.0f} events/s)"
+    )
+
+    for result in results.values():
+        result["output"] = {
+            k: ioutils.H5PickleProxy(v) for k, v in result["output"].items()
+        }
+
+    return results
@@ -885,17 +885,11 @@ class TheoryHelper(object):
                 pdf_hist, skipEntries=[{pdf_ax: "^pdf0[a-z]*"}], **pdf_args
             )
             if pdfName == "pdfHERAPDF20":
+                # the extra members of HERAPDF20 are symmetric
                 self.datagroups.addSystematic(
                     pdf_hist + "ext",
                     skipEntries=[{pdf_ax: "^pdf0[a-z]*"}],
-                    processes=processes,
-                    mirror=True,
-                    groups=[pdfName, f"{pdfName}NoAlphaS", "theory"],
-                    passToFakes=self.propagate_to_fakes,
-                    preOpMap=operation,
-                    scale=pdfInfo.get("scale", 1) * scale,
-                    symmetrize=symmetrize,
-                    systAxes=[pdf_ax],
+                    **{**pdf_args, "mirror": True},
                 )
 
     def add_pdf_alphas_variation(self, noi=False, scale=-1.0):
@@ -11,7 +11,7 @@ import numpy as np
 import pandas as pd
 
 import wums
-from utilities.io_tools import input_tools
+from utilities.io_tools import input_tools, yield_tools
 from utilities.styles import styles
 from wremnants import histselections as sel
 from wremnants.datasets.datagroup import Datagroup
@@ -41,13 +41,20 @@ class Datagroups(object):
     }
 
     def __init__(self, infile, mode=None, **kwargs):
+        # metadata and dataset information, read without loading the results if the file has an index
+        self.index = None
         if infile.endswith(".pkl.lz4"):
             with lz4.frame.open(infile) as f:
                 self.results = pickle.load(f)
         elif infile.endswith(".hdf5"):
             logger.info("Load input file")
             h5file = h5py.File(infile, "r")
-            self.results = input_tools.load_results_h5py(h5file)
+            self.index = input_tools.read_index_h5py(h5file)
+            if self.index is not None and "results" not in h5file.keys():
+                # the results of each dataset are loaded when they are needed
+                self.results = input_tools.LazyResults(h5file)
+            else:
+                self.results = input_tools.load_results_h5py(h5file)
         else:
             raise ValueError(f"{infile} has unsupported file type")
 
@@ -93,7 +100,9 @@ class Datagroups(object):
 
         make_datagroups(self, **kwargs)
 
-        self.lumi = sum([value.get("lumi", 0) for key, value in self.results.items()])
+        self.lumi = sum(
+            [value.get("lumi", 0) for key, value in self.datasetInfos().items()]
+        )
         if self.lumi > 0:
             logger.info(f"Integrated luminosity from data: {self.lumi}/fb")
         else:
@@ -114,9 +123,24 @@ class Datagroups(object):
 
         self.writer = None
 
+        # number of poisson toys written in addition to each pseudodata histogram
+        self.pseudodataToys = 0
+        self.pseudodataToysSeed = 42
+
+        # summed group histograms before rebinning and selection, only filled if enabled with enableRawHistCache
+        self.rawHistCache = None
+
+    def datasetInfos(self):
+        # results of the datasets, or their entries in the index (with the same structure but without the histograms)
+        if self.index is not None:
+            return self.index["datasets"]
+        return self.results
+
     def get_members_from_results(self, startswith=[], not_startswith=[], is_data=False):
         dsets = {
-            k: v for k, v in self.results.items() if type(v) == dict and "dataset" in v
+            k: v
+            for k, v in self.datasetInfos().items()
+            if type(v) == dict and "dataset" in v
         }
         if is_data:
             dsets = {
@@ -387,6 +411,8 @@ class Datagroups(object):
         return self.lumi * 1000 * proc.xsec / proc.weight_sum
 
     def getMetaInfo(self):
+        if self.index is not None:
+            return self.index["meta_info"]
         if "meta_info" not in self.results and "meta_data" not in self.results:
             raise ValueError("Did not find meta data in results file")
         return (
@@ -395,6 +421,12 @@ class Datagroups(object):
             else self.results["meta_data"]
         )
 
+    @staticmethod
+    def getIndex(infile):
+        # metadata, per dataset lumi, xsec and weight sums, and the axes and sizes of the histograms,
+        # read without loading the results
+        return input_tools.get_index(infile)
+
     def args_from_metadata(self, arg):
         meta_data = self.getMetaInfo()
         if "args" not in meta_data.keys():
@@ -412,9 +444,20 @@ class Datagroups(object):
         meta_info = self.getMetaInfo()
         return meta_info["command"]
 
+    def enableRawHistCache(self):
+        # keep the summed group histograms before rebinning and selection in memory,
+        # reading the same histogram again (e.g. with different histselectors) only redoes the rebinning and selection
+        # the cache is not aware of changes in the group definitions, scales or actions after it was filled
+        if self.rawHistCache is None:
+            self.rawHistCache = {}
+
     # remove a histogram that is loaded into memory from a proxy object
     def release_results(self, histname):
-        for result in self.results.values():
+        results = self.results
+        if isinstance(results, input_tools.LazyResults):
+            # results which are not loaded yet hold no histograms
+            results = results.loaded()
+        for result in results.values():
             if "output" not in result:
                 continue
             res = result["output"]
@@ -495,7 +538,24 @@ class Datagroups(object):
 
             group.hists[label] = None
 
-            for i, member in enumerate(group.members):
+            rawCacheKey = (
+                baseName,
+                syst,
+                procName,
+                nominalIfMissing,
+                forceNonzero,
+                tuple(forceToNominal),
+            )
+            useRawCache = self.rawHistCache is not None and preOpMap is None
+            fromRawCache = useRawCache and rawCacheKey in self.rawHistCache
+            if fromRawCache:
+                logger.debug(f"Use cached histogram for group {procName}")
+                hRaw, foundExactGroup = self.rawHistCache[rawCacheKey]
+                group.hists[label] = hRaw.copy() if hRaw is not None else None
+                foundExact = foundExact or foundExactGroup
+            foundExactGroup = False
+
+            for i, member in enumerate(group.members if not fromRawCache else []):
                 if (
                     sumFakesPartial
                     and procName == self.fakeName
@@ -513,6 +573,7 @@ class Datagroups(object):
                 try:
                     h = self.readHist(baseName, member, procName, read_syst)
                     foundExact = True
+                    foundExactGroup = True
                 except ValueError as e:
                     if nominalIfMissing:
                         logger.info(
@@ -635,7 +696,7 @@ class Datagroups(object):
             # now sum to fakes the partial sums which where not already done before
             # (group.hists[label] contains only the contribution from nominal histograms).
             # Then continue with the rest of the code as usual
-            if hasFake and procName == self.fakeName:
+            if hasFake and procName == self.fakeName and not fromRawCache:
                 if histForFake is not None:
                     group.hists[label] = (
                         hh.addHists(group.hists[label], histForFake, createNew=False)
@@ -643,6 +704,16 @@ class Datagroups(object):
                         else histForFake
                     )
 
+            if useRawCache and not fromRawCache:
+                self.rawHistCache[rawCacheKey] = (
+                    (
+                        group.hists[label].copy()
+                        if group.hists[label] is not None
+                        else None
+                    ),
+                    foundExactGroup,
+                )
+
             if self.rebinOp and self.rebinBeforeSelection:
                 logger.debug(f"Apply rebin operation for process {procName}")
                 group.hists[label] = self.rebinOp(group.hists[label])
@@ -999,24 +1070,21 @@ class Datagroups(object):
 
     def make_yields_df(self, histName, procs, action=lambda x: x, norm_proc=None):
         def sum_and_unc(h):
-            if not hasattr(h.sum(), "value"):
-                return (h.sum(), None)
-            else:
-                return (h.sum().value, math.sqrt(h.sum().variance))
+            value, variance = yield_tools.hist_yield(h)
+            return (value, None if variance is None else math.sqrt(variance))
 
+        yields = {
+            k: sum_and_unc(action(v.hists[histName]))
+            for k, v in self.groups.items()
+            if k in procs or k == norm_proc
+        }
         df = pd.DataFrame(
-            [
-                (k, *sum_and_unc(action(v.hists[histName])))
-                for k, v in self.groups.items()
-                if k in procs
-            ],
+            [(k, *v) for k, v in yields.items() if k in procs],
             columns=["Process", "Yield", "Uncertainty"],
         )
 
         if norm_proc and norm_proc in self.groups:
-            hist = action(self.groups[norm_proc].hists[histName])
-            denom = hist.sum() if not hasattr(hist.sum(), "value") else hist.sum().value
-            df[f"Ratio to {norm_proc} (%)"] = df["Yield"] / denom * 100
+            df[f"Ratio to {norm_proc} (%)"] = df["Yield"] / yields[norm_proc][0] * 100
 
         return df
 
@@ -1680,6 +1748,32 @@ class Datagroups(object):
                     result[key] = var_map[key]
         return result
 
+    def writePseudodata(self, h, name):
+        if h.axes.name != self.fit_axes:
+            h = h.project(*self.fit_axes)
+
+        if self.channel not in self.writer.channels:
+            self.writer.add_channel(axes=h.axes, name=self.channel)
+
+        logger.info(f"Write pseudodata {name}")
+        self.writer.add_pseudodata(h, name, self.channel)
+
+        if self.pseudodataToys > 0:
+            # poisson toys around the pseudodata, all drawn at once,
+            # the seed depends on the name so that each pseudodata set gets independent but reproducible toys
+            seed = [self.pseudodataToysSeed, *name.encode()]
+            rng = np.random.default_rng(seed)
+            values = np.maximum(h.values(flow=True), 0)
+            toys = rng.poisson(
+                values, size=(self.pseudodataToys, *values.shape)
+            ).astype(np.float64)
+            logger.info(f"Write {self.pseudodataToys} toys for pseudodata {name}")
+            for itoy, toy in enumerate(toys):
+                htoy = hist.Hist(*h.axes, storage=hist.storage.Weight())
+                htoy.values(flow=True)[...] = toy
+                htoy.variances(flow=True)[...] = toy
+                self.writer.add_pseudodata(htoy, f"{name}_toy{itoy}", self.channel)
+
     def addPseudodataHistogramFakes(
         self, pseudodata, pseudodataGroups, forceNonzero=False
     ):
@@ -1871,10 +1965,7 @@ class Datagroups(object):
             # done, now sum all histograms
             hdata = hh.sumHists(hists)
 
-        logger.info(f"Write pseudodata {pseudodata}")
-        if hdata.axes.name != self.fit_axes:
-            hdata = hdata.project(*self.fit_axes)
-        self.writer.add_pseudodata(hdata, pseudodata, self.channel)
+        self.writePseudodata(hdata, pseudodata)
 
     def addPseudodataHistograms(
         self,
@@ -1931,6 +2022,32 @@ class Datagroups(object):
             if x != self.dataName and not pseudoDataProcsRegexp.match(x)
         ]
 
+        # the contribution of the processes taken from nominal is the same for all pseudodata sets, sum it only once
+        hNomi = None
+        if len(processesFromNomi):
+            # only load nominal histograms that are not already loaded
+            processesFromNomiToLoad = [
+                proc
+                for proc in processesFromNomi
+                if self.nominalName not in self.groups[proc].hists
+            ]
+            if len(processesFromNomiToLoad):
+                logger.warning(
+                    f"These processes are taken from nominal datagroups: {processesFromNomiToLoad}"
+                )
+                self.loadHistsForDatagroups(
+                    baseName=self.nominalName,
+                    syst=self.nominalName,
+                    procsToRead=processesFromNomiToLoad,
+                    forceNonzero=forceNonzero,
+                )
+            hNomi = hh.sumHists(
+                [
+                    self.groups[proc].hists[self.nominalName]
+                    for proc in processesFromNomi
+                ]
+            )
+
         for idx, p in enumerate(pseudodata):
             pseudodataGroups.loadHistsForDatagroups(
                 baseName=self.nominalName,
@@ -1939,38 +2056,17 @@ class Datagroups(object):
                 procsToRead=processes,
                 forceNonzero=forceNonzero,
             )
-            hists = [
-                self.groups[proc].hists[p]
-                for proc in processes
-                if proc not in processesFromNomi
-            ]
+            hists = [pseudodataGroups.groups[proc].hists[p] for proc in processes]
             # now add possible processes from nominal
             logger.warning(f"Making pseudodata summing these processes: {processes}")
-            if len(processesFromNomi):
-                # only load nominal histograms that are not already loaded
-                processesFromNomiToLoad = [
-                    proc
-                    for proc in processesFromNomi
-                    if self.nominalName not in self.groups[proc].hists
-                ]
-                if len(processesFromNomiToLoad):
-                    logger.warning(
-                        f"These processes are taken from nominal datagroups: {processesFromNomiToLoad}"
-                    )
-                    self.loadHistsForDatagroups(
-                        baseName=self.nominalName,
-                        syst=self.nominalName,
-                        procsToRead=processesFromNomiToLoad,
-                        forceNonzero=forceNonzero,
-                    )
-                hists.extend(
-                    [
-                        self.groups[proc].hists[self.nominalName]
-                        for proc in processesFromNomi
-                    ]
-                )
+            if hNomi is not None:
+                hists.append(hNomi)
             # done, now sum all histograms
             hdata = hh.sumHists(hists)
+            # the variation histograms are not needed anymore once summed
+            if p != self.nominalName:
+                for proc in processes:
+                    pseudodataGroups.groups[proc].hists.pop(p, None)
             if pseudoDataAxes[idx] is None:
                 extra_ax = [ax for ax in hdata.axes.name if ax not in self.fit_axes]
                 if len(extra_ax) > 0 and extra_ax[-1] in [
@@ -2015,26 +2111,10 @@ class Datagroups(object):
                             else str(idx)
                         )
                     name = f"{p}_{pseudoDataAxes[idx]}{f'_{syst_bin}' if syst_idx not in [None, 0] else ''}"
-                    logger.info(f"Write pseudodata {name}")
-
-                    h = hdata[{pseudoDataAxes[idx]: idx}]
-                    if h.axes.name != self.fit_axes:
-                        h = h.project(*self.fit_axes)
-
-                    if self.channel not in self.writer.channels:
-                        self.writer.add_channel(axes=h.axes, name=self.channel)
-
-                    self.writer.add_pseudodata(h, name, self.channel)
+                    self.writePseudodata(hdata[{pseudoDataAxes[idx]: idx}], name)
             else:
                 # pseudodata from alternative histogram that has no syst axis
-                logger.info(f"Write pseudodata {p}")
-                if hdata.axes.name != self.fit_axes:
-                    hdata = hdata.project(*self.fit_axes)
-
-                if self.channel not in self.writer.channels:
-                    self.writer.add_channel(axes=hdata.axes, name=self.channel)
-
-                self.writer.add_pseudodata(hdata, p, self.channel)
+                self.writePseudodata(hdata, p)
 
     def addPseudodataHistogramsFitInput(
         self,
@@ -1,4 +1,5 @@
 import os
+import threading
 import time
 
 import h5py
@@ -9,6 +10,7 @@ import ROOT
 import narf
 from utilities import common
 from utilities.io_tools import input_tools
+from wremnants import quantile_sketch
 from wums import boostHistHelpers as hh
 from wums import ioutils, logging, output_tools
 
@@ -55,6 +57,8 @@ def scale_to_data(result_dict):
 
 def aggregate_groups(datasets, result_dict, groups_to_aggregate):
     # add members of groups together
+    # the members are added one histogram at a time into the histogram of the first member, and removed from
+    # the results right away, such that at most one histogram per member is loaded in addition to the sums
     time0 = time.time()
 
     for group in groups_to_aggregate:
@@ -66,19 +70,26 @@ def aggregate_groups(datasets, result_dict, groups_to_aggregate):
         logger.debug(f"Aggregate group {group}")
 
         resdict = None
-        members = {}
-        to_del = []
-        for name, result in result_dict.items():
+        output = {}
+        n_added = {}
+        for name in list(result_dict.keys()):
+            result = result_dict[name]
             if result["dataset"]["name"] not in dataset_names:
                 continue
 
             logger.debug(f"Add {name}")
 
-            for h_name, histogram in result["output"].items():
-                if h_name in members.keys():
-                    members[h_name].append(histogram.get())
+            members = result["output"]
+            for h_name in list(members.keys()):
+                # releases the histogram of the member once added
+                histo = members.pop(h_name).get()
+                if h_name in output:
+                    output[h_name] += histo
+                    n_added[h_name] += 1
                 else:
-                    members[h_name] = [histogram.get()]
+                    output[h_name] = histo
+                    n_added[h_name] = 1
+                del histo
 
             if resdict is None:
                 resdict = {
@@ -86,7 +97,7 @@ def aggregate_groups(datasets, result_dict, groups_to_aggregate):
                     "dataset": {
                         "name": group,
                         "xsec": result["dataset"]["xsec"],
-                        "filepaths": result["dataset"]["filepaths"],
+                        "filepaths": list(result["dataset"]["filepaths"]),
                     },
                     "weight_sum": float(result["weight_sum"]),
                     "event_count": float(result["event_count"]),
@@ -98,25 +109,23 @@ def aggregate_groups(datasets, result_dict, groups_to_aggregate):
                 resdict["weight_sum"] += float(result["weight_sum"])
                 resdict["event_count"] += float(result["event_count"])
 
-            to_del.append(name)
+            # delete individual dataset
+            del result_dict[name]
 
-        output = {}
-        for h_name, histograms in members.items():
+        if resdict is None:
+            continue
 
-            if len(histograms) != resdict["n_members"]:
+        for h_name, n in n_added.items():
+            if n != resdict["n_members"]:
                 logger.warning(
-                    f"There is a different number of histograms ({len(histograms)}) than original members {resdict['n_members']} for {h_name} from group {group}"
+                    f"There is a different number of histograms ({n}) than original members {resdict['n_members']} for {h_name} from group {group}"
                 )
                 logger.warning("Summing them up probably leads to wrong behaviour")
 
-            output[h_name] = ioutils.H5PickleProxy(sum(histograms))
-
         result_dict[group] = resdict
-        result_dict[group]["output"] = output
-
-        # delete individual datasets
-        for name in to_del:
-            del result_dict[name]
+        result_dict[group]["output"] = {
+            k: ioutils.H5PickleProxy(v) for k, v in output.items()
+        }
 
     logger.info(f"Aggregate groups: {time.time() - time0}")
 
@@ -201,12 +210,28 @@ def write_analysis_output(results, outfile, args):
                 f,
             )
 
+        write_results_index(f, results)
+
     logger.info(f"Writing output: {time.time()-time0}")
     logger.info(f"Output saved in {outfile}")
 
     return outfile
 
 
+def write_results_index(h5file, results):
+    # small record with the metadata and the description of the histograms, readable without loading the results
+    index = input_tools.make_results_index(
+        results, ioutils.pickle_load_h5py(h5file["meta_info"])
+    )
+    name = input_tools.results_index_name
+    if name in h5file.keys():
+        # appending to an existing output, keep the datasets written before
+        previous = ioutils.pickle_load_h5py(h5file[name])
+        index["datasets"] = {**previous["datasets"], **index["datasets"]}
+        del h5file[name]
+    ioutils.pickle_dump_h5py(name, index, h5file)
+
+
 def get_run_lumi_edges(nRunBins, era):
     if era == "2016PostVFP":
         if nRunBins == 2:
@@ -239,21 +264,31 @@ def make_quantile_helper(
     name="nominal",
     processes=["ZmumuPostVFP"],
     n_quantiles=[],
+    sketch_axis=None,
 ):
     """
     Helper to compute the quantile for `axes` from fine binned histogram with `name` in bins of the dependent axes
     The helper takes colums for `axes` and `dependent_axes` and returns the quantile the event falls as a fraction of 1
     If quantiles are performed in more than 1 dimension, the number of quantiles in the n lower dimensions must be given in 'n_quantiles'
+    If `name` is a quantile sketch, its CDF is evaluated at the bins of `sketch_axis` (1D quantiles only)
     """
 
     h5file = h5py.File(filename, "r")
     results = input_tools.load_results_h5py(h5file)
 
-    hIn = hh.sumHists(results[p]["output"][name].get() for p in processes)
-
     if isinstance(axes, str):
         axes = [axes]
 
+    hIn = [results[p]["output"][name].get() for p in processes]
+    if isinstance(hIn[0], quantile_sketch.QuantileSketch):
+        if len(axes) != 1 or len(dependent_axes):
+            raise ValueError("Quantiles from a sketch are only supported in 1D")
+        if sketch_axis is None or sketch_axis.name != axes[0]:
+            raise ValueError(f"A 'sketch_axis' with name {axes[0]} is required")
+        hIn = sum(hIn).to_hist(sketch_axis)
+    else:
+        hIn = hh.sumHists(hIn)
+
     def hist_to_helper(h):
         hConv = narf.hist_to_pyroot_boost(h, tensor_rank=0)
 
@@ -370,3 +405,220 @@ def define_norm_weight_nRecoVtx(
         f"wrem::get_differential_norm_weight(PV_npvsGood, nRecoVtxEdges, weightVals, {flows_to_unit})",
     )
     return df
+
+
+class HelperRegistry(object):
+    """
+    Helpers declared with their construction recipe and only built (once) the first time they are accessed,
+    e.g. from build_graph, so that configurations not using a helper don't pay for its construction.
+    Recipes returning several helpers are declared with a list of names, all of them are built together.
+    Helpers are accessed as attributes, helpers.pileup_helper
+    """
+
+    def __init__(self):
+        self._recipes = {}
+        self._built = {}
+        self._lock = threading.RLock()
+
+    def register(self, names, recipe, *args, **kwargs):
+        if isinstance(names, str):
+            names = (names,)
+        else:
+            names = tuple(names)
+        for name in names:
+            if name in self._recipes:
+                raise ValueError(f"Helper {name} is already registered")
+            self._recipes[name] = (names, recipe, args, kwargs)
+
+    def __contains__(self, name):
+        return name in self._recipes
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._built:
+                if name not in self._recipes:
+                    raise AttributeError(f"Helper {name} is not registered")
+                names, recipe, args, kwargs = self._recipes[name]
+                time0 = time.time()
+                res = recipe(*args, **kwargs)
+                logger.debug(f"Built helper(s) {names} in {time.time()-time0:.2f} s")
+                if len(names) == 1:
+                    res = (res,)
+                for n, h in zip(names, res, strict=True):
+                    self._built[n] = h
+            return self._built[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def built(self):
+        return list(self._built.keys())
+
+
+class CombinedTensorFill(object):
+    """
+    Fill several tensor weight columns, with the same axes and columns, into a single histogram in one pass.
+    The tensors are flattened and concatenated along one axis (wrem::concatenate_tensors), so the bin index is
+    computed once per event and a single histogram is allocated per slot instead of one per tensor.
+    After the event loop, split_hists replaces the combined histogram by the individual ones,
+    identical to filling each tensor with its own HistoBoost.
+    """
+
+    def __init__(self, name, axes, cols, storage=hist.storage.Double()):
+        self.name = name
+        self.axes = axes
+        self.cols = cols
+        self.storage = storage
+        self.parts = []
+
+    @property
+    def combined_name(self):
+        return f"{self.name}_combined"
+
+    def add(self, name, column, tensor_axes):
+        self.parts.append((name, column, list(tensor_axes)))
+
+    def book(self, df, results):
+        if len(self.parts) == 0:
+            return df
+        column = f"{self.combined_name}_tensor"
+        df = df.Define(
+            column,
+            f"wrem::concatenate_tensors({', '.join(c for _, c, _ in self.parts)})",
+        )
+        size = sum(int(np.prod([a.size for a in axes])) for _, _, axes in self.parts)
+        axis_combined = hist.axis.Integer(
+            0, size, underflow=False, overflow=False, name=self.combined_name
+        )
+        results.append(
+            histo_boost(
+                df,
+                self.combined_name,
+                self.axes,
+                self.cols,
+                [column],
+                tensor_axes=[axis_combined],
+                storage=self.storage,
+            )
+        )
+        return df
+
+    def split_hists(self, result_dict):
+        for result in result_dict.values():
+            output = result["output"]
+            if self.combined_name not in output:
+                continue
+            h = output.pop(self.combined_name).get()
+            view = h.view(flow=True)
+            nlead = view.ndim - 1
+            offset = 0
+            for name, _, tensor_axes in self.parts:
+                shape = [a.size for a in tensor_axes]
+                size = int(np.prod(shape))
+                # the tensors are concatenated in their column major storage order
+                part = view[..., offset : offset + size].reshape(
+                    *view.shape[:-1], *shape[::-1]
+                )
+                part = np.transpose(
+                    part, (*range(nlead), *range(part.ndim - 1, nlead - 1, -1))
+                )
+                offset += size
+
+                hpart = hist.Hist(*h.axes[:-1], *tensor_axes, storage=h.storage_type())
+                # the tensor axes are not filled in their flow bins
+                inner = tuple(
+                    slice(int(a.traits.underflow), int(a.traits.underflow) + a.size)
+                    for a in tensor_axes
+                )
+                hpart.view(flow=True)[(Ellipsis, *inner)] = part
+                output[name] = ioutils.H5PickleProxy(hpart)
+
+
+# global bin indices defined on the graphs by name, to restore the axes of the histograms filled by index
+global_bin_indices = {}
+
+
+class GlobalBinIndex(object):
+    """
+    Global bin index (row major, flow bins included) of a set of axes, computed from the columns once per event.
+    Histograms of many weights or tensors on the same axes and columns are filled with the index as a single
+    integer axis, so the multi dimensional bin lookup is done once per event instead of once per histogram.
+    After the event loop, unflatten_global_bin_hists restores the original axes.
+    """
+
+    def __init__(self, name, axes, cols):
+        self.name = name
+        self.axes = list(axes)
+        self.cols = list(cols)
+        self.column = f"{name}_global_bin"
+        self.shape = tuple(a.extent for a in self.axes)
+        self.size = int(np.prod(self.shape))
+        # entries outside of axes without flow bins end up in the overflow, which is dropped when unflattening
+        self.axis = hist.axis.Integer(
+            0, self.size, underflow=False, overflow=True, name=f"global_bin_{name}"
+        )
+        self._helpers = {}
+        global_bin_indices[name] = self
+
+    def matches(self, df, axes, cols):
+        return (
+            list(cols) == self.cols
+            and len(axes) == len(self.axes)
+            and all(a == b for a, b in zip(axes, self.axes))
+            and df.HasColumn(self.column)
+        )
+
+    def define(self, df):
+        coltypes = tuple(df.GetColumnType(c) for c in self.cols)
+        if coltypes not in self._helpers:
+            hcpp = narf.hist_to_pyroot_boost(
+                hist.Hist(*self.axes, storage=hist.storage.Double())
+            )
+            self._helpers[coltypes] = ROOT.wrem.GlobalBinIndexHelper[
+                type(hcpp).__cpp_name__, *coltypes
+            ](ROOT.std.move(hcpp))
+        return df.Define(self.column, self._helpers[coltypes], self.cols)
+
+    def HistoBoost(self, df, name, cols, **kwargs):
+        # 'cols' are the weight (tensor) columns only
+        return df.HistoBoost(name, [self.axis], [self.column, *cols], **kwargs)
+
+    def unflatten(self, h):
+        hout = hist.Hist(*self.axes, *h.axes[1:], storage=h.storage_type())
+        view = h.view(flow=True)[: self.size]
+        hout.view(flow=True)[...] = view.reshape(*self.shape, *view.shape[1:])
+        return hout
+
+
+def define_global_bin_index(df, name, axes, cols):
+    # an index with the same axes and columns is reused between graphs, to compile the helper only once
+    for index in global_bin_indices.values():
+        if index.cols == list(cols) and index.axes == list(axes):
+            return index.define(df)
+    return GlobalBinIndex(f"{name}{len(global_bin_indices)}", axes, cols).define(df)
+
+
+def histo_boost(df, name, axes, cols, weights=[], **kwargs):
+    # fill by global bin index if one is defined on the graph for these axes and columns
+    for index in global_bin_indices.values():
+        if index.matches(df, axes, cols):
+            return index.HistoBoost(df, name, weights, **kwargs)
+    return df.HistoBoost(name, axes, [*cols, *weights], **kwargs)
+
+
+def unflatten_global_bin_hists(result_dict):
+    # replace the histograms filled by global bin index by the histograms with the original axes
+    if len(global_bin_indices) == 0:
+        return
+    index_by_axis = {f"global_bin_{n}": i for n, i in global_bin_indices.items()}
+    for result in result_dict.values():
+        output = result["output"]
+        for name in list(output.keys()):
+            h = output[name].get()
+            if not isinstance(h, hist.Hist) or h.ndim == 0:
+                continue
+            index = index_by_axis.get(h.axes[0].name)
+            if index is not None:
+                output[name] = ioutils.H5PickleProxy(index.unflatten(h))
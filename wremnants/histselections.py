@@ -1,3 +1,5 @@
+import functools
+
 import hist
 import numpy as np
 from scipy import interpolate
@@ -53,6 +55,59 @@ def get_rebinning(edges, axis_name):
     return rebin
 
 
+def chunked_get_hist(get_hist):
+    # evaluate get_hist in chunks along the largest axis that is not used in the abcd method
+    # (e.g. the variations of a systematic) and stream the results into a single output histogram
+    @functools.wraps(get_hist)
+    def wrapper(self, h, *args, **kwargs):
+        is_nominal = kwargs.get("is_nominal", args[0] if len(args) else False)
+        chunk_axis = self.get_chunk_axis(h)
+        if is_nominal or chunk_axis is None:
+            return get_hist(self, h, *args, **kwargs)
+
+        idx_axis = h.axes.name.index(chunk_axis)
+        axis = h.axes[chunk_axis]
+        extent = axis.extent
+        if extent <= self.chunk_size:
+            return get_hist(self, h, *args, **kwargs)
+
+        logger.debug(
+            f"Evaluate histselector in chunks of {self.chunk_size} along axis {chunk_axis} with {extent} bins"
+        )
+        view = h.view(flow=True)
+        hout = None
+        for start in range(0, extent, self.chunk_size):
+            stop = min(start + self.chunk_size, extent)
+            # the chunk, including the flow bins of the original axis, is stored in an axis without flow
+            axes = [
+                (
+                    hist.axis.Integer(
+                        0, stop - start, underflow=False, overflow=False, name=a.name
+                    )
+                    if a.name == chunk_axis
+                    else a
+                )
+                for a in h.axes
+            ]
+            hchunk = hist.Hist(*axes, storage=h.storage_type())
+            sl = (slice(None),) * idx_axis + (slice(start, stop),)
+            hchunk.view(flow=True)[...] = view[sl]
+
+            hres = get_hist(self, hchunk, *args, **kwargs)
+
+            idx_out = hres.axes.name.index(chunk_axis)
+            if hout is None:
+                # preallocate the output with the original axis
+                out_axes = [a if a.name != chunk_axis else axis for a in hres.axes]
+                hout = hist.Hist(*out_axes, storage=hres.storage_type())
+            sl_out = (slice(None),) * idx_out + (slice(start, stop),)
+            hout.view(flow=True)[sl_out] = hres.view(flow=True)
+
+        return hout
+
+    return wrapper
+
+
 def divide_arrays(num, den, cutoff=1, replace=1):
     r = num / den
     # criteria = abs(den) <= cutoff
@@ -129,9 +184,11 @@ class HistselectorABCD(object):
         integrate_x=True,  # integrate the abcd x-axis in final histogram (allows simplified procedure e.g. for extrapolation method)
         abcdExplicitAxisEdges={},
         ABCDmode="simple",
+        chunk_size=None,  # maximum number of bins of the non abcd axes processed at once, None to process all at once
     ):
 
         self.ABCDmode = ABCDmode
+        self.chunk_size = chunk_size
         self.abcdExplicitAxisEdges = abcdExplicitAxisEdges
 
         # default thresholds, modifed later based on actual axis edges
@@ -289,6 +346,26 @@ class HistselectorABCD(object):
         else:
             raise RuntimeError(f"Can not find threshold for abcd axis {axis_name}")
 
+    def get_chunk_axis(self, h):
+        # largest axis of h that is neither used in the abcd method, integrated nor in the nominal histogram, can be processed in chunks
+        if self.chunk_size is None:
+            return None
+        used_axes = [
+            self.name_x,
+            self.name_y,
+            self.smoothing_axis_name,
+            *getattr(self, "fakerate_axes", []),
+            *getattr(self, "fakerate_integration_axes", []),
+        ]
+        if getattr(self, "h_nominal", None) is not None:
+            # the variances are transferred from the nominal histogram assuming the extra axes are trailing,
+            # so only the axes that are not in the nominal histogram can be split
+            used_axes.extend(self.h_nominal.axes.name)
+        axes = [a for a in h.axes if a.name not in used_axes]
+        if len(axes) == 0:
+            return None
+        return max(axes, key=lambda a: a.extent).name
+
     # A
     def get_hist_failX_failY(self, h):
         return h[{self.name_x: self.sel_dx, self.name_y: self.sel_dy}]
@@ -567,6 +644,7 @@ class FakeSelectorSimpleABCD(HistselectorABCD):
 
         return hout
 
+    @chunked_get_hist
     def get_hist(
         self,
         h,
@@ -1358,6 +1436,7 @@ class FakeSelector2DExtendedABCD(FakeSelector1DExtendedABCD):
             else s[y3 : y2 : hist.sum]
         )
 
+    @chunked_get_hist
     def get_hist(
         self,
         h,
@@ -0,0 +1,98 @@
+#ifndef WREMNANTS_COUNTER_RNG_H
+#define WREMNANTS_COUNTER_RNG_H
+
+#include <array>
+#include <cstdint>
+#include <functional>
+#include <limits>
+#include <string>
+
+namespace wrem {
+
+// Philox4x32-10 counter-based random number generator
+// (J. Salmon et al., "Parallel random numbers: as easy as 1, 2, 3", SC11)
+// the random numbers are a bijective function of a 128 bit counter and a 64 bit
+// key, so a generator can be created for each event at negligible cost and the
+// results don't depend on the thread (slot) the event is processed in.
+// Satisfies UniformRandomBitGenerator, so it can be used with the standard
+// distributions
+class Philox4x32 {
+public:
+  using result_type = std::uint32_t;
+
+  Philox4x32(const std::array<std::uint32_t, 2> &key,
+             const std::array<std::uint32_t, 4> &counter)
+      : key_(key), counter_(counter) {}
+
+  static constexpr result_type min() { return 0; }
+  static constexpr result_type max() {
+    return std::numeric_limits<result_type>::max();
+  }
+
+  result_type operator()() {
+    if (index_ == 4) {
+      block_ = generate(counter_, key_);
+      // the first counter word enumerates the blocks of 4 numbers
+      ++counter_[0];
+      index_ = 0;
+    }
+    return block_[index_++];
+  }
+
+  void discard(unsigned long long n) {
+    for (; n > 0; --n) {
+      (*this)();
+    }
+  }
+
+  static std::array<std::uint32_t, 4>
+  generate(std::array<std::uint32_t, 4> ctr, std::array<std::uint32_t, 2> key) {
+    for (int round = 0; round < 10; ++round) {
+      if (round > 0) {
+        key[0] += 0x9E3779B9;
+        key[1] += 0xBB67AE85;
+      }
+      const std::uint64_t prod0 = std::uint64_t(0xD2511F53) * ctr[0];
+      const std::uint64_t prod1 = std::uint64_t(0xCD9E8D57) * ctr[2];
+      ctr = {std::uint32_t(prod1 >> 32) ^ ctr[1] ^ key[0],
+             std::uint32_t(prod1),
+             std::uint32_t(prod0 >> 32) ^ ctr[3] ^ key[1],
+             std::uint32_t(prod0)};
+    }
+    return ctr;
+  }
+
+private:
+  std::array<std::uint32_t, 2> key_;
+  std::array<std::uint32_t, 4> counter_;
+  std::array<std::uint32_t, 4> block_;
+  unsigned int index_ = 4;
+};
+
+inline std::uint64_t splitmix64(std::uint64_t x) {
+  x += 0x9E3779B97F4A7C15ULL;
+  x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9ULL;
+  x = (x ^ (x >> 27)) * 0x94D049BB133111EBULL;
+  return x ^ (x >> 31);
+}
+
+// key identifying the use of the random numbers, such that different helpers
+// (or seeds) draw independent numbers for the same event
+inline std::uint64_t rng_purpose(const std::string &name,
+                                 const std::uint64_t seed = 0) {
+  return splitmix64(std::hash<std::string>()(name) ^ splitmix64(seed));
+}
+
+// generator for a given event and purpose,
+// the purpose and run make up the key, the lumi and event number the counter
+inline Philox4x32 event_rng(const std::uint64_t purpose, const unsigned int run,
+                            const unsigned int lumi,
+                            const unsigned long long event) {
+  const std::uint64_t key = splitmix64(purpose ^ splitmix64(run));
+  return Philox4x32({std::uint32_t(key), std::uint32_t(key >> 32)},
+                    {0, lumi, std::uint32_t(event), std::uint32_t(event >> 32)});
+}
+
+} // namespace wrem
+
+#endif
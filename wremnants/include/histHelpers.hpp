@@ -294,6 +294,57 @@ template <typename T> std::array<T, 2> envelopHists(std::vector<T> &hists) {
   return {hup, hdown};
 }
 
+// global bin index of the values of the axes of HIST, in row major order with
+// the flow bins included (as the numpy view of the histogram with flow bins),
+// computed once per event to fill many histograms on the same axes by index.
+// Values outside of axes without flow bins give the total number of bins
+template <typename HIST, typename... Xs> class GlobalBinIndexHelper {
+public:
+  GlobalBinIndexHelper(HIST &&h)
+      : hist_(std::make_shared<const HIST>(std::move(h))) {
+    size_ = 1;
+    hist_->for_each_axis([this](const auto &axis) {
+      size_ *= boost::histogram::axis::traits::extent(axis);
+    });
+  }
+
+  std::size_t operator()(const Xs &...xs) const {
+    return index_impl(std::index_sequence_for<Xs...>{}, xs...);
+  }
+
+  std::size_t size() const { return size_; }
+
+private:
+  template <std::size_t... Idxs>
+  std::size_t index_impl(std::index_sequence<Idxs...>,
+                         const Xs &...xs) const {
+    std::size_t res = 0;
+    bool valid = true;
+    ((res = accumulate_index<Idxs>(res, xs, valid)), ...);
+    return valid ? res : size_;
+  }
+
+  template <std::size_t I, typename X>
+  std::size_t accumulate_index(std::size_t res, const X &x,
+                               bool &valid) const {
+    const auto &axis = hist_->template axis<I>();
+    const int extent = boost::histogram::axis::traits::extent(axis);
+    const int shift = boost::histogram::axis::traits::options(axis) &
+                              boost::histogram::axis::option::underflow
+                          ? 1
+                          : 0;
+    const int idx = axis.index(x) + shift;
+    if (idx < 0 || idx >= extent) {
+      valid = false;
+      return res;
+    }
+    return res * extent + idx;
+  }
+
+  std::shared_ptr<const HIST> hist_;
+  std::size_t size_;
+};
+
 } // namespace wrem
 
 #endif
@@ -1032,15 +1032,13 @@ template <typename HIST> class SmearingHelper {
 
 public:
   SmearingHelper(HIST &&smearings)
-      : hash_(std::hash<std::string>()("SmearingHelper")),
+      : hash_(rng_purpose("SmearingHelper")),
         hsmear_(std::make_shared<const HIST>(std::move(smearings))) {}
 
   RVec<float> operator()(const unsigned int run, const unsigned int lumi,
                          const unsigned long long event, const RVec<float> &pts,
                          const RVec<float> &etas) const {
-    std::seed_seq seq{hash_, std::size_t(run), std::size_t(lumi),
-                      std::size_t(event)};
-    std::mt19937 rng(seq);
+    auto rng = event_rng(hash_, run, lumi, event);
 
     RVec<float> corrected_pt(pts.size(), 0.);
     for (size_t i = 0; i < pts.size(); i++) {
@@ -1062,7 +1060,7 @@ public:
   }
 
 private:
-  const std::size_t hash_;
+  const std::uint64_t hash_;
   std::shared_ptr<const HIST> hsmear_;
 };
 
@@ -1070,15 +1068,13 @@ template <typename HIST> class SmearingHelperParametrized {
 
 public:
   SmearingHelperParametrized(HIST &&smearings)
-      : hash_(std::hash<std::string>()("SmearingHelperParametrized")),
+      : hash_(rng_purpose("SmearingHelperParametrized")),
         hsmear_(std::make_shared<const HIST>(std::move(smearings))) {}
 
   RVec<float> operator()(const unsigned int run, const unsigned int lumi,
                          const unsigned long long event, const RVec<float> &pts,
                          const RVec<float> &etas) const {
-    std::seed_seq seq{hash_, std::size_t(run), std::size_t(lumi),
-                      std::size_t(event)};
-    std::mt19937 rng(seq);
+    auto rng = event_rng(hash_, run, lumi, event);
 
     RVec<float> corrected_pt(pts.size(), 0.);
     for (size_t i = 0; i < pts.size(); i++) {
@@ -1114,7 +1110,7 @@ public:
   const HIST &hist() const { return *hsmear_; }
 
 private:
-  const std::size_t hash_;
+  const std::uint64_t hash_;
   std::shared_ptr<const HIST> hsmear_;
 };
 
@@ -1692,20 +1688,15 @@ private:
 class SmearingHelperSimple {
 
 public:
-  SmearingHelperSimple(const double sigmarel, const unsigned int nslots = 1)
-      : sigmarel_(sigmarel) {
-    const unsigned int nslotsactual = std::max(nslots, 1U);
-    rng_.reserve(nslotsactual);
-    auto const hash = std::hash<std::string>()("SmearingHelperSimple");
-    for (std::size_t islot = 0; islot < nslotsactual; ++islot) {
-      std::seed_seq seq{hash, islot};
-      rng_.emplace_back(seq);
-    }
-  }
+  SmearingHelperSimple(const double sigmarel)
+      : hash_(rng_purpose("SmearingHelperSimple")), sigmarel_(sigmarel) {}
 
-  RVec<double> operator()(const unsigned int slot, const RVec<float> &recPts,
-                          const RVec<float> &recEtas,
-                          const RVec<int> &recCharges) {
+  RVec<double> operator()(const unsigned int run, const unsigned int lumi,
+                          const unsigned long long event,
+                          const RVec<float> &recPts, const RVec<float> &recEtas,
+                          const RVec<int> &recCharges) const {
+
+    auto rng = event_rng(hash_, run, lumi, event);
 
     RVec<double> res;
     res.reserve(recPts.size());
@@ -1720,7 +1711,7 @@ public:
 
       std::normal_distribution gaus{qop, dsigma};
 
-      const double qopout = gaus(rng_[slot]);
+      const double qopout = gaus(rng);
       const double pout = std::fabs(1. / qopout);
 
       const double ptout = pout / std::cosh(eta);
@@ -1732,15 +1723,15 @@ public:
   }
 
 private:
-  double sigmarel_;
-  std::vector<std::mt19937> rng_;
+  const std::uint64_t hash_;
+  const double sigmarel_;
 };
 
 template <std::size_t N> class SmearingHelperSimpleMulti {
 
 public:
   SmearingHelperSimpleMulti(const double sigmarel)
-      : hash_(std::hash<std::string>()("SmearingHelperSimpleMulti")),
+      : hash_(rng_purpose("SmearingHelperSimpleMulti")),
         sigmarel_(sigmarel) {}
 
   RVec<double> operator()(const unsigned int run, const unsigned int lumi,
@@ -1748,9 +1739,7 @@ public:
                           const RVec<float> &recPts, const RVec<float> &recEtas,
                           const RVec<int> &recCharges) {
 
-    std::seed_seq seq{hash_, std::size_t(run), std::size_t(lumi),
-                      std::size_t(event)};
-    std::mt19937 rng(seq);
+    auto rng = event_rng(hash_, run, lumi, event);
 
     RVec<double> res;
     res.reserve(N * recPts.size());
@@ -1776,7 +1765,7 @@ public:
   }
 
 private:
-  const std::size_t hash_;
+  const std::uint64_t hash_;
   const double sigmarel_;
 };
 
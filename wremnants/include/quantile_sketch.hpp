@@ -0,0 +1,164 @@
+#ifndef WREMNANTS_QUANTILE_SKETCH_H
+#define WREMNANTS_QUANTILE_SKETCH_H
+
+#include <ROOT/RDF/RActionImpl.hxx>
+#include <ROOT/RDataFrame.hxx>
+#include <TROOT.h>
+#include <algorithm>
+#include <cmath>
+#include <limits>
+#include <memory>
+#include <numeric>
+#include <vector>
+
+namespace wrem {
+
+// Weighted, mergeable quantile sketch (merging t-digest)
+// the distribution is summarised by centroids (mean, weight) sorted in mean,
+// the centroids are small in the tails and large in the bulk
+// following the scale function k(q) = compression / (2 pi) * asin(2q - 1)
+// the same compression is implemented in python in wremnants/quantile_sketch.py
+class QuantileSketch {
+public:
+  QuantileSketch(double compression = 500., std::size_t buffer_size = 0)
+      : compression_(compression),
+        buffer_size_(buffer_size > 0 ? buffer_size
+                                     : std::size_t(10 * compression)) {}
+
+  void add(double x, double w = 1.) {
+    if (!std::isfinite(x) || w == 0.) {
+      return;
+    }
+    buffer_.emplace_back(x, w);
+    min_ = std::min(min_, x);
+    max_ = std::max(max_, x);
+    if (buffer_.size() >= buffer_size_) {
+      compress();
+    }
+  }
+
+  void merge(const QuantileSketch &other) {
+    for (std::size_t i = 0; i < other.means_.size(); ++i) {
+      buffer_.emplace_back(other.means_[i], other.weights_[i]);
+    }
+    buffer_.insert(buffer_.end(), other.buffer_.begin(), other.buffer_.end());
+    min_ = std::min(min_, other.min_);
+    max_ = std::max(max_, other.max_);
+    compress();
+  }
+
+  void compress() {
+    if (buffer_.empty()) {
+      return;
+    }
+    for (std::size_t i = 0; i < means_.size(); ++i) {
+      buffer_.emplace_back(means_[i], weights_[i]);
+    }
+    std::sort(buffer_.begin(), buffer_.end());
+
+    double total = 0.;
+    for (const auto &c : buffer_) {
+      total += c.second;
+    }
+
+    means_.clear();
+    weights_.clear();
+    double cumulative = 0.;
+    long current = std::numeric_limits<long>::min();
+    double sumw = 0.;
+    double sumwx = 0.;
+    for (const auto &[x, w] : buffer_) {
+      // cluster index from the scale function at the center of the element
+      const double q =
+          total > 0. ? std::clamp((cumulative + 0.5 * w) / total, 0., 1.) : 0.;
+      const long k = std::lround(std::floor(
+          compression_ / (2. * M_PI) * std::asin(2. * q - 1.)));
+      cumulative += w;
+      if (k != current && sumw != 0.) {
+        means_.push_back(sumwx / sumw);
+        weights_.push_back(sumw);
+        sumw = 0.;
+        sumwx = 0.;
+      }
+      current = k;
+      sumw += w;
+      sumwx += w * x;
+    }
+    if (sumw != 0.) {
+      means_.push_back(sumwx / sumw);
+      weights_.push_back(sumw);
+    }
+    buffer_.clear();
+  }
+
+  double compression() const { return compression_; }
+  double min() const { return min_; }
+  double max() const { return max_; }
+  // the accessors compress pending entries first
+  const std::vector<double> &means() {
+    compress();
+    return means_;
+  }
+  const std::vector<double> &weights() {
+    compress();
+    return weights_;
+  }
+
+private:
+  double compression_;
+  std::size_t buffer_size_;
+  std::vector<double> means_;
+  std::vector<double> weights_;
+  std::vector<std::pair<double, double>> buffer_;
+  double min_ = std::numeric_limits<double>::infinity();
+  double max_ = -std::numeric_limits<double>::infinity();
+};
+
+// RDataFrame action filling one sketch per slot, merged at the end of the
+// event loop
+class QuantileSketchAction
+    : public ROOT::Detail::RDF::RActionImpl<QuantileSketchAction> {
+public:
+  using Result_t = QuantileSketch;
+
+  QuantileSketchAction(double compression)
+      : result_(std::make_shared<QuantileSketch>(compression)) {
+    const unsigned int nslots =
+        ROOT::IsImplicitMTEnabled() ? ROOT::GetThreadPoolSize() : 1;
+    slots_.assign(std::max(1u, nslots), QuantileSketch(compression));
+  }
+  QuantileSketchAction(QuantileSketchAction &&) = default;
+  QuantileSketchAction(const QuantileSketchAction &) = delete;
+
+  std::shared_ptr<Result_t> GetResultPtr() const { return result_; }
+
+  void Initialize() {}
+  void InitTask(TTreeReader *, unsigned int) {}
+
+  void Exec(unsigned int slot, double x, double w) { slots_[slot].add(x, w); }
+
+  void Finalize() {
+    for (auto &s : slots_) {
+      result_->merge(s);
+    }
+    result_->compress();
+  }
+
+  std::string GetActionName() { return "QuantileSketch"; }
+
+private:
+  std::shared_ptr<QuantileSketch> result_;
+  std::vector<QuantileSketch> slots_;
+};
+
+template <typename RNode>
+ROOT::RDF::RResultPtr<QuantileSketch>
+book_quantile_sketch(RNode df, const std::string &col, const std::string &weight,
+                     double compression) {
+  return df.template Book<double, double>(QuantileSketchAction(compression),
+                                          {col, weight});
+}
+
+} // namespace wrem
+
+#endif
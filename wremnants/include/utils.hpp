@@ -7,6 +7,7 @@
 #include <eigen3/Eigen/Dense>
 #include <eigen3/unsupported/Eigen/CXX11/Tensor>
 
+#include "counter_rng.hpp"
 #include "defines.hpp"
 #include <algorithm>
 #include <vector>
@@ -452,6 +453,19 @@ tensor_to_array(const Eigen::TensorFixedSize<T, Eigen::Sizes<N>> &tensor) {
   return res;
 }
 
+// flatten fixed size tensors (in their storage order, i.e. column major) and
+// concatenate them into a single rank 1 tensor, e.g. to fill several tensor
+// weights with the same axes into one histogram
+template <typename... Ts> auto concatenate_tensors(const Ts &...tensors) {
+  using scalar_t = std::common_type_t<typename Ts::Scalar...>;
+  constexpr std::ptrdiff_t size = (Ts::Dimensions::total_size + ...);
+  Eigen::TensorFixedSize<scalar_t, Eigen::Sizes<size>> res;
+  scalar_t *out = res.data();
+  ((out = std::copy(tensors.data(), tensors.data() + tensors.size(), out)),
+   ...);
+  return res;
+}
+
 template <typename V> auto array_view(const V &vec, std::size_t start = 0) {
   return Eigen::Map<
       const Eigen::Array<typename V::value_type, Eigen::Dynamic, 1>>(
@@ -817,19 +831,14 @@ class ToyHelper {
 
 public:
   ToyHelper(const std::size_t ntoys, const std::size_t seed = 0,
-            const unsigned int var_scaling = 1, const unsigned int nslots = 1)
-      : ntoys_(ntoys), var_scaling_(var_scaling) {
-    const unsigned int nslotsactual = std::max(nslots, 1U);
-    rng_.reserve(nslotsactual);
-    auto const hash = std::hash<std::string>()("ToyHelper");
-    for (std::size_t islot = 0; islot < nslotsactual; ++islot) {
-      std::seed_seq seq{hash, seed, islot};
-      rng_.emplace_back(seq);
-    }
-  }
+            const unsigned int var_scaling = 1)
+      : ntoys_(ntoys), var_scaling_(var_scaling),
+        purpose_(rng_purpose("ToyHelper", seed)) {}
 
-  std::vector<int> operator()(const unsigned int slot) {
+  std::vector<int> operator()(const unsigned int run, const unsigned int lumi,
+                              const unsigned long long event) const {
 
+    auto rng = event_rng(purpose_, run, lumi, event);
     std::poisson_distribution pois(1. / double(var_scaling_));
 
     std::vector<int> res;
@@ -838,10 +847,8 @@ public:
     // index 0 is the nominal, so just one entry, not randomized)
     res.emplace_back(0);
 
-    auto &rngslot = rng_[slot];
-
     for (std::size_t itoy = 1; itoy < ntoys_; ++itoy) {
-      const std::size_t nsamples = var_scaling_ * pois(rngslot);
+      const std::size_t nsamples = var_scaling_ * pois(rng);
       for (std::size_t isample = 0; isample < nsamples; ++isample) {
         res.emplace_back(itoy);
       }
@@ -853,7 +860,7 @@ public:
 private:
   std::size_t ntoys_;
   double var_scaling_;
-  std::vector<std::mt19937> rng_;
+  std::uint64_t purpose_;
 };
 
 // function to do stuff with run splitting in MC should define a helper
@@ -864,8 +871,9 @@ unsigned int get_dummy_run_by_lumi_quantile(const unsigned int run,
                                             const Vec_d lumi_edges,
                                             const Vec_ui run_vals) {
 
-  std::seed_seq seq{std::size_t(run), std::size_t(lumi), std::size_t(event)};
-  std::mt19937 rng(seq);
+  static const std::uint64_t purpose =
+      rng_purpose("get_dummy_run_by_lumi_quantile");
+  auto rng = event_rng(purpose, run, lumi, event);
 
   int bin = 0;
   // generate uniformly distributed double in [0,1)
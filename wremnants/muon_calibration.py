@@ -1,4 +1,8 @@
+import hashlib
+import os
 import pickle
+import shutil
+import tempfile
 import time
 from functools import reduce
 
@@ -22,6 +26,74 @@ narf.clingutils.Declare('#include "lowpu_utils.hpp"')
 
 data_dir = common.data_dir
 
+# the variation tensors derived from the calibration inputs (eigen decompositions of the covariance matrices)
+# are cached on disk, keyed by the input files and options, such that the helpers of later runs are built from
+# memory mapped arrays instead of reading and decomposing the inputs again.
+# Increase the version if the derivation of any of the cached quantities changes, set the directory to None to disable the cache
+variation_cache_version = 1
+variation_cache_dir = os.environ.get(
+    "WREMNANTS_CALIBRATION_CACHE",
+    os.path.expanduser("~/.cache/wremnants/calibration"),
+)
+
+
+def _variation_cache_path(name, filepaths, options):
+    files = []
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        files.append((os.path.realpath(filepath), stat.st_mtime_ns, stat.st_size))
+    key = repr((variation_cache_version, name, files, sorted(options.items())))
+    return os.path.join(
+        variation_cache_dir, f"{name}_{hashlib.sha1(key.encode()).hexdigest()}"
+    )
+
+
+def cached_variations(name, filepaths, compute, **options):
+    """
+    Return the dict of quantities from compute(), cached in 'variation_cache_dir'.
+    Numpy arrays are stored as .npy files and memory mapped when read back, other objects (e.g. axes) are pickled.
+    The cache entry is invalidated if any of the input files is modified, or if the options or the cache version change
+    """
+    if variation_cache_dir is None:
+        return compute()
+
+    path = _variation_cache_path(name, filepaths, options)
+    if os.path.isdir(path):
+        try:
+            with open(os.path.join(path, "objects.pkl"), "rb") as f:
+                res = pickle.load(f)
+            for fname in os.listdir(path):
+                if fname.endswith(".npy"):
+                    res[fname[:-4]] = np.load(os.path.join(path, fname), mmap_mode="r")
+            logger.debug(f"Loaded cached {name} from {path}")
+            return res
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+            logger.warning(f"Failed to read cached {name} from {path} ({e})")
+
+    res = compute()
+
+    try:
+        os.makedirs(variation_cache_dir, exist_ok=True)
+        # write to a temporary directory and rename, such that concurrent jobs never read partial entries
+        tmpdir = tempfile.mkdtemp(dir=variation_cache_dir, prefix=".tmp_")
+        objects = {}
+        for k, v in res.items():
+            if isinstance(v, np.ndarray):
+                np.save(os.path.join(tmpdir, f"{k}.npy"), v)
+            else:
+                objects[k] = v
+        with open(os.path.join(tmpdir, "objects.pkl"), "wb") as f:
+            pickle.dump(objects, f)
+        try:
+            os.rename(tmpdir, path)
+        except OSError:
+            # written by another job in the meantime
+            shutil.rmtree(tmpdir, ignore_errors=True)
+    except OSError as e:
+        logger.warning(f"Failed to cache {name} in {variation_cache_dir} ({e})")
+
+    return res
+
 
 def make_muon_calibration_helpers(
     args,
@@ -285,115 +357,135 @@ def make_muon_smearing_helpers(
 ):
     # this helper smears muon pT to match the resolution in data
 
-    def load_res(filename):
-        f = ROOT.TFile.Open(filename)
-        a = f.Get("a")
-        c = f.Get("c")
-        b = f.Get("b")
-        d = f.Get("d")
-        cov = f.Get("covariance_matrix")
-
-        a = narf.root_to_hist(a, axis_names=["res_eta"])
-        c = narf.root_to_hist(c, axis_names=["res_eta"])
-        b = narf.root_to_hist(b, axis_names=["res_eta"])
-        d = narf.root_to_hist(d, axis_names=["res_eta"])
-        cov = narf.root_to_hist(cov)
-
-        f.Close()
+    def compute():
+        def load_res(filename):
+            f = ROOT.TFile.Open(filename)
+            a = f.Get("a")
+            c = f.Get("c")
+            b = f.Get("b")
+            d = f.Get("d")
+            cov = f.Get("covariance_matrix")
 
-        return a, c, b, d, cov
+            a = narf.root_to_hist(a, axis_names=["res_eta"])
+            c = narf.root_to_hist(c, axis_names=["res_eta"])
+            b = narf.root_to_hist(b, axis_names=["res_eta"])
+            d = narf.root_to_hist(d, axis_names=["res_eta"])
+            cov = narf.root_to_hist(cov)
 
-    adata, cdata, bdata, ddata, covdata = load_res(filenamedata)
-    amc, cmc, bmc, dmc, covmc = load_res(filenamemc)
+            f.Close()
 
-    if override_d is not None:
-        ddata.values()[...] = override_d
-        ddata.variances()[...] = 0.0
+            return a, c, b, d, cov
 
-        dmc.values()[...] = override_d
-        dmc.variances()[...] = 0.0
+        adata, cdata, bdata, ddata, covdata = load_res(filenamedata)
+        amc, cmc, bmc, dmc, covmc = load_res(filenamemc)
 
-    if np.any(np.isclose(ddata.values(), 0.0)) or np.any(np.isclose(dmc.values(), 0.0)):
-        raise ValueError(
-            "d^2 values of 0 are invalid for the resolution parameterization"
-        )
+        if override_d is not None:
+            ddata.values()[...] = override_d
+            ddata.variances()[...] = 0.0
 
-    axis_res_eta = adata.axes["res_eta"]
-    axis_res_parm = hist.axis.StrCategory(["a", "c", "b", "d"], name="res_parm")
-    # ordering is different here because the covariance matrix is ordered a, b, c
-    axis_res_parm_reduced = hist.axis.StrCategory(
-        ["a", "b", "c"], name="res_parm_reduced"
-    )
-    axis_data_mc = hist.axis.StrCategory(["data", "mc"], name="data_mc")
+            dmc.values()[...] = override_d
+            dmc.variances()[...] = 0.0
 
-    neta = axis_res_eta.size
-    nparmsreduced = axis_res_parm_reduced.size
+        if np.any(np.isclose(ddata.values(), 0.0)) or np.any(
+            np.isclose(dmc.values(), 0.0)
+        ):
+            raise ValueError(
+                "d^2 values of 0 are invalid for the resolution parameterization"
+            )
 
-    hnomw = hist.Hist(
-        axis_res_eta, axis_res_parm, axis_data_mc, storage=hist.storage.Weight()
-    )
+        axis_res_eta = adata.axes["res_eta"]
+        axis_res_parm = hist.axis.StrCategory(["a", "c", "b", "d"], name="res_parm")
+        # ordering is different here because the covariance matrix is ordered a, b, c
+        axis_res_parm_reduced = hist.axis.StrCategory(
+            ["a", "b", "c"], name="res_parm_reduced"
+        )
+        axis_data_mc = hist.axis.StrCategory(["data", "mc"], name="data_mc")
 
-    hnomw[{"data_mc": "data", "res_parm": "a"}] = adata.view()
-    hnomw[{"data_mc": "data", "res_parm": "c"}] = cdata.view()
-    hnomw[{"data_mc": "data", "res_parm": "b"}] = bdata.view()
-    hnomw[{"data_mc": "data", "res_parm": "d"}] = ddata.view()
+        neta = axis_res_eta.size
+        nparmsreduced = axis_res_parm_reduced.size
 
-    hnomw[{"data_mc": "mc", "res_parm": "a"}] = amc.view()
-    hnomw[{"data_mc": "mc", "res_parm": "c"}] = cmc.view()
-    hnomw[{"data_mc": "mc", "res_parm": "b"}] = bmc.view()
-    hnomw[{"data_mc": "mc", "res_parm": "d"}] = dmc.view()
+        hnomw = hist.Hist(
+            axis_res_eta, axis_res_parm, axis_data_mc, storage=hist.storage.Weight()
+        )
 
-    hnom = hist.Hist(*hnomw.axes)
-    hnom[...] = hnomw.values()
+        hnomw[{"data_mc": "data", "res_parm": "a"}] = adata.view()
+        hnomw[{"data_mc": "data", "res_parm": "c"}] = cdata.view()
+        hnomw[{"data_mc": "data", "res_parm": "b"}] = bdata.view()
+        hnomw[{"data_mc": "data", "res_parm": "d"}] = ddata.view()
+
+        hnomw[{"data_mc": "mc", "res_parm": "a"}] = amc.view()
+        hnomw[{"data_mc": "mc", "res_parm": "c"}] = cmc.view()
+        hnomw[{"data_mc": "mc", "res_parm": "b"}] = bmc.view()
+        hnomw[{"data_mc": "mc", "res_parm": "d"}] = dmc.view()
+
+        hnom = hist.Hist(*hnomw.axes)
+        hnom[...] = hnomw.values()
+
+        def check_variances(h, cov):
+            variances = np.diag(cov.values())
+            variances = np.reshape(variances, (neta, -1))
+            for iparm, parm in enumerate(axis_res_parm_reduced):
+                if not np.all(
+                    np.isclose(
+                        variances[..., iparm],
+                        h[{"res_parm": parm}].variances(),
+                        atol=0.0,
+                    )
+                ):
+                    raise ValueError(
+                        "Covariance matrix is not consistent with parameter uncertainties or parameters are not in the expected order."
+                    )
+
+        hnomwdata = hnomw[{"data_mc": "data"}]
+        hnomwmc = hnomw[{"data_mc": "mc"}]
+
+        check_variances(hnomwdata, covdata)
+        check_variances(hnomwmc, covmc)
+
+        dcov = covdata.values() + covmc.values()
+        nvar = dcov.shape[0]
+
+        e, v = np.linalg.eigh(dcov)
+
+        dparms = np.sqrt(e[None, :]) * v
+        dparms = np.reshape(dparms, (neta, -1, nvar))
+
+        if dummy_vars:
+            # replace eigenvector variations with dummy variations (intended to be used to e.g. determine the resolution corrections in-situ)
+            varsizes = [1e-5, 1e-5, 1e-9]
+
+            dparms = np.zeros((neta, nparmsreduced, nvar), dtype=np.float64)
+            ivar = 0
+            for ieta in range(neta):
+                for iparm in range(nparmsreduced):
+                    varsize = varsizes[iparm]
+                    dparms[ieta, iparm, ivar] = varsize
+                    ivar += 1
 
-    def check_variances(h, cov):
-        variances = np.diag(cov.values())
-        variances = np.reshape(variances, (neta, -1))
+        var = hnomwdata.values()[..., None] + np.zeros(nvar)
         for iparm, parm in enumerate(axis_res_parm_reduced):
-            if not np.all(
-                np.isclose(
-                    variances[..., iparm], h[{"res_parm": parm}].variances(), atol=0.0
-                )
-            ):
-                raise ValueError(
-                    "Covariance matrix is not consistent with parameter uncertainties or parameters are not in the expected order."
-                )
-
-    hnomwdata = hnomw[{"data_mc": "data"}]
-    hnomwmc = hnomw[{"data_mc": "mc"}]
+            var[:, axis_res_parm.index(parm), :] += dparms[:, iparm, :]
 
-    check_variances(hnomwdata, covdata)
-    check_variances(hnomwmc, covmc)
+        return {"axis_res_eta": axis_res_eta, "nom": hnom.values(), "var": var}
 
-    dcov = covdata.values() + covmc.values()
-    nvar = dcov.shape[0]
-
-    e, v = np.linalg.eigh(dcov)
-
-    dparms = np.sqrt(e[None, :]) * v
-    dparms = np.reshape(dparms, (neta, -1, nvar))
-
-    if dummy_vars:
-        # replace eigenvector variations with dummy variations (intended to be used to e.g. determine the resolution corrections in-situ)
-        varsizes = [1e-5, 1e-5, 1e-9]
-
-        dparms = np.zeros((neta, nparmsreduced, nvar), dtype=np.float64)
-        ivar = 0
-        for ieta in range(neta):
-            for iparm in range(nparmsreduced):
-                varsize = varsizes[iparm]
-                dparms[ieta, iparm, ivar] = varsize
-                ivar += 1
+    res = cached_variations(
+        "muon_smearing",
+        [filenamedata, filenamemc],
+        compute,
+        override_d=override_d,
+        dummy_vars=dummy_vars,
+    )
 
+    axis_res_eta = res["axis_res_eta"]
+    axis_res_parm = hist.axis.StrCategory(["a", "c", "b", "d"], name="res_parm")
+    axis_data_mc = hist.axis.StrCategory(["data", "mc"], name="data_mc")
+    nvar = res["var"].shape[-1]
     axis_res_var = hist.axis.Integer(0, nvar, name="smearing_variation")
 
+    hnom = hist.Hist(axis_res_eta, axis_res_parm, axis_data_mc)
+    hnom[...] = res["nom"]
     hvar = hist.Hist(axis_res_eta, axis_res_parm, axis_res_var)
-    hvar[...] = hnomwdata.values()[..., None]
-
-    for iparm, parm in enumerate(axis_res_parm_reduced):
-        hvar[{"res_parm": parm}] = (
-            hvar[{"res_parm": parm}].values() + dparms[:, iparm, :]
-        )
+    hvar[...] = res["var"]
 
     hnom = narf.hist_to_pyroot_boost(hnom, tensor_rank=2)
     hvar = narf.hist_to_pyroot_boost(hvar, tensor_rank=2)
@@ -525,48 +617,64 @@ def make_jpsi_crctn_unc_helper(
     scale_var_method="smearingWeightsSplines",
 ):
 
-    f = ROOT.TFile.Open(filepath_correction)
-    A = f.Get("A")
-    e = f.Get("e")
-    M = f.Get("M")
-    cov = f.Get("covariance_matrix")
+    def compute():
+        f = ROOT.TFile.Open(filepath_correction)
+        A = f.Get("A")
+        e = f.Get("e")
+        M = f.Get("M")
+        cov = f.Get("covariance_matrix")
 
-    A = narf.root_to_hist(A, axis_names=["scale_eta"])
-    e = narf.root_to_hist(e, axis_names=["scale_eta"])
-    M = narf.root_to_hist(M, axis_names=["scale_eta"])
-    cov = narf.root_to_hist(cov)
+        A = narf.root_to_hist(A, axis_names=["scale_eta"])
+        e = narf.root_to_hist(e, axis_names=["scale_eta"])
+        M = narf.root_to_hist(M, axis_names=["scale_eta"])
+        cov = narf.root_to_hist(cov)
 
-    f.Close()
+        f.Close()
 
-    axis_eta = A.axes["scale_eta"]
-    neta = axis_eta.size
+        axis_eta = A.axes["scale_eta"]
+        neta = axis_eta.size
 
-    cov = cov.values()
-    nparmscov = cov.shape[0] // neta
-    n_scale_params = 3
-    nvars = neta * n_scale_params
+        cov = cov.values()
+        nparmscov = cov.shape[0] // neta
+        n_scale_params = 3
+        nvars = neta * n_scale_params
 
-    variances_ref = np.stack([A.variances(), e.variances(), M.variances()], axis=-1)
-    variances = np.reshape(np.diag(cov), (neta, nparmscov))[:, :n_scale_params]
+        variances_ref = np.stack([A.variances(), e.variances(), M.variances()], axis=-1)
+        variances = np.reshape(np.diag(cov), (neta, nparmscov))[:, :n_scale_params]
 
-    if not np.all(np.isclose(variances, variances_ref, atol=0.0)):
-        raise ValueError(
-            "Covariance matrix is not consistent with parameter uncertainties or parameters are not in the expected order."
-        )
+        if not np.all(np.isclose(variances, variances_ref, atol=0.0)):
+            raise ValueError(
+                "Covariance matrix is not consistent with parameter uncertainties or parameters are not in the expected order."
+            )
+
+        cov = np.reshape(cov, (neta, nparmscov, neta, nparmscov))
+        cov = cov[:, :n_scale_params, :, :n_scale_params]
 
-    cov = np.reshape(cov, (neta, nparmscov, neta, nparmscov))
-    cov = cov[:, :n_scale_params, :, :n_scale_params]
+        scales = [scale_A, scale_e, scale_M]
+        for iparm, scale in enumerate(scales):
+            cov[:, iparm, :, :] *= scale
+            cov[:, :, :, iparm] *= scale
 
-    scales = [scale_A, scale_e, scale_M]
-    for iparm, scale in enumerate(scales):
-        cov[:, iparm, :, :] *= scale
-        cov[:, :, :, iparm] *= scale
+        cov = np.reshape(cov, (nvars, nvars))
 
-    cov = np.reshape(cov, (nvars, nvars))
+        e, v = np.linalg.eigh(cov)
+        var_mat = np.sqrt(e[None, :]) * v
+        var_mat = np.reshape(var_mat, (neta, n_scale_params, nvars))
 
-    e, v = np.linalg.eigh(cov)
-    var_mat = np.sqrt(e[None, :]) * v
-    var_mat = np.reshape(var_mat, (neta, n_scale_params, nvars))
+        return {"axis_eta": axis_eta, "var_mat": var_mat}
+
+    res = cached_variations(
+        "jpsi_crctn_unc",
+        [filepath_correction],
+        compute,
+        scale_A=scale_A,
+        scale_e=scale_e,
+        scale_M=scale_M,
+    )
+    axis_eta = res["axis_eta"]
+    var_mat = res["var_mat"]
+    n_scale_params = var_mat.shape[1]
+    nvars = var_mat.shape[2]
 
     axis_scale_params = hist.axis.Integer(
         0, n_scale_params, underflow=False, overflow=False, name="scale_params"
@@ -648,64 +756,73 @@ def make_dummy_closure_uncertainty_helper(neta=24, etalow=-2.4, etahigh=2.4):
 
 def make_closure_uncertainty_helper(filepath_correction):
 
-    f = ROOT.TFile.Open(filepath_correction)
-    A = f.Get("AZ")
-    M = f.Get("MZ")
-    cov = f.Get("covariance_matrix")
+    def compute():
+        f = ROOT.TFile.Open(filepath_correction)
+        A = f.Get("AZ")
+        M = f.Get("MZ")
+        cov = f.Get("covariance_matrix")
 
-    A = narf.root_to_hist(A, axis_names=["scale_eta"])
-    M = narf.root_to_hist(M, axis_names=["scale_eta"])
-    cov = narf.root_to_hist(cov)
+        A = narf.root_to_hist(A, axis_names=["scale_eta"])
+        M = narf.root_to_hist(M, axis_names=["scale_eta"])
+        cov = narf.root_to_hist(cov)
 
-    f.Close()
+        f.Close()
 
-    axis_eta = A.axes["scale_eta"]
-    neta = axis_eta.size
+        axis_eta = A.axes["scale_eta"]
+        neta = axis_eta.size
 
-    cov = cov.values()
-    nparmscov = cov.shape[0] // neta
-    n_scale_params = 3
-    nvars = neta * n_scale_params
+        cov = cov.values()
+        nparmscov = cov.shape[0] // neta
+        n_scale_params = 3
+        nvars = neta * n_scale_params
 
-    variances_ref = np.stack([A.variances(), M.variances()], axis=-1)
-    variances = np.reshape(np.diag(cov), (neta, nparmscov))[:, :n_scale_params]
+        variances_ref = np.stack([A.variances(), M.variances()], axis=-1)
+        variances = np.reshape(np.diag(cov), (neta, nparmscov))[:, :n_scale_params]
 
-    if not np.all(np.isclose(variances, variances_ref, atol=0.0)):
-        raise ValueError(
-            "Covariance matrix is not consistent with parameter uncertainties or parameters are not in the expected order."
-        )
+        if not np.all(np.isclose(variances, variances_ref, atol=0.0)):
+            raise ValueError(
+                "Covariance matrix is not consistent with parameter uncertainties or parameters are not in the expected order."
+            )
 
-    cov = np.reshape(cov, (neta, nparmscov, neta, nparmscov))
-    covin = cov
-    cov = np.zeros((neta, n_scale_params, neta, n_scale_params), dtype=np.float64)
-
-    cov[:, 0, :, 0] = covin[:, 0, :, 0]
-    cov[:, 2, :, 2] = covin[:, 1, :, 1]
-    cov[:, 0, :, 2] = covin[:, 0, :, 1]
-    cov[:, 2, :, 0] = covin[:, 1, :, 0]
-
-    cov = np.reshape(cov, (nvars, nvars))
-
-    # mz = 91.1876
-    # mzerr = 2.1e-3
-    # zvarsize = np.sqrt((mzerr/mz)**2 + 2e-5**2)
-    # zvar = np.zeros((neta, n_scale_params), dtype=np.float64)
-    # zvar[:, 0] = zvarsize
-    # zvar = np.reshape(zvar, (nvars, 1))
-    # cov += zvar @ zvar.T
-    #
-    # alignment_var = np.zeros((neta, n_scale_params), dtype=np.float64)
-    # alignment_var[:, 2] = 3.5e-6
-    # alignment_var = np.reshape(alignment_var, (nvars, 1))
-    # cov += alignment_var @ alignment_var.T
-
-    e, v = np.linalg.eigh(cov)
-    e = np.maximum(e, 0.0)
-    var_mat = np.sqrt(e[None, :]) * v
-    var_mat = np.reshape(var_mat, (neta, n_scale_params, nvars))
-
-    if not np.all(np.isfinite(var_mat)):
-        raise ValueError("Variations not finite")
+        cov = np.reshape(cov, (neta, nparmscov, neta, nparmscov))
+        covin = cov
+        cov = np.zeros((neta, n_scale_params, neta, n_scale_params), dtype=np.float64)
+
+        cov[:, 0, :, 0] = covin[:, 0, :, 0]
+        cov[:, 2, :, 2] = covin[:, 1, :, 1]
+        cov[:, 0, :, 2] = covin[:, 0, :, 1]
+        cov[:, 2, :, 0] = covin[:, 1, :, 0]
+
+        cov = np.reshape(cov, (nvars, nvars))
+
+        # mz = 91.1876
+        # mzerr = 2.1e-3
+        # zvarsize = np.sqrt((mzerr/mz)**2 + 2e-5**2)
+        # zvar = np.zeros((neta, n_scale_params), dtype=np.float64)
+        # zvar[:, 0] = zvarsize
+        # zvar = np.reshape(zvar, (nvars, 1))
+        # cov += zvar @ zvar.T
+        #
+        # alignment_var = np.zeros((neta, n_scale_params), dtype=np.float64)
+        # alignment_var[:, 2] = 3.5e-6
+        # alignment_var = np.reshape(alignment_var, (nvars, 1))
+        # cov += alignment_var @ alignment_var.T
+
+        e, v = np.linalg.eigh(cov)
+        e = np.maximum(e, 0.0)
+        var_mat = np.sqrt(e[None, :]) * v
+        var_mat = np.reshape(var_mat, (neta, n_scale_params, nvars))
+
+        if not np.all(np.isfinite(var_mat)):
+            raise ValueError("Variations not finite")
+
+        return {"axis_eta": axis_eta, "var_mat": var_mat}
+
+    res = cached_variations("closure_unc", [filepath_correction], compute)
+    axis_eta = res["axis_eta"]
+    var_mat = res["var_mat"]
+    n_scale_params = var_mat.shape[1]
+    nvars = var_mat.shape[2]
 
     axis_scale_params = hist.axis.Integer(
         0, n_scale_params, underflow=False, overflow=False, name="scale_params"
@@ -772,22 +889,38 @@ def make_Z_non_closure_parametrized_helper(
     dummy_A_mag=7.5e-5,
     dummy_M_mag=0,
 ):
-    f = uproot.open(filepath_correction)
-    M = f["MZ"].to_hist()
-    A = f["AZ"].to_hist()
+    def compute():
+        f = uproot.open(filepath_correction)
+        M = f["MZ"].to_hist()
+        A = f["AZ"].to_hist()
+
+        non_closure = np.zeros((n_eta_bins, n_scale_params))
+        if dummy_A:
+            non_closure[..., 0] = np.full(n_eta_bins, dummy_A_mag)
+        else:
+            non_closure[..., 0] = A.values()
+        if dummy_M:
+            non_closure[..., 2] = np.full(n_eta_bins, dummy_M_mag)
+        else:
+            non_closure[..., 2] = M.values()
+        return {"non_closure": non_closure}
+
+    res = cached_variations(
+        "Z_non_closure_parametrized",
+        [filepath_correction],
+        compute,
+        n_eta_bins=n_eta_bins,
+        n_scale_params=n_scale_params,
+        dummy_A=dummy_A,
+        dummy_M=dummy_M,
+        dummy_A_mag=dummy_A_mag,
+        dummy_M_mag=dummy_M_mag,
+    )
 
     axis_eta = hist.axis.Regular(n_eta_bins, -2.4, 2.4, name="eta")
     axis_scale_params = hist.axis.Regular(n_scale_params, 0, 1, name="scale_params")
     hist_non_closure = hist.Hist(axis_eta, axis_scale_params)
-    if dummy_A:
-        hist_non_closure.view()[..., 0] = np.full(n_eta_bins, dummy_A_mag)
-    else:
-        hist_non_closure.view()[..., 0] = A.values()
-    hist_non_closure.view()[..., 1] = np.zeros(n_eta_bins)
-    if dummy_M:
-        hist_non_closure.view()[..., 2] = np.full(n_eta_bins, dummy_M_mag)
-    else:
-        hist_non_closure.view()[..., 2] = M.values()
+    hist_non_closure.view()[...] = res["non_closure"]
 
     hist_non_closure_cpp = narf.hist_to_pyroot_boost(hist_non_closure, tensor_rank=1)
     if correlated:
@@ -868,14 +1001,7 @@ def get_jpsi_scale_param_cov_mat(
     idx_scale_params = np.sort(
         reduce(np.append, [(idx_first_param + i) for i in range(n_scale_params)])
     )
-    cov_scale_params = np.empty(
-        [n_scale_params * n_eta_bins, n_scale_params * n_eta_bins]
-    )
-    for irow_scale_params, irow_all_params in enumerate(idx_scale_params):
-        cov_scale_params[irow_scale_params, :] = scale * np.take(
-            cov.values()[irow_all_params], idx_scale_params
-        )
-    return cov_scale_params
+    return scale * cov.values()[np.ix_(idx_scale_params, idx_scale_params)]
 
 
 def crop_cov_mat(filepath, n_tot_params=4, n_cropped_eta_bins=2):
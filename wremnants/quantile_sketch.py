@@ -0,0 +1,206 @@
+import hist
+import numpy as np
+import ROOT
+
+import narf
+from wums import ioutils, logging
+
+narf.clingutils.Declare('#include "quantile_sketch.hpp"')
+
+logger = logging.child_logger(__name__)
+
+
+class QuantileSketch(object):
+    """
+    Weighted, mergeable quantile sketch (merging t-digest), the python counterpart of wrem::QuantileSketch.
+    The distribution is summarised by a few hundred centroids (mean, weight), small in the tails and large in the bulk,
+    giving accurate quantiles at a tiny fraction of the memory of a fine binned histogram.
+    Sketches can be added (merging) and scaled like histograms, so they can be stored in the histmaker output
+    and go through scale_to_data and aggregate_groups.
+    Negative weights are accumulated within centroids, centroids with a negative net weight are ignored in queries.
+    """
+
+    def __init__(
+        self, compression=500.0, means=None, weights=None, xmin=np.inf, xmax=-np.inf
+    ):
+        self.compression = compression
+        self.means = np.zeros(0) if means is None else np.asarray(means, dtype=float)
+        self.weights = (
+            np.zeros(0) if weights is None else np.asarray(weights, dtype=float)
+        )
+        self.min = xmin
+        self.max = xmax
+
+    @classmethod
+    def from_cpp(cls, sketch):
+        return cls(
+            sketch.compression(),
+            np.asarray(sketch.means()),
+            np.asarray(sketch.weights()),
+            sketch.min(),
+            sketch.max(),
+        )
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="stable")
+        means = means[order]
+        weights = weights[order]
+        total = np.sum(weights)
+        if total <= 0:
+            q = np.zeros_like(weights)
+        else:
+            q = np.clip((np.cumsum(weights) - 0.5 * weights) / total, 0.0, 1.0)
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * q - 1))
+        # start of each cluster, centroids with the same k in sorted order are merged
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        sumw = np.add.reduceat(weights, starts)
+        sumwx = np.add.reduceat(weights * means, starts)
+        keep = sumw != 0
+        self.means = sumwx[keep] / sumw[keep]
+        self.weights = sumw[keep]
+
+    def fill(self, values, weight=None):
+        values = np.asarray(values, dtype=float).ravel()
+        if weight is None:
+            weight = np.ones_like(values)
+        else:
+            weight = np.broadcast_to(np.asarray(weight, dtype=float), values.shape)
+        mask = np.isfinite(values) & (weight != 0)
+        values = values[mask]
+        weight = weight[mask]
+        if len(values) == 0:
+            return self
+        self.min = min(self.min, np.min(values))
+        self.max = max(self.max, np.max(values))
+        self._compress(np.r_[self.means, values], np.r_[self.weights, weight])
+        return self
+
+    def merge(self, other):
+        res = QuantileSketch(
+            max(self.compression, other.compression),
+            xmin=min(self.min, other.min),
+            xmax=max(self.max, other.max),
+        )
+        res._compress(
+            np.r_[self.means, other.means], np.r_[self.weights, other.weights]
+        )
+        return res
+
+    def __add__(self, other):
+        if isinstance(other, (int, float)) and other == 0:
+            return self.copy()
+        return self.merge(other)
+
+    def __radd__(self, other):
+        # to support sum()
+        return self.__add__(other)
+
+    def __mul__(self, scale):
+        res = self.copy()
+        res.weights = res.weights * scale
+        return res
+
+    __rmul__ = __mul__
+
+    def __imul__(self, scale):
+        self.weights *= scale
+        return self
+
+    def __iadd__(self, other):
+        res = self.merge(other)
+        self.compression, self.means, self.weights = (
+            res.compression,
+            res.means,
+            res.weights,
+        )
+        self.min, self.max = res.min, res.max
+        return self
+
+    def copy(self):
+        return QuantileSketch(
+            self.compression, self.means.copy(), self.weights.copy(), self.min, self.max
+        )
+
+    def sum(self):
+        return np.sum(self.weights)
+
+    def _knots(self):
+        # piecewise linear CDF through the centroid means, at the cumulative weight of their centers,
+        # ending at the minimum and maximum filled values
+        weights = np.maximum(self.weights, 0)
+        total = np.sum(weights)
+        if total <= 0:
+            raise ValueError("Quantile sketch is empty")
+        cdf = (np.cumsum(weights) - 0.5 * weights) / total
+        return np.r_[self.min, self.means, self.max], np.r_[0.0, cdf, 1.0]
+
+    def quantile(self, q):
+        x, cdf = self._knots()
+        return np.interp(q, cdf, x)
+
+    def cdf(self, x):
+        xk, cdf = self._knots()
+        return np.interp(x, xk, cdf, left=0.0, right=1.0)
+
+    def to_hist(self, axis):
+        # histogram of the distribution in the bins of the given axis, e.g. to plot it or use it with existing tools
+        h = hist.Hist(axis, storage=hist.storage.Double())
+        cdf = self.cdf(axis.edges)
+        h.values()[...] = np.diff(cdf) * self.sum()
+        if axis.traits.underflow:
+            h.values(flow=True)[0] = cdf[0] * self.sum()
+        if axis.traits.overflow:
+            h.values(flow=True)[-1] = (1 - cdf[-1]) * self.sum()
+        return h
+
+    def to_h5py(self, group):
+        group.create_dataset("means", data=self.means)
+        group.create_dataset("weights", data=self.weights)
+        group.attrs["compression"] = self.compression
+        group.attrs["min"] = self.min
+        group.attrs["max"] = self.max
+
+    @classmethod
+    def from_h5py(cls, group):
+        return cls(
+            group.attrs["compression"],
+            group["means"][...],
+            group["weights"][...],
+            group.attrs["min"],
+            group.attrs["max"],
+        )
+
+
+class QuantileSketchResult(object):
+    # booked sketch action of a RDataFrame, converted into a QuantileSketch after the event loop
+    def __init__(self, name, result):
+        self.name = name
+        self.result = result
+
+    def get(self):
+        return QuantileSketch.from_cpp(self.result.GetValue())
+
+
+def book_quantile_sketch(df, name, col, weight="nominal_weight", compression=500.0):
+    """
+    Book a quantile sketch of column 'col' weighted by 'weight', filled in the same event loop as the histograms.
+    Returns the dataframe (with the double precision columns added) and a QuantileSketchResult
+    """
+    x = f"{name}_sketch_x"
+    w = f"{name}_sketch_w"
+    df = df.Define(x, f"static_cast<double>({col})")
+    df = df.Define(w, f"static_cast<double>({weight})")
+    res = ROOT.wrem.book_quantile_sketch(ROOT.RDF.AsRNode(df), x, w, compression)
+    return df, QuantileSketchResult(name, res)
+
+
+def add_sketches_to_results(resultdict, sketches):
+    """
+    Convert the booked sketches [(dataset, QuantileSketchResult)] after the event loop and store them
+    in the output of each dataset next to the histograms (as the histograms, wrapped for lazy loading)
+    """
+    for dataset, res in sketches:
+        # the dataset name is resolved here since histmakers may rename datasets in build_graph
+        if dataset.name not in resultdict:
+            continue
+        resultdict[dataset.name]["output"][res.name] = ioutils.H5PickleProxy(res.get())
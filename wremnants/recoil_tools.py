@@ -8,6 +8,7 @@ import tensorflow as tf
 
 from utilities import common as common
 from utilities.io_tools import input_tools
+from wremnants import quantile_sketch
 
 ROOT.gInterpreter.Declare('#include "recoil_tools.hpp"')
 ROOT.gInterpreter.Declare('#include "recoil_helper.hpp"')
@@ -82,6 +83,9 @@ class Recoil:
         self.flavor = flavor
         self.args = args
         self.storeHists = args.recoilHists
+        # fill the fine resolution distributions into quantile sketches instead of histograms
+        self.useSketches = getattr(args, "recoilQuantileSketches", False)
+        self.sketches = []
         self.pu_type = pu_type
         self.isW = False
 
@@ -184,6 +188,14 @@ class Recoil:
         with_fakes=False,
         col_mt="mt_corr_rec",
     ):
+        if (
+            self.useSketches
+            and not with_fakes
+            and len(axes) == 1
+            and (axes[0] is self.axis_res_ratio or axes[0] is self.axis_res_diff)
+        ):
+            self.add_sketch(name, cols[0], nominal_weight)
+            return
         if self.isW and with_fakes:
             if "mt" in [
                 ax.name for ax in axes
@@ -204,6 +216,17 @@ class Recoil:
         else:
             self.results.append(self.df.HistoBoost(name, axes, cols + [nominal_weight]))
 
+    def add_sketch(self, name, col, nominal_weight="nominal_weight"):
+        self.df, res = quantile_sketch.book_quantile_sketch(
+            self.df, name, col, nominal_weight
+        )
+        self.sketches.append((self.dataset, res))
+
+    def add_sketches_to_results(self, resultdict):
+        # to be called after the event loop, the sketches are stored in the output with the histograms
+        quantile_sketch.add_sketches_to_results(resultdict, self.sketches)
+        self.sketches = []
+
     def recoil_Z(self, df, results, dataset, datasets_to_apply, leps_uncorr, leps_corr):
 
         self.isW = False
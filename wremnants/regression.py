@@ -34,11 +34,12 @@ def compute_chi2(y, y_pred, w=None, nparams=1):
     return chi2, ndf
 
 
-def get_parameter_eigenvectors(params, cov, sign=1, force_positive=False):
-    # diagonalize and get eigenvalues and eigenvectors
-    e, v = np.linalg.eigh(
-        cov
-    )  # The column eigenvectors[:, i] is the normalized eigenvector corresponding to the eigenvalue eigenvalues[i],
+def get_parameter_eigenvectors(params, cov, sign=1, force_positive=False, eig=None):
+    # diagonalize and get eigenvalues and eigenvectors, a precomputed decomposition 'eig' of cov can be given
+    if eig is None:
+        eig = np.linalg.eigh(cov)
+    # The column eigenvectors[:, i] is the normalized eigenvector corresponding to the eigenvalue eigenvalues[i],
+    e, v = eig
     # protect against negative eigenvalues
     e = np.maximum(e, 0.0)
     vT = np.transpose(
@@ -80,17 +81,22 @@ def get_parameter_eigenvectors(params, cov, sign=1, force_positive=False):
     return params_var
 
 
-def make_eigenvector_predictons(params, cov, func, x1, x2=None, force_positive=False):
+def make_eigenvector_predictons(
+    params, cov, func, x1, x2=None, force_positive=False, eig=None
+):
     # return alternate values i.e. nominal+/-variation
+    if eig is None:
+        # the same decomposition is used for the up and down variations
+        eig = np.linalg.eigh(cov)
     params_up = get_parameter_eigenvectors(
-        params, cov, sign=1, force_positive=force_positive
+        params, cov, sign=1, force_positive=force_positive, eig=eig
     )
     y_pred_up = func(x1, params_up) if x2 is None else func(x1, x2, params_up)
     y_pred_up = np.moveaxis(
         y_pred_up, params.ndim - 1, -1
     )  # put parameter variations last
     params_dn = get_parameter_eigenvectors(
-        params, cov, sign=-1, force_positive=force_positive
+        params, cov, sign=-1, force_positive=force_positive, eig=eig
     )
     y_pred_dn = func(x1, params_dn) if x2 is None else func(x1, x2, params_dn)
     y_pred_dn = np.moveaxis(
@@ -138,27 +144,27 @@ def poly(pol, order, order2=None):
         )
 
 
-def get_parameter_matrices(x, y, w, order, pol="power"):
-    if x.shape != y.shape:
-        x = np.broadcast_to(x, y.shape)
-    stackX = []  # parameter matrix X
-    stackXTY = []  # and X.T @ Y
+def get_design_matrix(x, order, pol="power"):
+    # polynomial terms evaluated at x, the parameter axis is last
     f = poly(pol, order)
-    for n in range(order + 1):
-        p = f(x, n)
-        stackX.append(w * p)
-        stackXTY.append((w**2 * p * y).sum(axis=(-1)))
-    X = np.stack(stackX, axis=-1)
-    XTY = np.stack(stackXTY, axis=-1)
+    return np.stack(
+        [np.broadcast_to(f(x, n), x.shape) for n in range(order + 1)], axis=-1
+    )
+
+
+def get_parameter_matrices(x, y, w, order, pol="power", basis=None):
+    # parameter matrix X and X.T @ Y, the design matrix 'basis' can be given if it was computed before
+    if basis is None:
+        basis = get_design_matrix(x, order, pol=pol)
+    basis = np.broadcast_to(basis, (*y.shape, basis.shape[-1]))
+    X = w[..., np.newaxis] * basis
+    XTY = np.einsum("...k,...kn->...n", w**2 * y, basis)
     return X, XTY
 
 
-def get_parameter_matrices_from2D(
-    x, x2, y, w, order, order2=None, pol="power", flatten=False
-):
+def get_design_matrix_from2D(x, x2, order, order2=None, pol="power"):
+    # polynomial terms evaluated on the grid of x (last axis) and x2 (second last axis), the parameter axis is last
     x, x2 = np.broadcast_arrays(x[np.newaxis, ...], x2[..., np.newaxis])
-    x = np.broadcast_to(x, y.shape)
-    x2 = np.broadcast_to(x2, y.shape)
     if order2 is None:
         order2 = [
             0,
@@ -177,16 +183,22 @@ def get_parameter_matrices_from2D(
             )
     else:
         raise RuntimeError(f"Input 'order2' requires type 'None', 'int' or 'list'")
-    stackX = []  # parameter matrix X
-    stackXTY = []  # and X.T @ Y
+    stack = []
     for n in range(order + 1):
         f = poly(pol, order, order2[n])
         for m in range(order2[n] + 1):
-            p = f(x, x2, n, m)
-            stackX.append(w * p)
-            stackXTY.append((w**2 * p * y).sum(axis=(-2, -1)))
-    X = np.stack(stackX, axis=-1)
-    XTY = np.stack(stackXTY, axis=-1)
+            stack.append(np.broadcast_to(f(x, x2, n, m), x.shape))
+    return np.stack(stack, axis=-1)
+
+
+def get_parameter_matrices_from2D(
+    x, x2, y, w, order, order2=None, pol="power", flatten=False, basis=None
+):
+    if basis is None:
+        basis = get_design_matrix_from2D(x, x2, order, order2, pol=pol)
+    basis = np.broadcast_to(basis, (*y.shape, basis.shape[-1]))
+    X = w[..., np.newaxis] * basis
+    XTY = np.einsum("...kl,...kln->...n", w**2 * y, basis)
     if flatten:
         # flatten the 2D array into 1D
         newshape = (*y.shape[:-2], np.prod(y.shape[-2:]))
@@ -234,18 +246,32 @@ def get_regression_function(orders, pol="power"):
     return fsum
 
 
-def solve_leastsquare(X, XTY):
-    # compute the transpose of X for the mt and parameter axes
-    XT = np.transpose(X, axes=(*np.arange(X.ndim - 2), X.ndim - 1, X.ndim - 2))
-    XTX = XT @ X
+def invert_symmetric(A):
+    # inverse of (a stack of) symmetric positive definite matrices from their cholesky factors,
+    # fall back to the general inverse if any of them is not positive definite
+    try:
+        Linv = np.linalg.inv(np.linalg.cholesky(A))
+    except np.linalg.LinAlgError:
+        return np.linalg.inv(A)
+    return np.swapaxes(Linv, -1, -2) @ Linv
+
+
+def solve_normal_equations(XTX, XTY):
     # compute the inverse of the matrix in each bin (reshape to make last two axes contiguous, reshape back after inversion),
     # this term is also the covariance matrix for the parameters
-    XTXinv = np.linalg.inv(XTX.reshape(-1, *XTX.shape[-2:]))
-    XTXinv = XTXinv.reshape((*XT.shape[:-2], *XTXinv.shape[-2:]))
+    XTXinv = invert_symmetric(XTX.reshape(-1, *XTX.shape[-2:]))
+    XTXinv = XTXinv.reshape((*XTX.shape[:-2], *XTXinv.shape[-2:]))
     params = np.einsum("...ij,...j->...i", XTXinv, XTY)
     return params, XTXinv
 
 
+def solve_leastsquare(X, XTY):
+    # compute the transpose of X for the mt and parameter axes
+    XT = np.transpose(X, axes=(*np.arange(X.ndim - 2), X.ndim - 1, X.ndim - 2))
+    XTX = XT @ X
+    return solve_normal_equations(XTX, XTY)
+
+
 def solve_nonnegative_leastsquare(X, XTY, exclude_idx=None):
     # exclude_idx to exclude the non negative constrained for one parameter by evaluating the nnls twice and flipping the sign
     XT = np.transpose(X, axes=(*np.arange(X.ndim - 2), X.ndim - 1, X.ndim - 2))
@@ -292,6 +318,11 @@ def get_solver(polynomial):
         return solve_leastsquare
 
 
+def _array_key(*arrays):
+    # hashable key from the content of (small) arrays
+    return tuple((a.shape, a.tobytes()) for a in map(np.asarray, arrays))
+
+
 def transform_bernstein(x, min_x, max_x, cap_x=False):
     # transform x to [0,1] (where bernstein polinomials are defined)
     # get x axes values for interpolation/smoothing with transformation
@@ -352,6 +383,12 @@ class Regressor(object):
         self.external_params = None
         self.external_cov = None
 
+        # the design matrices only depend on the x values and the normal equations additionally on the weights,
+        # both are the same for all systematic variations and processes and are cached
+        self._design_cache = {}
+        self._solution_cache = {}
+        self._eigen_cache = None
+
     def transform_x(self, x):
         if self.polynomial in ["bernstein", "monotonic"]:
             x = transform_bernstein(x, self.min_x, self.max_x, self.cap_x)
@@ -359,13 +396,60 @@ class Regressor(object):
             x = transform_chebyshev(x, self.min_x, self.max_x, self.cap_x)
         return x
 
+    def get_design_matrix(self, x):
+        key = _array_key(x)
+        if key not in self._design_cache:
+            self._design_cache[key] = get_design_matrix(
+                x, self.order, pol=self.polynomial
+            )
+        return self._design_cache[key]
+
+    def solve_weighted_leastsquare(self, basis, y, w):
+        # closed form linear least squares solution with the design matrix 'basis' shared by all fits
+        nx = basis.shape[0]
+        w_flat = w.reshape(-1, nx)
+        if np.all(w_flat == w_flat[0]):
+            # same weights for all fits, the solution is a single matrix multiplication with the (cached) pseudo inverse
+            key = _array_key(basis, w_flat[0])
+            if key not in self._solution_cache:
+                w2 = w_flat[0] ** 2
+                XTXinv = invert_symmetric(basis.T @ (w2[:, np.newaxis] * basis))
+                self._solution_cache[key] = (XTXinv, XTXinv @ (basis.T * w2))
+            XTXinv, pinv = self._solution_cache[key]
+            params = y @ pinv.T
+            cov = np.broadcast_to(XTXinv, (*params.shape, params.shape[-1])).copy()
+            return params, cov
+        # normal equations for all fits at once without building the full parameter matrix
+        w2 = w**2
+        XTX = np.einsum("...k,ki,kj->...ij", w2, basis, basis)
+        XTY = np.einsum("...k,kn->...n", w2 * y, basis)
+        return solve_normal_equations(XTX, XTY)
+
+    def predict(self, x, params):
+        # evaluate the polynomial at the transformed values x
+        if x.ndim == 1:
+            return params @ self.get_design_matrix(x).T
+        return self.evaluator(x, params)
+
+    def get_eigen_decomposition(self):
+        # eigen decomposition of the covariance matrix, recomputed only when the covariance matrix changes
+        if self._eigen_cache is None or self._eigen_cache[0] is not self.cov:
+            self._eigen_cache = (self.cov, np.linalg.eigh(self.cov))
+        return self._eigen_cache[1]
+
     def solve(self, x, y, w, chi2_info=True):
         x = self.transform_x(x)
-        X, XTY = get_parameter_matrices(x, y, w, self.order, pol=self.polynomial)
-        self.params, self.cov = self.solver(X, XTY)
+        basis = self.get_design_matrix(x)
+        if self.solver is solve_leastsquare and x.ndim == 1:
+            self.params, self.cov = self.solve_weighted_leastsquare(basis, y, w)
+        else:
+            X, XTY = get_parameter_matrices(
+                x, y, w, self.order, pol=self.polynomial, basis=basis
+            )
+            self.params, self.cov = self.solver(X, XTY)
 
         if chi2_info:
-            ypred = self.evaluator(x, self.params)
+            ypred = self.predict(x, self.params)
             compute_chi2(y, ypred, w, self.params.shape[-1])
 
     def evaluate(self, x):
@@ -380,21 +464,30 @@ class Regressor(object):
                 ],
                 :,
             ]
-        return self.evaluator(x, params)
+        return self.predict(x, params)
 
     def get_eigenvector_predictions(self, x1, x2=None):
         x1 = self.transform_x(x1)
         if x2 is not None:
             x2 = self.transform_x(x2)
-        cov = self.cov
         params = self.params
-        if self.external_cov:
-            cov += self.external_cov[
-                ...,
-                *[np.newaxis for n in range(self.cov.ndim - self.external_cov.ndim)],
-                :,
-                :,
-            ]
+        if self.external_cov is not None:
+            cov = (
+                self.cov
+                + self.external_cov[
+                    ...,
+                    *[
+                        np.newaxis
+                        for n in range(self.cov.ndim - self.external_cov.ndim)
+                    ],
+                    :,
+                    :,
+                ]
+            )
+            eig = None
+        else:
+            cov = self.cov
+            eig = self.get_eigen_decomposition()
         if self.external_params is not None:
             params += self.external_params[
                 ...,
@@ -405,7 +498,13 @@ class Regressor(object):
                 :,
             ]
         return make_eigenvector_predictons(
-            params, cov, func=self.evaluator, x1=x1, x2=x2, force_positive=False
+            params,
+            cov,
+            func=self.predict if x2 is None else self.evaluator,
+            x1=x1,
+            x2=x2,
+            force_positive=False,
+            eig=eig,
         )
 
     def reduce_parameters(self, weight_vector=None, axis=-2):
@@ -486,9 +585,24 @@ class Regressor2D(Regressor):
             x2 = transform_chebyshev(x2, self.min_x[1], self.max_x[1], self.cap_x[1])
         return x1, x2
 
+    def get_design_matrix(self, x1, x2):
+        key = _array_key(x1, x2)
+        if key not in self._design_cache:
+            self._design_cache[key] = get_design_matrix_from2D(
+                x1, x2, *self.order, pol=self.polynomial
+            )
+        return self._design_cache[key]
+
     def solve(self, x1, x2, y, w, flatten=False):
         x1, x2 = self.transform_x(x1, x2)
-        X, XTY = get_parameter_matrices_from2D(
-            x1, x2, y, w, *self.order, pol=self.polynomial, flatten=flatten
+        X, y, XTY = get_parameter_matrices_from2D(
+            x1,
+            x2,
+            y,
+            w,
+            *self.order,
+            pol=self.polynomial,
+            flatten=flatten,
+            basis=self.get_design_matrix(x1, x2),
         )
         self.params, self.cov = self.solver(X, XTY)
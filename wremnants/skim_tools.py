@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import ROOT
+
+from wums import logging
+
+logger = logging.child_logger(__name__)
+
+# Skims of the NanoAOD files with the events passing the preselection of a histmaker,
+# keyed by the input file and the options of the preselection, such that later runs with the same preselection
+# read the (much smaller) skims instead of the full files.
+# Increase the version if the format of the skims changes
+skim_version = 3
+skim_dir = os.environ.get(
+    "WREMNANTS_SKIM_DIR", os.path.expanduser("~/.cache/wremnants/skims")
+)
+
+# branches read by the histmakers after the preselection, any other branch is dropped from the skims
+# unless its name appears in the sources of the histmakers (see referenced_names)
+default_branches = [
+    "run",
+    "luminosityBlock",
+    "event",
+    "genWeight",
+    "n?Generator_.*",
+    "n?LHE.*",
+    "n?MEParamWeight.*",
+    "n?PSWeight",
+    "n?GenPart_.*",
+    "n?GenDressedLepton_.*",
+    "GenMET_.*",
+    "GenVtx_.*",
+    "Pileup_.*",
+    "PV_.*",
+    "n?Muon_.*",
+    "n?Electron_.*",
+    "n?Jet_.*",
+    "n?SV_.*",
+    "n?TrigObj_.*",
+    "HLT_.*",
+    "Flag_.*",
+    "L1PreFiringWeight_.*",
+    ".*MET_.*",
+    "DeepMET.*",
+]
+
+# sources searched for the names of branches read by the histmakers
+default_sources = [
+    os.path.dirname(os.path.abspath(__file__)),
+    os.path.normpath(
+        os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "../scripts/histmakers"
+        )
+    ),
+]
+
+
+def _file_key(filepath):
+    # remote files are identified by their path only
+    if os.path.isfile(filepath):
+        stat = os.stat(filepath)
+        return (os.path.realpath(filepath), stat.st_mtime_ns, stat.st_size)
+    return (filepath,)
+
+
+def input_files(*paths):
+    """
+    Files in the given files or directories (recursively), e.g. the calibration files read by the preselection
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names)
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def referenced_names(paths):
+    """
+    All identifiers appearing in the python and C++ files in the given files or directories,
+    an upper bound of the branch names the histmakers can read
+    """
+    names = set()
+    for path in input_files(*paths):
+        if not os.path.isfile(path) or os.path.splitext(path)[1] not in [
+            ".py",
+            ".h",
+            ".hpp",
+            ".cpp",
+            ".cc",
+        ]:
+            continue
+        with open(path, errors="ignore") as f:
+            names.update(re.findall(r"[A-Za-z_]\w*", f.read()))
+    return names
+
+
+class SkimCache(object):
+    """
+    Skims of the input files of datasets, with the events passing 'preselection(df, dataset)' and the branches
+    matching the regular expressions in 'branches', written to compressed ROOT files in 'directory'.
+    Branches whose name appears in the files in 'sources' are kept as well, such that branches read by the histmakers
+    (also those only checked for with df.GetColumnNames()) are never dropped.
+    Missing skims are made in one event loop, the datasets are then pointed to the skims.
+    Skims that dropped a branch which is kept now (e.g. after new code reads it) are made again.
+    The skims are keyed by the input file, the 'options' and the files in 'input_files' (e.g. the calibration
+    files read by the preselection), such that changing any of them makes the skims again.
+    The sum of weights and number of events of the original files are stored with each skim and restored
+    in the results after the event loop with 'restore_weight_sums'.
+    The preselection has to be deterministic (e.g. random numbers keyed by the event) and is applied again
+    on the skims, so the results are identical with and without skims.
+    """
+
+    def __init__(
+        self,
+        options,
+        branches=default_branches,
+        input_files=[],
+        sources=default_sources,
+        directory=None,
+        compression_algorithm="kZSTD",
+        compression_level=5,
+    ):
+        self.options = options
+        self.input_keys = [_file_key(f) for f in input_files]
+        self.branches = re.compile("|".join(f"(?:{b})" for b in branches))
+        self.referenced = referenced_names(sources)
+        self.directory = directory or skim_dir
+        self.compression_algorithm = compression_algorithm
+        self.compression_level = compression_level
+        # original sum of weights and number of events of the skimmed datasets
+        self.weight_sums = {}
+
+    def path(self, filepath):
+        key = repr(
+            (
+                skim_version,
+                _file_key(filepath),
+                sorted(self.options.items()),
+                self.input_keys,
+            )
+        )
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        return os.path.join(
+            self.directory, f"{name}_{hashlib.sha1(key.encode()).hexdigest()}.root"
+        )
+
+    def keep(self, column):
+        return self.branches.fullmatch(column) is not None or column in self.referenced
+
+    def read_info(self, path):
+        # the info file is written last, skims without it are incomplete
+        try:
+            with open(f"{path}.json") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        dropped = [c for c in info["dropped"] if self.keep(c)]
+        if len(dropped) > 0:
+            logger.warning(
+                f"Skim {path} misses the branches {dropped} which are read now, it is made again"
+            )
+            return None
+        return info
+
+    def snapshot_options(self):
+        opts = ROOT.RDF.RSnapshotOptions()
+        opts.fLazy = True
+        opts.fCompressionAlgorithm = getattr(
+            ROOT.ROOT.RCompressionSetting.EAlgorithm, self.compression_algorithm
+        )
+        opts.fCompressionLevel = self.compression_level
+        return opts
+
+    def book_skim(self, dataset, filepath, preselection):
+        df = ROOT.RDataFrame("Events", filepath)
+        columns = [str(c) for c in df.GetColumnNames() if not str(c).startswith("#")]
+        dropped = [c for c in columns if not self.keep(c)]
+        columns = [c for c in columns if self.keep(c)]
+        if dataset.is_data:
+            sumw = df.Count()
+        else:
+            sumw = df.Define("skim_weight", "std::copysign(1.0, genWeight)").Sum(
+                "skim_weight"
+            )
+        count = df.Count()
+
+        path = self.path(filepath)
+        fd, tmppath = tempfile.mkstemp(
+            dir=self.directory, prefix=".tmp_", suffix=".root"
+        )
+        os.close(fd)
+        dfsel = preselection(df, dataset)
+        selected = dfsel.Count()
+        snapshot = dfsel.Snapshot("Events", tmppath, columns, self.snapshot_options())
+        return dict(
+            path=path,
+            tmppath=tmppath,
+            input=filepath,
+            dropped=dropped,
+            sumw=sumw,
+            count=count,
+            selected=selected,
+            snapshot=snapshot,
+        )
+
+    def make_skims(self, datasets, preselection):
+        os.makedirs(self.directory, exist_ok=True)
+        booked = []
+        for dataset in datasets:
+            for filepath in dataset.filepaths:
+                if self.read_info(self.path(filepath)) is None:
+                    booked.append(self.book_skim(dataset, filepath, preselection))
+        if len(booked) == 0:
+            return
+
+        logger.info(f"Making {len(booked)} skims in {self.directory}")
+        ROOT.RDF.RunGraphs([b["snapshot"] for b in booked])
+
+        for b in booked:
+            info = {
+                "input": b["input"],
+                "options": self.options,
+                "dropped": b["dropped"],
+                "weight_sum": float(b["sumw"].GetValue()),
+                "event_count": float(b["count"].GetValue()),
+                "selected": int(b["selected"].GetValue()),
+            }
+            # rename, such that concurrent jobs never read partial skims
+            os.replace(b["tmppath"], b["path"])
+            fd, tmpinfo = tempfile.mkstemp(dir=self.directory, prefix=".tmp_")
+            with os.fdopen(fd, "w") as f:
+                json.dump(info, f)
+            os.replace(tmpinfo, f"{b['path']}.json")
+
+    def use_skims(self, datasets, preselection):
+        """
+        Make the missing skims of the datasets and replace their input files by the skims
+        """
+        self.make_skims(datasets, preselection)
+        for dataset in datasets:
+            paths = [self.path(p) for p in dataset.filepaths]
+            infos = [self.read_info(p) for p in paths]
+            if any(info is None for info in infos):
+                logger.warning(f"Skims of {dataset.name} are incomplete, not used")
+                continue
+            self.weight_sums[id(dataset)] = (
+                dataset,
+                sum(info["weight_sum"] for info in infos),
+                sum(info["event_count"] for info in infos),
+            )
+            # skims without any selected events are not read
+            paths = [p for p, info in zip(paths, infos) if info["selected"] > 0]
+            if len(paths) == 0:
+                # keep one input file, to still run the graph of the dataset
+                logger.warning(f"No events of {dataset.name} pass the preselection")
+                dataset.filepaths = dataset.filepaths[:1]
+            else:
+                logger.info(f"Reading {dataset.name} from {len(paths)} skims")
+                dataset.filepaths = paths
+
+    def restore_weight_sums(self, result_dict):
+        # the weight sums computed in the event loop are those of the skims
+        for dataset, weight_sum, event_count in self.weight_sums.values():
+            # the dataset name is resolved here since histmakers may rename datasets in build_graph
+            if dataset.name not in result_dict:
+                continue
+            result_dict[dataset.name]["weight_sum"] = weight_sum
+            result_dict[dataset.name]["event_count"] = event_count
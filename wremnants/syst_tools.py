@@ -9,7 +9,7 @@ import ROOT
 
 import narf
 from utilities import common, differential
-from wremnants import helicity_utils
+from wremnants import helicity_utils, histmaker_tools
 from wremnants import histselections as sel
 from wremnants import theory_tools
 from wremnants.datasets.datagroups import Datagroups
@@ -27,12 +27,36 @@ def syst_transform_map(base_hist, hist_name):
     pdfInfo = theory_tools.pdfMap
     pdfNames = [pdfInfo[k]["name"] for k in pdfInfo.keys()]
 
+    # the up and down shifts are computed together, the result for the last histogram is kept
+    #   such that the Up and Down actions on the same histogram only compute it once
+    shifts = {}
+
+    def cachedShifts(h, key, func):
+        if key not in shifts or shifts[key][0] is not h:
+            shifts[key] = (h, func(h))
+        # copy, callers are allowed to modify the returned hists in place
+        return tuple(x.copy() for x in shifts[key][1])
+
     def pdfUnc(h, pdfName, axis_name="pdfVar"):
         key = list(pdfInfo.keys())[list(pdfNames).index(pdfName)]
         unc = pdfInfo[key]["combine"]
         scale = pdfInfo[key]["scale"] if "scale" in pdfInfo[key] else 1.0
-        return theory_tools.hessianPdfUnc(
-            h, uncType=unc, scale=scale, axis_name=axis_name
+        return cachedShifts(
+            h,
+            (pdfName, axis_name),
+            lambda x: theory_tools.hessianPdfUnc(
+                x, uncType=unc, scale=scale, axis_name=axis_name
+            ),
+        )
+
+    def alphasUnc(h, pdfName):
+        key = list(pdfInfo.keys())[list(pdfNames).index(pdfName)]
+        # same scaling as in TheoryHelper.add_pdf_alphas_variation
+        scale = 0.75 if pdfInfo[key]["alphasRange"] == "002" else 1.5
+        return cachedShifts(
+            h,
+            (pdfName, "alphasVar"),
+            lambda x: theory_tools.alphasUnc(x, scale=scale),
         )
 
     def uncHist(unc):
@@ -61,6 +85,20 @@ def syst_transform_map(base_hist, hist_name):
             for pdf in pdfNames
         }
     )
+    for info in pdfInfo.values():
+        if "alphasRange" not in info:
+            continue
+        pdf = info["name"]
+        transforms[f"{pdf}AlphaSUp"] = {
+            "action": lambda h, p=pdf: (
+                alphasUnc(h, p)[0] if "alphasVar" in h.axes.name else h
+            )
+        }
+        transforms[f"{pdf}AlphaSDown"] = {
+            "action": lambda h, p=pdf: (
+                alphasUnc(h, p)[1] if "alphasVar" in h.axes.name else h
+            )
+        }
     transforms["scetlib_dyturboMSHT20Up"] = {
         "action": lambda h: pdfUnc(h, "pdfMSHT20", "vars")[0],
         "procs": common.vprocs_all,
@@ -1127,10 +1165,12 @@ def add_syst_hist(
             if tensor_name is None:
                 # unity
                 results.append(
-                    df.HistoBoost(
+                    histmaker_tools.histo_boost(
+                        df,
                         name,
                         axes,
-                        [*cols, helicity_tensor_name],
+                        cols,
+                        [helicity_tensor_name],
                         tensor_axes=[helicity_utils.axis_helicity_multidim],
                         storage=storage_type,
                     )
@@ -1142,10 +1182,12 @@ def add_syst_hist(
                     f"auto res = {helicity_tensor_name}; res = {tensor_name}*res; return res;",
                 )
                 results.append(
-                    df.HistoBoost(
+                    histmaker_tools.histo_boost(
+                        df,
                         name,
                         axes,
-                        [*cols, f"{tensor_name}_helicity"],
+                        cols,
+                        [f"{tensor_name}_helicity"],
                         tensor_axes=[helicity_utils.axis_helicity_multidim],
                         storage=storage_type,
                     )
@@ -1160,10 +1202,12 @@ def add_syst_hist(
                 [tensor_name, helicity_tensor_name],
             )
             results.append(
-                df.HistoBoost(
+                histmaker_tools.histo_boost(
+                    df,
                     name,
                     axes,
-                    [*cols, f"{tensor_name}_helicity"],
+                    cols,
+                    [f"{tensor_name}_helicity"],
                     tensor_axes=tensor_axes_helicity,
                     storage=storage_type,
                 )
@@ -1171,26 +1215,33 @@ def add_syst_hist(
     else:
         if len(tensor_axes) == 0:
             if tensor_name is None:
-                results.append(df.HistoBoost(name, axes, cols, storage=storage_type))
+                results.append(
+                    histmaker_tools.histo_boost(
+                        df, name, axes, cols, storage=storage_type
+                    )
+                )
             else:
                 results.append(
-                    df.HistoBoost(
-                        name, axes, [*cols, tensor_name], storage=storage_type
+                    histmaker_tools.histo_boost(
+                        df, name, axes, cols, [tensor_name], storage=storage_type
                     )
                 )
         else:
             results.append(
-                df.HistoBoost(
+                histmaker_tools.histo_boost(
+                    df,
                     name,
                     axes,
-                    [*cols, tensor_name],
+                    cols,
+                    [tensor_name],
                     tensor_axes=tensor_axes,
                     storage=storage_type,
                 )
             )
 
 
-def define_mass_width_sin2theta_weights(df, proc):
+def mass_width_sin2theta_values(proc):
+    # reference mass and width and the values of the mass, width and sin2theta weights
 
     # TODO can these be parsed more automatically?
     if proc in common.zprocs_all:
@@ -1264,6 +1315,12 @@ def define_mass_width_sin2theta_weights(df, proc):
         widthvals = [2.09053, 2.09173, 2.043, 2.085, 2.127]
         sin2thetavals = []
 
+    return m0, gamma0, massvals, widthvals, sin2thetavals
+
+
+def define_mass_width_sin2theta_weights(df, proc):
+    m0, gamma0, massvals, widthvals, sin2thetavals = mass_width_sin2theta_values(proc)
+
     nweights_mass = len(massvals)
     nweights_width = len(widthvals)
     nweights_sin2theta = len(sin2thetavals)
@@ -84,6 +84,73 @@ def load_corr_helpers(
     return corr_helpers
 
 
+class CorrectionsTensorEvaluator:
+    """
+    Vectorised python-side equivalent of the TensorCorrectionsHelper classes,
+    evaluating the correction tensor for arrays of points at once, e.g.
+    (massVgen, absYVgen, ptVgen, chargeVgen) for the standard 4D corrections.
+    Values outside the axis range are assigned to the flow bins if the axis has them
+    and to the first/last bin otherwise.
+    """
+
+    def __init__(self, corrh, tensor_rank=1):
+        self.hist = corrh
+        self.tensor_rank = tensor_rank
+        self.hist_axes = corrh.axes[: len(corrh.axes) - tensor_rank]
+        self.tensor_axes = corrh.axes[len(corrh.axes) - tensor_rank :]
+
+        view = corrh.view(flow=True)
+        values = view.value if hasattr(view, "value") else view
+        # drop the flow bins of the tensor axes, these are never accessed
+        tensor_slices = tuple(
+            slice(int(ax.traits.underflow), int(ax.traits.underflow) + ax.size)
+            for ax in self.tensor_axes
+        )
+        values = values[(Ellipsis, *tensor_slices)]
+        self.tensor_shape = values.shape[len(self.hist_axes) :]
+        self.hist_shape = values.shape[: len(self.hist_axes)]
+        # contiguous (bins, tensor) layout for a single gather per call
+        self.values = np.ascontiguousarray(values).reshape(-1, *self.tensor_shape)
+
+    def bin_indices(self, *xs):
+        if len(xs) != len(self.hist_axes):
+            raise ValueError(
+                f"Expected {len(self.hist_axes)} input arrays ({self.hist_axes.name}), got {len(xs)}"
+            )
+        indices = []
+        for ax, x, nbins in zip(self.hist_axes, xs, self.hist_shape):
+            idx = np.asarray(ax.index(np.asarray(x)), dtype=np.int64)
+            idx += int(ax.traits.underflow)
+            indices.append(np.clip(idx, 0, nbins - 1))
+        return np.ravel_multi_index(indices, self.hist_shape)
+
+    def __call__(self, *xs, nominal_weight=None):
+        res = self.values[self.bin_indices(*xs)]
+        if nominal_weight is not None:
+            weight = np.asarray(nominal_weight)
+            res = res * weight.reshape(weight.shape + (1,) * len(self.tensor_shape))
+        return res
+
+
+def load_corr_evaluators(
+    procs,
+    generators,
+    base_dir=f"{common.data_dir}/TheoryCorrections/",
+):
+    corr_hists = load_corr_helpers(
+        procs, generators, make_tensor=False, base_dir=base_dir
+    )
+    return {
+        proc: {
+            generator: CorrectionsTensorEvaluator(
+                corrh, tensor_rank=3 if "Helicity" in generator else 1
+            )
+            for generator, corrh in corrs.items()
+        }
+        for proc, corrs in corr_hists.items()
+    }
+
+
 def make_corr_helper_fromnp(
     filename=f"{common.data_dir}/N3LLCorrections/inclusive_{{process}}_pT.npz", isW=True
 ):
@@ -5,7 +5,6 @@ from scipy import ndimage
 
 import narf.clingutils
 from utilities import common
-from wums import boostHistHelpers as hh
 from wums import logging
 
 logger = logging.child_logger(__name__)
@@ -1181,60 +1180,99 @@ def pdfNamesSymHessian(entries, pdfset=""):
     return [f"pdf{i+1}{pdfset.replace('pdf', '')}" for i in range(entries)]
 
 
-def pdfSymmetricShifts(hdiff, axis_name):
-    sq = hh.multiplyHists(hdiff, hdiff)
-    ss = sq[{axis_name: hist.sum}]
-    rss = hh.sqrtHist(ss)
-    return rss, rss
+def _pdf_member_values(h, axis_name):
+    # values with flow, with the PDF axis moved last and its flow bins dropped
+    ax = h.axes[axis_name]
+    idx = h.axes.name.index(axis_name)
+    view = h.view(flow=True)
+    vals = view.value if hasattr(view, "value") else view
+    underflow = int(ax.traits.underflow)
+    return np.moveaxis(vals, idx, -1)[..., underflow : underflow + ax.size]
 
 
-def pdfAsymmetricShifts(hdiff, axis_name):
-    # Assuming that the last axis is the syst axis
-    # TODO: add some check to verify this
-    def shiftHist(vals, hdiff, axis_name):
-        hnew = hdiff[{axis_name: 0}]
-        vals = vals * vals
-        hnew[...] = np.sum(vals, axis=-1)
-        return hh.sqrtHist(hnew)
-
-    ax = hdiff.axes[axis_name]
-    underflow = hdiff.axes[axis_name].traits.underflow
+def _asym_member_indices(ax):
+    # The error sets are ordered up,down,up,down... unless labeled explicitly
     if type(ax) == hist.axis.StrCategory and all(
         ["Up" in x or "Down" in x for x in ax][1:]
     ):
-        # Remove the overflow from the categorical axis
-        end = int((ax.size - 1) / 2)
-        upvals = hdiff[{axis_name: [x for x in ax if "Up" in x]}].values(flow=True)[
-            ..., :end
-        ]
-        downvals = hdiff[{axis_name: [x for x in ax if "Down" in x]}].values(flow=True)[
-            ..., :end
-        ]
-        if upvals.shape != downvals.shape:
+        up = np.array([i for i, x in enumerate(ax) if "Up" in x])
+        down = np.array([i for i, x in enumerate(ax) if "Down" in x])
+        if up.size != down.size:
             raise ValueError(
                 "Malformed PDF uncertainty hist! Expect equal number of up and down vars"
             )
-    else:
-        end = ax.size + underflow
-        upvals = hdiff.values(flow=True)[..., 1 + underflow : end : 2]
-        downvals = hdiff.values(flow=True)[..., 2 + underflow : end : 2]
+        return up, down
+    return np.arange(1, ax.size, 2), np.arange(2, ax.size, 2)
+
+
+def pdfShiftArrays(vals, uncType="symHessian", up_idx=None, down_idx=None):
+    """
+    Compute the Hessian PDF shifts for all members at once.
+    vals: array with the PDF members on the last axis, member 0 being the central value
+    Returns the central values and the (positive) up and down shifts as arrays
+    """
+    vals = np.asarray(vals)
+    nominal = vals[..., 0]
+    diff = vals - nominal[..., np.newaxis]
+    if uncType == "symHessian":
+        rss = np.sqrt(np.einsum("...i,...i->...", diff[..., 1:], diff[..., 1:]))
+        return nominal, rss, rss
+    if up_idx is None:
+        up_idx = np.arange(1, vals.shape[-1], 2)
+    if down_idx is None:
+        down_idx = np.arange(2, vals.shape[-1], 2)
+    dup = np.take(diff, up_idx, axis=-1)
+    ddown = np.take(diff, down_idx, axis=-1)
+    return (
+        nominal,
+        np.sqrt(np.einsum("...i,...i->...", dup, dup)),
+        np.sqrt(np.einsum("...i,...i->...", ddown, ddown)),
+    )
+
 
-    # The error sets are ordered up,down,up,down...
-    upshift = shiftHist(upvals, hdiff, axis_name)
-    downshift = shiftHist(downvals, hdiff, axis_name)
-    return upshift, downshift
+def _fill_like(hnom, vals):
+    hnew = hnom.copy()
+    view = hnew.view(flow=True)
+    if hasattr(view, "value"):
+        view.value[...] = vals
+    else:
+        view[...] = vals
+    return hnew
 
 
 def hessianPdfUnc(h, axis_name="pdfVar", uncType="symHessian", scale=1.0):
-    symmetric = uncType == "symHessian"
-    diff = hh.addHists(h, -1 * h[{axis_name: 0}]) * scale
-    if diff.axes[axis_name].traits.overflow:
-        diff[..., hist.overflow] = np.zeros_like(diff[{axis_name: 0}].view(flow=True))
-    shiftFunc = pdfSymmetricShifts if symmetric else pdfAsymmetricShifts
-    rssUp, rssDown = shiftFunc(diff, axis_name)
-    hUp = hh.addHists(h[{axis_name: 0}], 1 * rssUp)
-    hDown = hh.addHists(h[{axis_name: 0}], -1 * rssDown)
-    return hUp, hDown
+    """
+    Up and down PDF uncertainty histograms, both computed in a single pass over the members.
+    The variances of the shifted histograms are the ones of the central member.
+    """
+    ax = h.axes[axis_name]
+    if uncType == "symHessian":
+        up_idx, down_idx = None, None
+    else:
+        up_idx, down_idx = _asym_member_indices(ax)
+
+    nominal, up, down = pdfShiftArrays(
+        _pdf_member_values(h, axis_name), uncType, up_idx, down_idx
+    )
+    hnom = h[{axis_name: 0}]
+    return (
+        _fill_like(hnom, nominal + scale * up),
+        _fill_like(hnom, nominal - scale * down),
+    )
+
+
+def alphasUnc(h, axis_name="alphasVar", scale=1.0):
+    """
+    Up and down alphaS variation histograms, both computed in a single pass.
+    The alphaS axis is ordered as (central, down, up), the shifts are scaled by 'scale'
+    """
+    vals = _pdf_member_values(h, axis_name)
+    nominal = vals[..., 0]
+    shifts = scale * (vals[..., 1:3] - nominal[..., np.newaxis])
+    hnom = h[{axis_name: 0}]
+    return _fill_like(hnom, nominal + shifts[..., 1]), _fill_like(
+        hnom, nominal + shifts[..., 0]
+    )
 
 
 def pdfBugfixMSHT20(df, tensorPDFName):